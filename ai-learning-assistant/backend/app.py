@@ -3,6 +3,10 @@ from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
+
+# Load environment variables before the routes and services read them at import time
+load_dotenv()
+
 import google.generativeai as genai
 import os
 import json
@@ -12,14 +16,17 @@ from bson import ObjectId
 from flask_mail import Mail, Message
 import secrets
 
+from services.llm_provider import get_provider
+
 # Import routes
 from routes.quiz import quiz_bp
+from routes.adaptive import adaptive_bp
+from routes.reviews import reviews_bp
 from routes.study_groups import study_groups_bp
+from routes.exam_sessions import exam_sessions_bp
 from routes.dashboard import dashboard_bp
 from routes.ai_tutor import ai_tutor_bp
-
-# Load environment variables
-load_dotenv()
+from routes.jobs import jobs_bp
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -56,15 +63,51 @@ app.register_blueprint(quiz_bp)
 app.register_blueprint(study_groups_bp)
 app.register_blueprint(dashboard_bp)
 app.register_blueprint(ai_tutor_bp, url_prefix='/api/ai')
+app.register_blueprint(jobs_bp)
+app.register_blueprint(exam_sessions_bp)
+app.register_blueprint(adaptive_bp)
+app.register_blueprint(reviews_bp)
 
 # Initialize collections
 from routes.quiz import init_collections as init_quiz_collections
 from routes.study_groups import init_collections as init_study_groups_collections
 from routes.dashboard import init_collections as init_dashboard_collections
+from routes.exam_sessions import init_collections as init_exam_sessions_collections
+from services.response_cache import init_collections as init_response_cache_collections
+from services.question_bank import init_collections as init_question_bank_collections
+from services.jobs import init_collections as init_jobs_collections
+from services.context_store import init_collections as init_context_store_collections
+from services.user_stats import init_collections as init_user_stats_collections, user_stats
+from services.achievements import init_collections as init_achievements_collections, achievement_engine
+from services.profile_cache import init_collections as init_profile_cache_collections
+from services.message_store import init_collections as init_message_store_collections
+from services.chat_relay import init_collections as init_chat_relay_collections
+from services.group_discovery import init_collections as init_group_discovery_collections
+from services.group_membership import init_collections as init_group_membership_collections
+from services.item_analytics import init_collections as init_item_analytics_collections
+from services.adaptive_testing import init_collections as init_adaptive_testing_collections
+from services.review_scheduler import init_collections as init_review_scheduler_collections
+from services.index_manager import init_indexes
 
 init_quiz_collections(db)
 init_study_groups_collections(db)
 init_dashboard_collections(db)
+init_exam_sessions_collections(db)
+init_response_cache_collections(db)
+init_question_bank_collections(db)
+init_jobs_collections(db)
+init_context_store_collections(db)
+init_user_stats_collections(db)
+init_achievements_collections(db)
+init_profile_cache_collections(db)
+init_message_store_collections(db)
+init_chat_relay_collections(db)
+init_group_discovery_collections(db)
+init_group_membership_collections(db)
+init_item_analytics_collections(db)
+init_adaptive_testing_collections(db)
+init_review_scheduler_collections(db)
+init_indexes(db)
 
 # Email Configuration
 app.config['MAIL_SERVER'] = 'smtp.gmail.com'
@@ -191,15 +234,15 @@ class StudySession:
 class AITutorService:
     def __init__(self):
         try:
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
+            self.provider = get_provider()
         except Exception as e:
             print(f"Warning: Could not initialize Gemini model: {e}")
-            self.model = None
+            self.provider = None
     
     def generate_explanation(self, subject, topic, question, grade_level=None, user_context=None, conversation_history=None):
         """Generate AI-powered explanation for student questions with user context"""
         
-        if not self.model:
+        if not self.provider:
             return "I apologize, but the AI service is currently unavailable. Please try again later."
         
         grade_context = f"for a {grade_level} student" if grade_level else "for a secondary school student"
@@ -244,8 +287,7 @@ class AITutorService:
         """
         
         try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            return self.provider.generate(prompt).strip()
         
         except Exception as e:
             return f"I apologize, but I'm having trouble generating an explanation right now. Please try again later. Error: {str(e)}"
@@ -253,7 +295,7 @@ class AITutorService:
     def generate_practice_questions(self, subject, topic, difficulty="medium", user_context=None):
         """Generate practice questions for a given topic with user context"""
         
-        if not self.model:
+        if not self.provider:
             return [{"error": "AI service is currently unavailable"}]
         
         user_info = ""
@@ -296,10 +338,10 @@ class AITutorService:
         """
         
         try:
-            response = self.model.generate_content(prompt)
+            response_text = self.provider.generate(prompt)
             
             # Parse response into structured format
-            questions = self._parse_questions_response(response.text)
+            questions = self._parse_questions_response(response_text)
             return questions
         
         except Exception as e:
@@ -495,84 +537,7 @@ def login():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-# AI Tutor Routes
-@app.route('/api/ai/ask', methods=['POST'])
-def ask_question():
-    """Handle student questions and provide AI-powered explanations"""
-    try:
-        data = request.get_json()
-        
-        # Validate input
-        required_fields = ['subject', 'topic', 'question']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        
-        # Get user info if authenticated
-        user_id = None
-        grade_level = None
-        user_context = None
-        conversation_history = []
-        
-        # Check if user is authenticated (optional for demo)
-        auth_header = request.headers.get('Authorization')
-        if auth_header and auth_header.startswith('Bearer '):
-            try:
-                from flask_jwt_extended import decode_token
-                token = auth_header.split(' ')[1]
-                decoded_token = decode_token(token)
-                user_id = decoded_token['sub']
-                user_data = users_collection.find_one({'_id': ObjectId(user_id)})
-                if user_data:
-                    grade_level = user_data['grade_level']
-                    user_context = {
-                        'grade_level': user_data['grade_level'],
-                        'subjects': user_data['subjects'],
-                        'recent_topics': [] # Placeholder for recent topics
-                    }
-                    # Fetch recent sessions for context
-                    recent_sessions = list(sessions_collection.find({'user_id': user_id}).sort('created_at', -1).limit(5))
-                    for session in recent_sessions:
-                        conversation_history.append({
-                            'question': session['question'],
-                            'ai_response': session['ai_response']
-                        })
-            except:
-                pass  # Continue without authentication
-        
-        # Generate AI explanation
-        explanation = ai_service.generate_explanation(
-            subject=data['subject'],
-            topic=data['topic'],
-            question=data['question'],
-            grade_level=grade_level,
-            user_context=user_context,
-            conversation_history=conversation_history
-        )
-        
-        # Save study session
-        session_data = {
-            'user_id': user_id,
-            'subject': data['subject'],
-            'topic': data['topic'],
-            'question': data['question'],
-            'ai_response': explanation,
-            'created_at': datetime.utcnow()
-        }
-        result = sessions_collection.insert_one(session_data)
-        
-        return jsonify({
-            'success': True,
-            'session_id': str(result.inserted_id),
-            'response': explanation,
-            'subject': data['subject'],
-            'topic': data['topic'],
-            'question': data['question']
-        })
-    
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
+# AI Tutor Routes (/api/ai/ask is served by the ai_tutor blueprint)
 @app.route('/api/ai/practice', methods=['POST'])
 def generate_practice():
     """Generate practice questions for a topic"""
@@ -660,7 +625,10 @@ def rate_session(session_id):
         if not session:
             return jsonify({'error': 'Session not found'}), 404
         
-        sessions_collection.update_one({'_id': ObjectId(session_id)}, {'$set': {'satisfaction_rating': rating}})
+        previous = sessions_collection.find_one_and_update({'_id': ObjectId(session_id)}, {'$set': {'satisfaction_rating': rating}})
+        if previous:
+            user_stats.record_rating(previous.get('user_id'), previous.get('satisfaction_rating'), rating)
+            achievement_engine.record(previous.get('user_id'), 'session_rated', old_rating=previous.get('satisfaction_rating'), new_rating=rating)
         
         return jsonify({
             'success': True,
@@ -670,47 +638,6 @@ def rate_session(session_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-# Study Groups Routes
-@app.route('/api/groups', methods=['GET'])
-def get_study_groups():
-    """Get available study groups"""
-    try:
-        # Sample data for demo
-        groups = [
-            {
-                "id": 1,
-                "name": "Mathematics SS2",
-                "subject": "Mathematics",
-                "grade_level": "SS2",
-                "members": 15,
-                "description": "Advanced algebra and geometry practice"
-            },
-            {
-                "id": 2,
-                "name": "Physics Champions",
-                "subject": "Physics",
-                "grade_level": "SS3",
-                "members": 8,
-                "description": "JAMB physics preparation group"
-            },
-            {
-                "id": 3,
-                "name": "Chemistry Lab",
-                "subject": "Chemistry",
-                "grade_level": "SS1",
-                "members": 12,
-                "description": "Organic chemistry study group"
-            }
-        ]
-        
-        return jsonify({
-            'success': True,
-            'groups': groups
-        })
-    
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the AI endpoints.
+
+Start the backend with the offline model stand-in so results measure our
+own overhead rather than Gemini's:
+
+    LLM_PROVIDER=fake FAKE_LLM_LATENCY_MS=500 gunicorn -w 4 app:app
+    python benchmark_api.py --requests 200 --concurrency 20
+"""
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BASE_URL = "http://127.0.0.1:5000"
+
+SCENARIOS = {
+    'ask': ('/api/ai/demo/ask', lambda i: {
+        'subject': 'Mathematics',
+        'topic': 'Algebra',
+        'question': f'How do I solve {i % 50}x + 5 = 13?'
+    }),
+    'practice': ('/api/ai/demo/practice', lambda i: {
+        'subject': 'Physics',
+        'topic': 'Motion',
+        'num_questions': 3
+    }),
+    'quiz': ('/api/quiz/test_gemini', lambda i: {
+        'subject': 'Chemistry',
+        'topic': 'Acids and Bases',
+        'num_questions': 10,
+        'exam_type': 'WAEC'
+    })
+}
+
+def run_scenario(name, total, concurrency, base_url):
+    path, payload = SCENARIOS[name]
+
+    def call(i):
+        start = time.perf_counter()
+        response = requests.post(f"{base_url}{path}", json=payload(i), timeout=120)
+        return time.perf_counter() - start, response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(r[0] for r in results)
+    errors = len([r for r in results if r[1] >= 400])
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{name:10s} {total / elapsed:8.1f} req/s  "
+          f"p50 {statistics.median(latencies) * 1000:7.1f} ms  "
+          f"p95 {p95 * 1000:7.1f} ms  errors {errors}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--base-url', default=BASE_URL)
+    parser.add_argument('--scenario', choices=list(SCENARIOS), action='append')
+    args = parser.parse_args()
+    for scenario in args.scenario or list(SCENARIOS):
+        run_scenario(scenario, args.requests, args.concurrency, args.base_url)
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Refit the IRT parameters (irt_a, irt_b) of question bank questions from the
+item analytics of completed quiz attempts. Run it after update_item_analytics.py,
+e.g. nightly from cron:
+
+    python update_item_analytics.py && python calibrate_irt.py
+"""
+
+import os
+import sys
+
+os.environ.setdefault('JOB_WORKERS', '0')
+os.environ.setdefault('QUESTION_BANK_REFILL_ENABLED', 'false')
+os.environ.setdefault('INDEX_BOOTSTRAP_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: F401
+from services.adaptive_testing import adaptive_testing
+
+if __name__ == '__main__':
+    print(f"Calibrated {adaptive_testing.calibrate()} question bank questions")
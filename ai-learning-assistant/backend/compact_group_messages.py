@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+Maintain the bucketed group chat storage (group_message_buckets collection).
+
+    python compact_group_messages.py            # archive buckets older than CHAT_ARCHIVE_DAYS
+    python compact_group_messages.py <days>     # archive buckets older than <days>
+    python compact_group_messages.py --migrate  # move legacy group_messages into buckets
+"""
+
+import os
+import sys
+
+os.environ.setdefault('JOB_WORKERS', '0')
+os.environ.setdefault('QUESTION_BANK_REFILL_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: F401
+from services.message_store import message_store, CHAT_ARCHIVE_DAYS
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--migrate']:
+        print(f"Migrated {message_store.migrate_legacy()} messages")
+    else:
+        days = int(sys.argv[1]) if len(sys.argv) > 1 else CHAT_ARCHIVE_DAYS
+        result = message_store.compact(days)
+        print(f"Archived {result['buckets_archived']} buckets into {result['archive_documents']} documents")
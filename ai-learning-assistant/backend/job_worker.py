@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Standalone worker for queued AI generation jobs.
+
+Run alongside the API (with JOB_WORKERS=0 on the web workers) so slow
+Gemini calls never occupy gunicorn workers:
+
+    python job_worker.py [num_threads]
+"""
+
+import os
+import sys
+import time
+
+# Handlers are registered when the app and its blueprints are imported
+os.environ.setdefault('JOB_WORKERS', '0')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: F401
+from services.jobs import job_queue
+
+if __name__ == '__main__':
+    num_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    job_queue.start_workers(num_workers)
+    print(f"Job worker running with {num_workers} threads")
+    while True:
+        time.sleep(60)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Create the MongoDB indexes the application relies on and report hot queries
+that would still run as collection scans:
+
+    python manage_indexes.py          # create missing indexes, then check
+    python manage_indexes.py --check  # only check
+"""
+
+import os
+import sys
+
+os.environ.setdefault('JOB_WORKERS', '0')
+os.environ.setdefault('QUESTION_BANK_REFILL_ENABLED', 'false')
+os.environ.setdefault('INDEX_BOOTSTRAP_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app
+from services.index_manager import ensure_indexes, find_collscans
+
+if __name__ == '__main__':
+    if '--check' not in sys.argv[1:]:
+        result = ensure_indexes(app.db)
+        print(f"Indexes ensured: {result['ensured']}, failed: {result['failed']}")
+    collscans = find_collscans(app.db)
+    for name in collscans:
+        print(f"COLLSCAN: {name}")
+    print("All checked queries use an index" if not collscans else f"{len(collscans)} queries run as collection scans")
+    sys.exit(1 if collscans else 0)
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Copy subject/topic from quizzes onto existing quiz attempts.
+
+New attempts store them at start time; this backfills older ones so the
+progress endpoint can group attempts without looking up each quiz:
+
+    python migrate_quiz_attempts.py
+"""
+
+import os
+import sys
+
+os.environ.setdefault('JOB_WORKERS', '0')
+os.environ.setdefault('QUESTION_BANK_REFILL_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import quiz_attempts_collection, quizzes_collection
+from models.quiz import backfill_attempt_subjects
+
+if __name__ == '__main__':
+    updated = backfill_attempt_subjects(quiz_attempts_collection, quizzes_collection)
+    print(f"Backfilled subject/topic on {updated} quiz attempts")
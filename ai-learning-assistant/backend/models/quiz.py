@@ -1,6 +1,7 @@
 from datetime import datetime
 from bson import ObjectId
-from typing import List, Dict, Optional
+from pymongo import UpdateMany
+from typing import List, Dict, Optional, Tuple
 
 class Quiz:
     def __init__(self, quiz_data):
@@ -34,7 +35,10 @@ class QuizAttempt:
         self.id = attempt_data['_id']
         self.user_id = attempt_data['user_id']
         self.quiz_id = attempt_data['quiz_id']
+        self.subject = attempt_data.get('subject')
+        self.topic = attempt_data.get('topic')
         self.answers = attempt_data['answers']
+        self.answer_string = attempt_data.get('answer_string')
         self.score = attempt_data['score']
         self.total_questions = attempt_data['total_questions']
         self.correct_answers = attempt_data['correct_answers']
@@ -49,7 +53,10 @@ class QuizAttempt:
             'id': self.id,
             'user_id': self.user_id,
             'quiz_id': self.quiz_id,
+            'subject': self.subject,
+            'topic': self.topic,
             'answers': self.answers,
+            'answer_string': self.answer_string,
             'score': self.score,
             'total_questions': self.total_questions,
             'correct_answers': self.correct_answers,
@@ -79,4 +86,61 @@ class QuizQuestion:
             'explanation': self.explanation,
             'difficulty': self.difficulty,
             'topic': self.topic
-        } 
\ No newline at end of file
+        } 
+
+# Copy subject/topic from quizzes onto attempts that predate their denormalization
+def backfill_attempt_subjects(quiz_attempts_collection, quizzes_collection, query=None):
+    query = dict(query or {}, subject={'$exists': False})
+    quiz_ids = quiz_attempts_collection.distinct('quiz_id', query)
+    if not quiz_ids:
+        return 0
+    quizzes = {q['_id']: q for q in quizzes_collection.find({'_id': {'$in': quiz_ids}}, {'subject': 1, 'topic': 1})}
+    # Attempts of deleted quizzes get null fields so they are not picked up again
+    updates = [
+        UpdateMany(dict(query, quiz_id=quiz_id), {'$set': {
+            'subject': quizzes.get(quiz_id, {}).get('subject'),
+            'topic': quizzes.get(quiz_id, {}).get('topic')
+        }})
+        for quiz_id in quiz_ids
+    ]
+    return quiz_attempts_collection.bulk_write(updates, ordered=False).modified_count
+
+# Compact answer key: one letter per question. Unusable answers in the key and
+# blank submitted answers use different placeholders so they never match.
+ANSWER_KEY_UNKNOWN = '?'
+ANSWER_BLANK = '-'
+# Stripped from the payload served to students
+SECRET_QUESTION_FIELDS = ('correct_answer', 'explanation')
+
+def _letter(value, placeholder):
+    value = str(value or '').strip().upper()
+    # Punctuation is refused so a submitted '?' or '-' can never equal a placeholder
+    return value if len(value) == 1 and value.isalnum() else placeholder
+
+def compile_questions(questions):
+    """Fields stored alongside a quiz's questions so serving and scoring never walk them"""
+    return {
+        'answer_key': ''.join(_letter(q.get('correct_answer'), ANSWER_KEY_UNKNOWN) for q in questions),
+        'public_questions': [{k: v for k, v in q.items() if k not in SECRET_QUESTION_FIELDS} for q in questions],
+        'explanations': [q.get('explanation', '') for q in questions]
+    }
+
+def answer_string(answers: Dict, num_questions: int) -> str:
+    """Submitted answers ({"0": "A", ...}) as a string aligned with the answer key"""
+    return ''.join(_letter(answers.get(str(i)), ANSWER_BLANK) for i in range(num_questions))
+
+def score_answers(answer_key: str, answers: Dict) -> Tuple[int, str]:
+    """Number of correct answers and the submitted answer string"""
+    submitted = answer_string(answers, len(answer_key))
+    return sum(map(str.__eq__, answer_key, submitted)), submitted
+
+def load_compiled_quiz(quizzes_collection, quiz_id, fields):
+    """Projected read of a quiz including compiled fields, compiling (once) quizzes stored before they existed"""
+    quiz_doc = quizzes_collection.find_one({'_id': quiz_id}, {f: 1 for f in fields})
+    if quiz_doc is None or 'answer_key' in quiz_doc or 'answer_key' not in fields:
+        return quiz_doc
+    full = quizzes_collection.find_one({'_id': quiz_id}, {'questions': 1})
+    compiled = compile_questions(full['questions'])
+    quizzes_collection.update_one({'_id': quiz_id}, {'$set': compiled})
+    quiz_doc.update(compiled)
+    return quiz_doc
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Build every user's spaced-repetition review queue for the day (review_queues
+collection), so /api/reviews/now is a single document read. Run it daily,
+e.g. from cron shortly after midnight UTC:
+
+    python precompute_reviews.py
+"""
+
+import os
+import sys
+
+os.environ.setdefault('JOB_WORKERS', '0')
+os.environ.setdefault('QUESTION_BANK_REFILL_ENABLED', 'false')
+os.environ.setdefault('INDEX_BOOTSTRAP_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: F401
+from services.review_scheduler import review_scheduler
+
+if __name__ == '__main__':
+    print(f"Built review queues for {review_scheduler.precompute()} users")
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+Rebuild the materialized dashboard statistics (user_stats collection).
+
+Backfills or repairs counters from the source collections:
+
+    python rebuild_user_stats.py              # every user
+    python rebuild_user_stats.py <user_id>... # selected users
+"""
+
+import os
+import sys
+
+os.environ.setdefault('JOB_WORKERS', '0')
+os.environ.setdefault('QUESTION_BANK_REFILL_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: F401
+from services.user_stats import user_stats
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        for user_id in sys.argv[1:]:
+            print(f"{user_id}: {'rebuilt' if user_stats.rebuild(user_id) else 'user not found'}")
+    else:
+        print(f"Rebuilt stats for {user_stats.rebuild_all()} users")
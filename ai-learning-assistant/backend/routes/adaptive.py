@@ -0,0 +1,81 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from services.adaptive_testing import adaptive_testing, session_to_dict
+
+adaptive_bp = Blueprint('adaptive', __name__)
+
+@adaptive_bp.route('/api/adaptive/start', methods=['POST'])
+@jwt_required()
+def start_adaptive_test():
+    """Start an adaptive test on a subject and topic; returns the first question"""
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json()
+        subject = data.get('subject')
+        topic = data.get('topic')
+
+        if not subject or not topic:
+            return jsonify({'error': 'Subject and topic are required'}), 400
+
+        session = adaptive_testing.start(user_id, subject, topic, data.get('exam_type', 'WAEC'))
+        if not session:
+            # A refill has been queued for the topic
+            return jsonify({'error': 'No questions are available for this topic yet, please try again shortly'}), 503
+
+        return jsonify({'success': True, 'session': session_to_dict(session)}), 201
+
+    except Exception as e:
+        return jsonify({'error': f'Error starting adaptive test: {str(e)}'}), 500
+
+@adaptive_bp.route('/api/adaptive/<session_id>/answer', methods=['POST'])
+@jwt_required()
+def answer_adaptive_question(session_id):
+    """Answer the current question ({question_id, answer}); returns feedback and the next question or the final estimate"""
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json()
+
+        session = adaptive_testing.get(session_id, user_id)
+        if not session:
+            return jsonify({'error': 'Adaptive test not found'}), 404
+
+        try:
+            feedback = adaptive_testing.answer(session, data.get('question_id'), data.get('answer'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        return jsonify({'success': True, **feedback, 'session': session_to_dict(session)}), 200
+
+    except Exception as e:
+        return jsonify({'error': f'Error answering adaptive question: {str(e)}'}), 500
+
+@adaptive_bp.route('/api/adaptive/<session_id>', methods=['GET'])
+@jwt_required()
+def get_adaptive_test(session_id):
+    """Progress of an adaptive test, including the current question while it is running"""
+    try:
+        session = adaptive_testing.get(session_id, get_jwt_identity())
+        if not session:
+            return jsonify({'error': 'Adaptive test not found'}), 404
+
+        return jsonify({'session': session_to_dict(session)}), 200
+
+    except Exception as e:
+        return jsonify({'error': f'Error retrieving adaptive test: {str(e)}'}), 500
+
+@adaptive_bp.route('/api/adaptive/ability/<subject>', methods=['GET'])
+@jwt_required()
+def get_ability(subject):
+    """The user's current ability estimate in a subject"""
+    try:
+        ability = adaptive_testing.ability(get_jwt_identity(), subject)
+
+        return jsonify({
+            'subject': subject,
+            'ability': round(ability['theta'], 3),
+            'standard_error': round(ability['se'], 3),
+            'tests': ability['tests']
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': f'Error retrieving ability: {str(e)}'}), 500
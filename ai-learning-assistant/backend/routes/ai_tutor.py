@@ -1,13 +1,71 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from services.ai_service import AITutorService
-from models.session import create_study_session, get_sessions_by_user, get_session_by_id
+from services.ai_service import AITutorService, logger
+from services.response_cache import response_cache
+from services.prompt_builder import prompt_metrics
+from services.context_store import context_store
+from services.user_stats import user_stats, user_id_forms
+from services.achievements import achievement_engine
+from services.jobs import job_queue
+from routes.jobs import job_accepted_response
+from utils.pagination import paginate, selected_fields
+from models.session import create_study_session, get_session_by_id
 from models.user import find_user_by_username, user_to_dict
 from bson import ObjectId
+import json
+from datetime import datetime
 
 ai_tutor_bp = Blueprint('ai_tutor', __name__)
 ai_service = AITutorService()
 
+SESSION_FIELDS = ('user_id', 'subject', 'topic', 'question', 'ai_response', 'satisfaction_rating', 'created_at')
+
+def wants_stream(data):
+    return bool(data.get('stream')) or request.args.get('stream') == '1'
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def stream_explanation(data, grade_level, on_complete=None, context=None):
+    """SSE response forwarding explanation chunks as they arrive.
+
+    on_complete(explanation) runs once the stream finishes and may return
+    extra fields for the final 'done' event."""
+    def events():
+        try:
+            stream = ai_service.generate_explanation_stream(
+                subject=data['subject'],
+                topic=data['topic'],
+                question=data['question'],
+                grade_level=grade_level,
+                user_context=context and context.user_context(),
+                conversation_history=context and context.conversation_history()
+            )
+            while True:
+                try:
+                    chunk = next(stream)
+                except StopIteration as stop:
+                    explanation = stop.value
+                    break
+                yield _sse('chunk', {'text': chunk})
+            done = {
+                'success': True,
+                'response': explanation,
+                'subject': data['subject'],
+                'topic': data['topic']
+            }
+            if on_complete:
+                done.update(on_complete(explanation) or {})
+            yield _sse('done', done)
+        except Exception as e:
+            logger.error(f"Gemini streaming error: {e}")
+            yield _sse('error', {'error': str(e)})
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @ai_tutor_bp.route('/ask', methods=['POST'])
 @jwt_required()
 def ask_question():
@@ -23,28 +81,41 @@ def ask_question():
             if field not in data:
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
-        # Get user info for context (we'll use a simple approach for now)
-        # In a real app, you'd get this from the database
-        grade_level = 'secondary'  # Default grade level
+        # Grade level, profile and recent exchanges come from the cached tutor context, not per-request lookups
+        context = context_store.get(user_id)
+        grade_level = (context and context.grade_level) or 'secondary'
+        
+        from app import sessions_collection
+        
+        def save_session(explanation):
+            session_id = create_study_session(
+                sessions_collection,
+                user_id,
+                data['subject'],
+                data['topic'],
+                data['question'],
+                explanation
+            )
+            context_store.record(user_id, data['subject'], data['topic'], data['question'], explanation)
+            user_stats.record_session(user_id, datetime.utcnow())
+            achievement_engine.record(user_id, 'session_created')
+            return {'session_id': session_id}
+        
+        if wants_stream(data):
+            return stream_explanation(data, grade_level, on_complete=save_session, context=context)
         
         # Generate AI explanation
         explanation = ai_service.generate_explanation(
             subject=data['subject'],
             topic=data['topic'],
             question=data['question'],
-            grade_level=grade_level
+            grade_level=grade_level,
+            user_context=context and context.user_context(),
+            conversation_history=context and context.conversation_history()
         )
         
-        # Save study session (we'll need to import the database connection)
-        from app import sessions_collection
-        session_id = create_study_session(
-            sessions_collection,
-            user_id,
-            data['subject'],
-            data['topic'],
-            data['question'],
-            explanation
-        )
+        # Save study session
+        session_id = save_session(explanation)['session_id']
         
         return jsonify({
             'success': True,
@@ -70,6 +141,9 @@ def demo_ask_question():
             if field not in data:
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
+        if wants_stream(data):
+            return stream_explanation(data, 'secondary')
+        
         # Generate AI explanation
         explanation = ai_service.generate_explanation(
             subject=data['subject'],
@@ -127,6 +201,15 @@ def generate_practice():
         difficulty = data.get('difficulty', 'medium')
         exam_type = data.get('exam_type')
         num_questions = data.get('num_questions', 3)
+        if data.get('async'):
+            job_id = job_queue.enqueue('questions_generate', {
+                'subject': data['subject'],
+                'topic': data['topic'],
+                'difficulty': difficulty,
+                'num_questions': num_questions,
+                'exam_type': exam_type
+            }, user_id=get_jwt_identity())
+            return job_accepted_response(job_id)
         questions = ai_service.generate_questions(
             subject=data['subject'],
             topic=data['topic'],
@@ -148,35 +231,50 @@ def generate_practice():
 @ai_tutor_bp.route('/sessions', methods=['GET'])
 @jwt_required()
 def get_study_sessions():
-    """Get user's study session history"""
+    """Get user's study session history, newest first (?limit, ?cursor, ?fields)"""
     
     try:
         user_id = get_jwt_identity()
         from app import sessions_collection
-        sessions = list(get_sessions_by_user(sessions_collection, user_id))
+        fields = selected_fields(request.args, SESSION_FIELDS)
+        sessions, next_cursor = paginate(
+            sessions_collection,
+            {'user_id': {'$in': user_id_forms(user_id)}},
+            'created_at',
+            request.args,
+            {f: 1 for f in fields}
+        )
         
         # Convert to dict format
         sessions_data = []
         for session in sessions:
-            sessions_data.append({
-                'id': str(session['_id']),
-                'user_id': str(session['user_id']),
-                'subject': session['subject'],
-                'topic': session['topic'],
-                'question': session['question'],
-                'ai_response': session['ai_response'],
-                'satisfaction_rating': session.get('satisfaction_rating'),
-                'created_at': session['created_at'].isoformat()
-            })
+            item = {'id': str(session['_id'])}
+            for field in fields:
+                value = session.get(field)
+                if field == 'user_id':
+                    value = str(value)
+                elif field == 'created_at':
+                    value = value.isoformat()
+                item[field] = value
+            sessions_data.append(item)
         
         return jsonify({
             'success': True,
-            'sessions': sessions_data
+            'sessions': sessions_data,
+            'next_cursor': next_cursor
         })
     
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@ai_tutor_bp.route('/cache/stats', methods=['GET'])
+@jwt_required()
+def get_cache_stats():
+    """Get hit/miss counters for the explanation cache and prompt-size metrics in this worker"""
+    return jsonify({'success': True, 'cache': response_cache.stats(), 'prompts': prompt_metrics.stats()})
+
 @ai_tutor_bp.route('/rate/<string:session_id>', methods=['POST'])
 def rate_session(session_id):
     """Rate the quality of an AI response"""
@@ -196,11 +294,15 @@ def rate_session(session_id):
         if not session:
             return jsonify({'error': 'Session not found'}), 404
         
-        # Update session with rating
-        sessions_collection.update_one(
+        # Update session with rating; the previous value keeps the rating average exact
+        previous = sessions_collection.find_one_and_update(
             {'_id': session['_id']},
-            {'$set': {'satisfaction_rating': rating}}
+            {'$set': {'satisfaction_rating': rating}},
+            projection={'user_id': 1, 'satisfaction_rating': 1}
         )
+        if previous:
+            user_stats.record_rating(previous.get('user_id'), previous.get('satisfaction_rating'), rating)
+            achievement_engine.record(previous.get('user_id'), 'session_rated', old_rating=previous.get('satisfaction_rating'), new_rating=rating)
         
         return jsonify({
             'success': True,
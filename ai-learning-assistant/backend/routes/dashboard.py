@@ -2,7 +2,11 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
 from bson import ObjectId
-import statistics
+from services.context_store import context_store
+from services.user_stats import user_stats, stats_to_dict, user_id_forms
+from models.quiz import backfill_attempt_subjects
+from services.achievements import achievement_engine
+from services.profile_cache import profile_cache
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
@@ -26,71 +30,12 @@ def get_dashboard_stats():
     try:
         user_id = get_jwt_identity()
         
-        # Get user data
-        user = users_collection.find_one({'_id': ObjectId(user_id)})
-        if not user:
+        # Counters are maintained incrementally by the write paths
+        doc = user_stats.get(user_id)
+        if not doc:
             return jsonify({'error': 'User not found'}), 404
         
-        # Get study sessions
-        sessions = list(sessions_collection.find({'user_id': user_id}).sort('created_at', -1))
-        
-        # Get quiz attempts
-        quiz_attempts = list(quiz_attempts_collection.find({'user_id': user_id}).sort('started_at', -1))
-        
-        # Get study groups
-        groups = list(study_groups_collection.find({'members': user_id}))
-        
-        # Calculate statistics
-        total_sessions = len(sessions)
-        total_questions = sum(len(session.get('questions', [])) for session in sessions)
-        avg_rating = 0
-        if sessions:
-            ratings = [s.get('satisfaction_rating', 0) for s in sessions if s.get('satisfaction_rating')]
-            avg_rating = statistics.mean(ratings) if ratings else 0
-        
-        # Quiz statistics
-        total_quizzes = len(quiz_attempts)
-        passed_quizzes = len([q for q in quiz_attempts if q.get('passed', False)])
-        avg_quiz_score = 0
-        if quiz_attempts:
-            scores = [q.get('score', 0) for q in quiz_attempts if q.get('score')]
-            avg_quiz_score = statistics.mean(scores) if scores else 0
-        
-        # Study groups
-        total_groups = len(groups)
-        
-        # Recent activity (last 7 days)
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        recent_sessions = len([s for s in sessions if s['created_at'] > week_ago])
-        recent_quizzes = len([q for q in quiz_attempts if q['started_at'] > week_ago])
-        
-        stats = {
-            'user': {
-                'name': user['full_name'],
-                'grade_level': user.get('grade_level', ''),
-                'subjects': user.get('subjects', []),
-                'joined_date': user['created_at'].isoformat()
-            },
-            'study_sessions': {
-                'total': total_sessions,
-                'total_questions': total_questions,
-                'avg_rating': round(avg_rating, 1),
-                'recent': recent_sessions
-            },
-            'quizzes': {
-                'total': total_quizzes,
-                'passed': passed_quizzes,
-                'avg_score': round(avg_quiz_score, 1),
-                'recent': recent_quizzes
-            },
-            'groups': {
-                'total': total_groups
-            },
-            'recent_activity': {
-                'sessions': recent_sessions,
-                'quizzes': recent_quizzes
-            }
-        }
+        stats = stats_to_dict(doc)
         
         return jsonify(stats), 200
         
@@ -142,54 +87,51 @@ def get_learning_progress():
         user_id = get_jwt_identity()
         
         # Get user's subjects
-        user = users_collection.find_one({'_id': ObjectId(user_id)})
+        user = users_collection.find_one({'_id': ObjectId(user_id)}, {'subjects': 1})
         subjects = user.get('subjects', [])
+        forms = user_id_forms(user_id)
+        
+        # One grouped aggregation per collection; attempts carry their quiz's subject
+        session_groups = sessions_collection.aggregate([
+            {'$match': {'user_id': {'$in': forms}, 'subject': {'$in': subjects}}},
+            {'$group': {
+                '_id': '$subject',
+                'sessions': {'$sum': 1},
+                'questions': {'$sum': {'$size': {'$ifNull': ['$questions', []]}}},
+                'rating_sum': {'$sum': {'$ifNull': ['$satisfaction_rating', 0]}},
+                'rating_count': {'$sum': {'$cond': [{'$gt': ['$satisfaction_rating', 0]}, 1, 0]}}
+            }}
+        ])
+        sessions_by_subject = {g['_id']: g for g in session_groups}
+        
+        attempt_pipeline = [
+            {'$match': {'user_id': user_id, '$or': [{'subject': {'$in': subjects}}, {'subject': {'$exists': False}}]}},
+            {'$group': {
+                '_id': '$subject',
+                'quizzes': {'$sum': 1},
+                'passed': {'$sum': {'$cond': [{'$eq': ['$passed', True]}, 1, 0]}},
+                'score_sum': {'$sum': {'$ifNull': ['$score', 0]}},
+                'score_count': {'$sum': {'$cond': [{'$gt': ['$score', 0]}, 1, 0]}}
+            }}
+        ]
+        attempts_by_subject = {g['_id']: g for g in quiz_attempts_collection.aggregate(attempt_pipeline)}
+        if None in attempts_by_subject:
+            # Attempts from before subject was denormalized: backfill once, then regroup
+            from routes.quiz import quizzes_collection
+            backfill_attempt_subjects(quiz_attempts_collection, quizzes_collection, {'user_id': user_id})
+            attempts_by_subject = {g['_id']: g for g in quiz_attempts_collection.aggregate(attempt_pipeline)}
         
         progress = {}
-        
         for subject in subjects:
-            # Get sessions for this subject
-            subject_sessions = list(sessions_collection.find({
-                'user_id': user_id,
-                'subject': subject
-            }))
-            
-            # Get quiz attempts for this subject
-            subject_quizzes = list(quiz_attempts_collection.find({
-                'user_id': user_id
-            }))
-            
-            # Calculate progress
-            total_sessions = len(subject_sessions)
-            total_questions = sum(len(s.get('questions', [])) for s in subject_sessions)
-            avg_rating = 0
-            if subject_sessions:
-                ratings = [s.get('satisfaction_rating', 0) for s in subject_sessions if s.get('satisfaction_rating')]
-                avg_rating = statistics.mean(ratings) if ratings else 0
-            
-            # Quiz progress for this subject
-            subject_quiz_attempts = []
-            for quiz in subject_quizzes:
-                # Get quiz details to check subject
-                from routes.quiz import quizzes_collection
-                quiz_details = quizzes_collection.find_one({'_id': quiz['quiz_id']})
-                if quiz_details and quiz_details.get('subject') == subject:
-                    subject_quiz_attempts.append(quiz)
-            
-            total_quizzes = len(subject_quiz_attempts)
-            passed_quizzes = len([q for q in subject_quiz_attempts if q.get('passed', False)])
-            avg_score = 0
-            if subject_quiz_attempts:
-                scores = [q.get('score', 0) for q in subject_quiz_attempts if q.get('score')]
-                avg_score = statistics.mean(scores) if scores else 0
-            
+            s = sessions_by_subject.get(subject, {})
+            q = attempts_by_subject.get(subject, {})
             progress[subject] = {
-                'sessions': total_sessions,
-                'questions': total_questions,
-                'avg_rating': round(avg_rating, 1),
-                'quizzes': total_quizzes,
-                'passed_quizzes': passed_quizzes,
-                'avg_score': round(avg_score, 1)
+                'sessions': s.get('sessions', 0),
+                'questions': s.get('questions', 0),
+                'avg_rating': round(s['rating_sum'] / s['rating_count'], 1) if s.get('rating_count') else 0,
+                'quizzes': q.get('quizzes', 0),
+                'passed_quizzes': q.get('passed', 0),
+                'avg_score': round(q['score_sum'] / q['score_count'], 1) if q.get('score_count') else 0
             }
         
         return jsonify({'progress': progress}), 200
@@ -257,6 +199,10 @@ def update_user_profile():
         if result.modified_count == 0:
             return jsonify({'error': 'No changes made'}), 400
         
+        context_store.update_profile(user_id, update_data)
+        user_stats.update_profile(user_id, update_data)
+        profile_cache.invalidate(user_id)
+        
         return jsonify({'success': True, 'message': 'Profile updated successfully'}), 200
         
     except Exception as e:
@@ -305,73 +251,8 @@ def get_achievements():
     try:
         user_id = get_jwt_identity()
         
-        # Get user stats
-        sessions = list(sessions_collection.find({'user_id': user_id}))
-        quiz_attempts = list(quiz_attempts_collection.find({'user_id': user_id}))
-        
-        achievements = []
-        
-        # Session achievements
-        total_sessions = len(sessions)
-        if total_sessions >= 1:
-            achievements.append({
-                'id': 'first_session',
-                'title': 'First Step',
-                'description': 'Completed your first study session',
-                'icon': '🎯',
-                'earned': True
-            })
-        
-        if total_sessions >= 10:
-            achievements.append({
-                'id': 'dedicated_learner',
-                'title': 'Dedicated Learner',
-                'description': 'Completed 10 study sessions',
-                'icon': '📚',
-                'earned': True
-            })
-        
-        if total_sessions >= 50:
-            achievements.append({
-                'id': 'study_master',
-                'title': 'Study Master',
-                'description': 'Completed 50 study sessions',
-                'icon': '🏆',
-                'earned': True
-            })
-        
-        # Quiz achievements
-        total_quizzes = len(quiz_attempts)
-        if total_quizzes >= 1:
-            achievements.append({
-                'id': 'first_quiz',
-                'title': 'Quiz Explorer',
-                'description': 'Completed your first quiz',
-                'icon': '🧠',
-                'earned': True
-            })
-        
-        passed_quizzes = len([q for q in quiz_attempts if q.get('passed', False)])
-        if passed_quizzes >= 5:
-            achievements.append({
-                'id': 'quiz_champion',
-                'title': 'Quiz Champion',
-                'description': 'Passed 5 quizzes',
-                'icon': '🥇',
-                'earned': True
-            })
-        
-        # Rating achievements
-        if sessions:
-            high_ratings = len([s for s in sessions if s.get('satisfaction_rating', 0) >= 4])
-            if high_ratings >= 10:
-                achievements.append({
-                    'id': 'helpful_explanations',
-                    'title': 'Helpful Explanations',
-                    'description': 'Rated 10+ explanations as very helpful',
-                    'icon': '⭐',
-                    'earned': True
-                })
+        # Badges are awarded as events happen; reading them is one document fetch
+        achievements = achievement_engine.get(user_id)
         
         return jsonify({'achievements': achievements}), 200
         
@@ -0,0 +1,270 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import os
+from models.quiz import load_compiled_quiz, score_answers
+from services.user_stats import user_stats
+from services.achievements import achievement_engine
+from services.review_scheduler import review_scheduler
+
+exam_sessions_bp = Blueprint('exam_sessions', __name__)
+
+# MongoDB collections - will be set up in main app
+exam_sessions_collection = None
+quizzes_collection = None
+quiz_attempts_collection = None
+users_collection = None
+study_groups_collection = None
+
+EXAM_ROSTER_MAX = int(os.getenv('EXAM_ROSTER_MAX', 1000))
+
+def init_collections(db_instance):
+    global exam_sessions_collection, quizzes_collection, quiz_attempts_collection, users_collection, study_groups_collection
+    exam_sessions_collection = db_instance.exam_sessions
+    quizzes_collection = db_instance.quizzes
+    quiz_attempts_collection = db_instance.quiz_attempts
+    users_collection = db_instance.users
+    study_groups_collection = db_instance.study_groups
+
+def load_own_session(session_id, user_id, projection=None):
+    """The exam session if it exists and was created by this user"""
+    if not ObjectId.is_valid(session_id):
+        return None
+    return exam_sessions_collection.find_one({'_id': ObjectId(session_id), 'created_by': user_id}, projection)
+
+@exam_sessions_bp.route('/api/exam-sessions', methods=['POST'])
+@jwt_required()
+def create_exam_session():
+    """Start a proctored quiz for a whole roster: one attempt per student, written in one bulk insert.
+
+    Only the creator of a study group can start one, and only for members of that group."""
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json()
+        quiz_id = data.get('quiz_id')
+        group_id = data.get('group_id')
+        roster = list(dict.fromkeys(str(u) for u in data.get('roster', [])))
+
+        if not quiz_id or not ObjectId.is_valid(quiz_id):
+            return jsonify({'error': 'A valid quiz_id is required'}), 400
+        if not group_id or not ObjectId.is_valid(group_id):
+            return jsonify({'error': 'A valid group_id is required'}), 400
+        if not roster:
+            return jsonify({'error': 'Roster must list at least one student'}), 400
+        if len(roster) > EXAM_ROSTER_MAX:
+            return jsonify({'error': f'Roster cannot exceed {EXAM_ROSTER_MAX} students'}), 400
+
+        group = study_groups_collection.find_one({'_id': ObjectId(group_id)}, {'created_by': 1, 'members': 1})
+        if not group:
+            return jsonify({'error': 'Group not found'}), 404
+        if group['created_by'] != user_id:
+            return jsonify({'error': 'Only the group creator can start an exam session'}), 403
+        members = set(group['members'])
+        not_members = [u for u in roster if u not in members]
+        if not_members:
+            return jsonify({'error': 'Roster includes students who are not group members', 'not_members': not_members}), 400
+
+        quiz_doc = load_compiled_quiz(quizzes_collection, ObjectId(quiz_id), ('subject', 'topic', 'time_limit', 'passing_score', 'answer_key'))
+        if not quiz_doc:
+            return jsonify({'error': 'Quiz not found'}), 404
+
+        # One query to check the whole roster
+        valid_ids = [ObjectId(u) for u in roster if ObjectId.is_valid(u)]
+        known = {str(u['_id']) for u in users_collection.find({'_id': {'$in': valid_ids}}, {'_id': 1})}
+        unknown = [u for u in roster if u not in known]
+        if unknown:
+            return jsonify({'error': 'Unknown students in roster', 'unknown': unknown}), 400
+
+        now = datetime.utcnow()
+        session_data = {
+            'quiz_id': quiz_doc['_id'],
+            'group_id': group['_id'],
+            'created_by': user_id,
+            'roster': roster,
+            'time_limit': quiz_doc['time_limit'],
+            'passing_score': quiz_doc['passing_score'],
+            'total_questions': len(quiz_doc['answer_key']),
+            'created_at': now
+        }
+        session_id = exam_sessions_collection.insert_one(session_data).inserted_id
+
+        attempts = [{
+            'user_id': student_id,
+            'quiz_id': quiz_doc['_id'],
+            'exam_session_id': session_id,
+            'subject': quiz_doc.get('subject'),
+            'topic': quiz_doc.get('topic'),
+            'answers': {},
+            'score': 0,
+            'total_questions': len(quiz_doc['answer_key']),
+            'correct_answers': 0,
+            'time_taken': 0,
+            'completed': False,
+            'started_at': now,
+            'passed': False
+        } for student_id in roster]
+        result = quiz_attempts_collection.insert_many(attempts, ordered=False)
+        user_stats.record_quizzes_started(roster, now)
+        achievement_engine.record_many([(student_id, {}) for student_id in roster], 'quiz_started')
+
+        return jsonify({
+            'success': True,
+            'session_id': str(session_id),
+            'time_limit': session_data['time_limit'],
+            'total_questions': session_data['total_questions'],
+            'attempts': {student_id: str(attempt_id) for student_id, attempt_id in zip(roster, result.inserted_ids)}
+        }), 201
+
+    except Exception as e:
+        return jsonify({'error': f'Error creating exam session: {str(e)}'}), 500
+
+@exam_sessions_bp.route('/api/exam-sessions/<session_id>/submissions', methods=['POST'])
+@jwt_required()
+def submit_exam_answers(session_id):
+    """Score a batch of submissions ({user_id, answers, time_taken}) and store them with one bulk write"""
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json()
+        submissions = data.get('submissions', [])
+
+        session = load_own_session(session_id, user_id, {'quiz_id': 1, 'passing_score': 1})
+        if not session:
+            return jsonify({'error': 'Exam session not found'}), 404
+        if not submissions or len(submissions) > EXAM_ROSTER_MAX:
+            return jsonify({'error': f'Send between 1 and {EXAM_ROSTER_MAX} submissions'}), 400
+
+        quiz_doc = load_compiled_quiz(quizzes_collection, session['quiz_id'], ('answer_key',))
+        if not quiz_doc:
+            return jsonify({'error': 'Quiz not found'}), 404
+        answer_key = quiz_doc['answer_key']
+
+        # Latest submission per student wins within a batch
+        by_student = {str(s.get('user_id')): s for s in submissions}
+        open_attempts = {
+            a['user_id']: a['_id'] for a in quiz_attempts_collection.find(
+                {'exam_session_id': session['_id'], 'user_id': {'$in': list(by_student)}, 'completed': False},
+                {'user_id': 1}
+            )
+        }
+
+        now = datetime.utcnow()
+        batch_id = ObjectId()
+        results, submitted_by, ops = {}, {}, []
+        for student_id, attempt_id in open_attempts.items():
+            submission = by_student[student_id]
+            answers = submission.get('answers') or {}
+            correct_answers, submitted = score_answers(answer_key, answers)
+            score = (correct_answers / len(answer_key)) * 100
+            passed = score >= session['passing_score']
+            results[student_id] = {'score': score, 'correct_answers': correct_answers, 'passed': passed}
+            submitted_by[student_id] = submitted
+            # The completed guard keeps a racing individual submit from being overwritten
+            ops.append(UpdateOne({'_id': attempt_id, 'completed': False}, {'$set': {
+                'answers': answers,
+                'answer_string': submitted,
+                'score': score,
+                'correct_answers': correct_answers,
+                'time_taken': submission.get('time_taken', 0),
+                'completed': True,
+                'completed_at': now,
+                'passed': passed,
+                'submission_batch': batch_id
+            }}))
+
+        if ops:
+            try:
+                written = quiz_attempts_collection.bulk_write(ops, ordered=False).modified_count
+            except BulkWriteError:
+                written = -1
+            if written != len(ops):
+                # Some attempts were submitted individually meanwhile; keep only the ones written here
+                ours = {a['user_id'] for a in quiz_attempts_collection.find(
+                    {'_id': {'$in': [open_attempts[s] for s in results]}, 'submission_batch': batch_id}, {'user_id': 1}
+                )}
+                results = {s: r for s, r in results.items() if s in ours}
+            user_stats.record_quizzes_completed((s, r['score'], r['passed']) for s, r in results.items())
+            achievement_engine.record_many([(s, {'passed': r['passed']}) for s, r in results.items()], 'quiz_completed')
+            review_scheduler.record_attempts(session['quiz_id'], answer_key, [(s, submitted_by[s], open_attempts[s]) for s in results])
+
+        return jsonify({
+            'success': True,
+            'scored': len(results),
+            'skipped': [s for s in by_student if s not in results],
+            'results': results
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': f'Error submitting exam answers: {str(e)}'}), 500
+
+@exam_sessions_bp.route('/api/exam-sessions/<session_id>/attempt', methods=['GET'])
+@jwt_required()
+def get_my_exam_attempt(session_id):
+    """The calling student's attempt in an exam session, to submit through /api/quiz/submit"""
+    try:
+        user_id = get_jwt_identity()
+        if not ObjectId.is_valid(session_id):
+            return jsonify({'error': 'Exam session not found'}), 404
+
+        attempt = quiz_attempts_collection.find_one(
+            {'exam_session_id': ObjectId(session_id), 'user_id': user_id},
+            {'quiz_id': 1, 'completed': 1, 'started_at': 1}
+        )
+        if not attempt:
+            return jsonify({'error': 'You are not on this exam roster'}), 404
+
+        return jsonify({
+            'attempt_id': str(attempt['_id']),
+            'quiz_id': str(attempt['quiz_id']),
+            'completed': attempt['completed'],
+            'started_at': attempt['started_at'].isoformat()
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': f'Error retrieving exam attempt: {str(e)}'}), 500
+
+@exam_sessions_bp.route('/api/exam-sessions/<session_id>', methods=['GET'])
+@jwt_required()
+def get_exam_session(session_id):
+    """Session summary and per-student results for the teacher who created it"""
+    try:
+        user_id = get_jwt_identity()
+
+        session = load_own_session(session_id, user_id)
+        if not session:
+            return jsonify({'error': 'Exam session not found'}), 404
+
+        attempts = list(quiz_attempts_collection.find(
+            {'exam_session_id': session['_id']},
+            {'user_id': 1, 'score': 1, 'correct_answers': 1, 'passed': 1, 'completed': 1, 'time_taken': 1}
+        ))
+        completed = [a for a in attempts if a['completed']]
+
+        return jsonify({
+            'session': {
+                'id': str(session['_id']),
+                'quiz_id': str(session['quiz_id']),
+                'group_id': str(session['group_id']) if session.get('group_id') else None,
+                'time_limit': session['time_limit'],
+                'total_questions': session['total_questions'],
+                'created_at': session['created_at'].isoformat(),
+                'roster_size': len(session['roster']),
+                'completed': len(completed),
+                'passed': sum(1 for a in completed if a['passed']),
+                'avg_score': round(sum(a['score'] for a in completed) / len(completed), 1) if completed else 0
+            },
+            'results': [{
+                'user_id': a['user_id'],
+                'attempt_id': str(a['_id']),
+                'completed': a['completed'],
+                'score': a['score'],
+                'correct_answers': a['correct_answers'],
+                'passed': a['passed'],
+                'time_taken': a['time_taken']
+            } for a in attempts]
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': f'Error retrieving exam session: {str(e)}'}), 500
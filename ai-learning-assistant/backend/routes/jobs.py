@@ -0,0 +1,79 @@
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from bson import ObjectId
+import json
+import time
+from services.jobs import job_queue, job_to_dict
+from utils.streams import event_stream_response
+
+jobs_bp = Blueprint('jobs', __name__)
+
+SSE_POLL_INTERVAL = 0.5
+SSE_MAX_SECONDS = 180
+
+def job_accepted_response(job_id):
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': f'/api/jobs/{job_id}',
+        'events_url': f'/api/jobs/{job_id}/events'
+    }), 202
+
+def _load_job(job_id):
+    """Return the job if the caller may see it (jobs created by a user are private to them)"""
+    if not ObjectId.is_valid(job_id):
+        return None
+    job = job_queue.get(job_id)
+    if job and job.get('user_id') and job['user_id'] != get_jwt_identity():
+        return None
+    return job
+
+@jobs_bp.route('/api/jobs/<job_id>', methods=['GET'])
+@jwt_required(optional=True)
+def get_job(job_id):
+    """Poll the status, progress and result of a generation job"""
+    try:
+        job = _load_job(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        return jsonify({'success': True, 'job': job_to_dict(job)}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Error retrieving job: {str(e)}'}), 500
+
+@jobs_bp.route('/api/jobs/<job_id>/events', methods=['GET'])
+@jwt_required(optional=True)
+def stream_job_events(job_id):
+    """Server-sent events stream of job progress, ending with a done event"""
+    job = _load_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def events():
+        last_progress = None
+        deadline = time.time() + SSE_MAX_SECONDS
+        current = job
+        while True:
+            if current['status'] in ('completed', 'failed'):
+                yield f"event: done\ndata: {json.dumps(job_to_dict(current))}\n\n"
+                return
+            progress = current.get('progress', {})
+            if progress != last_progress:
+                last_progress = progress
+                yield f"event: progress\ndata: {json.dumps(dict(progress, status=current['status']))}\n\n"
+            if time.time() > deadline:
+                yield "event: timeout\ndata: {}\n\n"
+                return
+            time.sleep(SSE_POLL_INTERVAL)
+            current = job_queue.get(job_id)
+            if current is None:
+                # Expired (or deleted) while the stream was open
+                yield f"event: error\ndata: {json.dumps({'error': 'Job not found'})}\n\n"
+                return
+    
+    response = event_stream_response(events())
+    if response is None:
+        return jsonify({'error': 'Too many open streams, please poll the job status instead'}), 503
+    return response
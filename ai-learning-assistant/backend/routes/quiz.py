@@ -5,8 +5,16 @@ from bson import ObjectId
 import os
 import json
 import random
-import re
 from services.ai_service import AITutorService
+from services.question_bank import question_bank, make_bucket
+from services.jobs import job_queue
+from services.user_stats import user_stats
+from services.achievements import achievement_engine
+from routes.jobs import job_accepted_response
+from utils.pagination import paginate, selected_fields
+from models.quiz import compile_questions, load_compiled_quiz, score_answers
+from services.item_analytics import item_analytics
+from services.review_scheduler import review_scheduler
 
 quiz_bp = Blueprint('quiz', __name__)
 
@@ -16,15 +24,89 @@ def init_collections(db_instance):
     quizzes_collection = db_instance.quizzes
     quiz_attempts_collection = db_instance.quiz_attempts
 
-def repair_json(text):
-    # Remove trailing commas before closing braces/brackets
-    text = re.sub(r',([ \t\r\n]*[}}\]])', r'\1', text)
-    # Replace smart quotes with normal quotes
-    text = text.replace('“', '"').replace('”', '"').replace("‘", "'").replace("’", "'")
-    return text
-
 ai_tutor_service = AITutorService()
 
+ATTEMPT_FIELDS = ('user_id', 'quiz_id', 'subject', 'topic', 'score', 'total_questions', 'correct_answers', 'time_taken',
+                  'completed', 'started_at', 'completed_at', 'passed')
+QUIZ_LIST_FIELDS = ('title', 'subject', 'topic', 'difficulty', 'time_limit', 'passing_score', 'created_at', 'created_by')
+# Served to students: the pre-rendered answer-free questions, never the full question documents
+QUIZ_SERVE_FIELDS = ('title', 'subject', 'topic', 'difficulty', 'time_limit', 'passing_score', 'public_questions', 'answer_key')
+
+def serialize_doc(doc, fields):
+    """JSON-safe dict of the selected fields plus the string _id"""
+    item = {'_id': str(doc['_id'])}
+    for field in fields:
+        value = doc.get(field)
+        if isinstance(value, ObjectId):
+            value = str(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        item[field] = value
+    return item
+
+def create_quiz(user_id, subject, topic, difficulty='medium', num_questions=10, exam_type='WAEC', progress_callback=None):
+    """Build and store a quiz, returning its summary"""
+    # Serve from the pre-generated question bank; Gemini is only called inline for the shortfall
+    bucket = make_bucket(subject, topic, exam_type, difficulty)
+    questions = question_bank.sample(bucket, num_questions)
+    banked = len(questions)
+    if banked < num_questions:
+        progress = None
+        if progress_callback:
+            progress = lambda done, total, message='': progress_callback(banked + done, num_questions, message)
+        generated = ai_tutor_service.generate_questions(
+            subject=subject,
+            topic=topic,
+            difficulty=difficulty,
+            num_questions=num_questions - banked,
+            exam_type=exam_type,
+            exclude_questions=[q['question'] for q in questions],
+            allow_fallback=False,
+            progress_callback=progress
+        )
+        question_bank.add_questions(bucket, generated)
+        questions = questions + generated
+        if not questions:
+            questions = ai_tutor_service._get_fallback_questions(subject, topic, num_questions, exam_type)
+    elif progress_callback:
+        progress_callback(len(questions), num_questions, f"{len(questions)}/{num_questions} questions loaded from question bank")
+    
+    # Create quiz document
+    quiz_data = {
+        'title': f"{subject} - {topic} Quiz",
+        'subject': subject,
+        'topic': topic,
+        'difficulty': difficulty,
+        'questions': questions,
+        **compile_questions(questions),
+        'time_limit': 30,  # 30 minutes
+        'passing_score': 70,
+        'created_at': datetime.utcnow(),
+        'created_by': user_id
+    }
+    
+    result = quizzes_collection.insert_one(quiz_data)
+    
+    return {
+        'id': str(result.inserted_id),
+        'title': quiz_data['title'],
+        'subject': subject,
+        'topic': topic,
+        'difficulty': difficulty,
+        'num_questions': len(questions),
+        'time_limit': quiz_data['time_limit']
+    }
+
+def run_generate_quiz_job(params, progress):
+    return {'quiz': create_quiz(progress_callback=progress, **params)}
+
+def run_generate_questions_job(params, progress):
+    questions = ai_tutor_service.generate_questions(progress_callback=progress, **params)
+    return {'questions': questions}
+
+job_queue.register_handler('quiz_generate', run_generate_quiz_job)
+job_queue.register_handler('questions_generate', run_generate_questions_job)
+
 @quiz_bp.route('/api/quiz/generate', methods=['POST'])
 @jwt_required()
 def generate_quiz():
@@ -40,42 +122,25 @@ def generate_quiz():
         if not subject or not topic:
             return jsonify({'error': 'Subject and topic are required'}), 400
         
-        # Use unified Gemini-powered function
-        questions = ai_tutor_service.generate_questions(
-            subject=subject,
-            topic=topic,
-            difficulty=difficulty,
-            num_questions=num_questions,
-            exam_type=exam_type
-        )
-        
-        # Create quiz document
-        quiz_data = {
-            'title': f"{subject} - {topic} Quiz",
+        params = {
+            'user_id': get_jwt_identity(),
             'subject': subject,
             'topic': topic,
             'difficulty': difficulty,
-            'questions': questions,
-            'time_limit': 30,  # 30 minutes
-            'passing_score': 70,
-            'created_at': datetime.utcnow(),
-            'created_by': get_jwt_identity()
+            'num_questions': num_questions,
+            'exam_type': exam_type
         }
         
-        result = quizzes_collection.insert_one(quiz_data)
-        quiz_data['_id'] = result.inserted_id
+        # Async mode: hand the work to the job workers and return immediately
+        if data.get('async'):
+            job_id = job_queue.enqueue('quiz_generate', params, user_id=params['user_id'])
+            return job_accepted_response(job_id)
+        
+        quiz = create_quiz(**params)
         
         return jsonify({
             'success': True,
-            'quiz': {
-                'id': str(result.inserted_id),
-                'title': quiz_data['title'],
-                'subject': subject,
-                'topic': topic,
-                'difficulty': difficulty,
-                'num_questions': len(questions),
-                'time_limit': quiz_data['time_limit']
-            }
+            'quiz': quiz
         }), 201
         
     except Exception as e:
@@ -86,18 +151,10 @@ def generate_quiz():
 def get_quiz(quiz_id):
     """Get quiz details and questions (without correct answers)"""
     try:
-        quiz_doc = quizzes_collection.find_one({'_id': ObjectId(quiz_id)})
+        quiz_doc = load_compiled_quiz(quizzes_collection, ObjectId(quiz_id), QUIZ_SERVE_FIELDS)
         if not quiz_doc:
             return jsonify({'error': 'Quiz not found'}), 404
         
-        # Remove correct answers for security
-        questions_for_user = []
-        for q in quiz_doc['questions']:
-            question_copy = q.copy()
-            question_copy.pop('correct_answer', None)
-            question_copy.pop('explanation', None)
-            questions_for_user.append(question_copy)
-        
         return jsonify({
             'quiz': {
                 'id': str(quiz_doc['_id']),
@@ -105,7 +162,7 @@ def get_quiz(quiz_id):
                 'subject': quiz_doc['subject'],
                 'topic': quiz_doc['topic'],
                 'difficulty': quiz_doc['difficulty'],
-                'questions': questions_for_user,
+                'questions': quiz_doc['public_questions'],
                 'time_limit': quiz_doc['time_limit'],
                 'passing_score': quiz_doc['passing_score']
             }
@@ -114,6 +171,40 @@ def get_quiz(quiz_id):
     except Exception as e:
         return jsonify({'error': f'Error retrieving quiz: {str(e)}'}), 500
 
+@quiz_bp.route('/api/quiz/<quiz_id>/analytics', methods=['GET'])
+@jwt_required()
+def get_quiz_analytics(quiz_id):
+    """Item analysis of a quiz (p-values, discrimination, distractors, KR-20) for its creator"""
+    try:
+        user_id = get_jwt_identity()
+        
+        quiz_doc = quizzes_collection.find_one({'_id': ObjectId(quiz_id)}, {'created_by': 1})
+        if not quiz_doc or quiz_doc.get('created_by') != user_id:
+            return jsonify({'error': 'Quiz not found'}), 404
+        
+        report = item_analytics.quiz_report(quiz_doc['_id'])
+        if not report:
+            return jsonify({'error': 'No analytics yet for this quiz'}), 404
+        
+        return jsonify({'analytics': report}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Error retrieving quiz analytics: {str(e)}'}), 500
+
+@quiz_bp.route('/api/quiz/analytics/questions/<question_hash>', methods=['GET'])
+@jwt_required()
+def get_question_analytics(question_hash):
+    """Item analysis of a bank question across every quiz it appeared in, for creators of those quizzes"""
+    try:
+        report = item_analytics.question_report(question_hash, get_jwt_identity())
+        if not report:
+            return jsonify({'error': 'No analytics yet for this question'}), 404
+        
+        return jsonify({'analytics': report}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Error retrieving question analytics: {str(e)}'}), 500
+
 @quiz_bp.route('/api/quiz/start/<quiz_id>', methods=['POST'])
 @jwt_required()
 def start_quiz(quiz_id):
@@ -122,7 +213,7 @@ def start_quiz(quiz_id):
         user_id = get_jwt_identity()
         
         # Check if quiz exists
-        quiz_doc = quizzes_collection.find_one({'_id': ObjectId(quiz_id)})
+        quiz_doc = load_compiled_quiz(quizzes_collection, ObjectId(quiz_id), ('subject', 'topic', 'time_limit', 'answer_key'))
         if not quiz_doc:
             return jsonify({'error': 'Quiz not found'}), 404
         
@@ -140,9 +231,11 @@ def start_quiz(quiz_id):
         attempt_data = {
             'user_id': user_id,
             'quiz_id': ObjectId(quiz_id),
+            'subject': quiz_doc.get('subject'),
+            'topic': quiz_doc.get('topic'),
             'answers': {},
             'score': 0,
-            'total_questions': len(quiz_doc['questions']),
+            'total_questions': len(quiz_doc['answer_key']),
             'correct_answers': 0,
             'time_taken': 0,
             'completed': False,
@@ -151,12 +244,14 @@ def start_quiz(quiz_id):
         }
         
         result = quiz_attempts_collection.insert_one(attempt_data)
+        user_stats.record_quiz_started(user_id, attempt_data['started_at'])
+        achievement_engine.record(user_id, 'quiz_started')
         
         return jsonify({
             'success': True,
             'attempt_id': str(result.inserted_id),
             'time_limit': quiz_doc['time_limit'],
-            'total_questions': len(quiz_doc['questions'])
+            'total_questions': len(quiz_doc['answer_key'])
         }), 201
         
     except Exception as e:
@@ -165,18 +260,19 @@ def start_quiz(quiz_id):
 @quiz_bp.route('/api/quiz/submit/<attempt_id>', methods=['POST'])
 @jwt_required()
 def submit_quiz(attempt_id):
-    """Submit quiz answers and calculate score"""
+    """Submit quiz answers and calculate score ("details": false in the body skips the per-question review)"""
     try:
         user_id = get_jwt_identity()
         data = request.get_json()
         answers = data.get('answers', {})
         time_taken = data.get('time_taken', 0)
+        details = data.get('details', True)
         
         # Get attempt
         attempt_doc = quiz_attempts_collection.find_one({
             '_id': ObjectId(attempt_id),
             'user_id': user_id
-        })
+        }, {'quiz_id': 1, 'completed': 1})
         
         if not attempt_doc:
             return jsonify({'error': 'Quiz attempt not found'}), 404
@@ -184,40 +280,38 @@ def submit_quiz(attempt_id):
         if attempt_doc['completed']:
             return jsonify({'error': 'Quiz already completed'}), 400
         
-        # Get quiz for scoring
-        quiz_doc = quizzes_collection.find_one({'_id': attempt_doc['quiz_id']})
+        # Scoring only needs the compact answer key; the review text is read only when returned
+        fields = ('passing_score', 'answer_key') + (('public_questions.question', 'explanations') if details else ())
+        quiz_doc = load_compiled_quiz(quizzes_collection, attempt_doc['quiz_id'], fields)
         if not quiz_doc:
             return jsonify({'error': 'Quiz not found'}), 404
         
         # Calculate score
-        correct_answers = 0
-        total_questions = len(quiz_doc['questions'])
+        answer_key = quiz_doc['answer_key']
+        total_questions = len(answer_key)
+        correct_answers, submitted = score_answers(answer_key, answers)
         detailed_results = []
         
-        for i, question in enumerate(quiz_doc['questions']):
-            user_answer = answers.get(str(i), '')
-            is_correct = user_answer == question['correct_answer']
-            
-            if is_correct:
-                correct_answers += 1
-            
-            detailed_results.append({
-                'question': question['question'],
-                'user_answer': user_answer,
-                'correct_answer': question['correct_answer'],
-                'is_correct': is_correct,
-                'explanation': question.get('explanation', '')
-            })
+        if details:
+            for i, question in enumerate(quiz_doc['public_questions']):
+                detailed_results.append({
+                    'question': question['question'],
+                    'user_answer': answers.get(str(i), ''),
+                    'correct_answer': answer_key[i],
+                    'is_correct': answer_key[i] == submitted[i],
+                    'explanation': quiz_doc['explanations'][i]
+                })
         
         score = (correct_answers / total_questions) * 100
         passed = score >= quiz_doc['passing_score']
         
-        # Update attempt
-        quiz_attempts_collection.update_one(
-            {'_id': ObjectId(attempt_id)},
+        # Update attempt; the completed guard stops a double submit from being counted twice
+        result = quiz_attempts_collection.update_one(
+            {'_id': ObjectId(attempt_id), 'completed': False},
             {
                 '$set': {
                     'answers': answers,
+                    'answer_string': submitted,
                     'score': score,
                     'correct_answers': correct_answers,
                     'time_taken': time_taken,
@@ -227,6 +321,11 @@ def submit_quiz(attempt_id):
                 }
             }
         )
+        if result.modified_count == 0:
+            return jsonify({'error': 'Quiz already completed'}), 400
+        user_stats.record_quiz_completed(user_id, score, passed)
+        new_achievements = achievement_engine.record(user_id, 'quiz_completed', passed=passed)
+        review_scheduler.record_attempts(attempt_doc['quiz_id'], answer_key, [(user_id, submitted, attempt_doc['_id'])])
         
         return jsonify({
             'success': True,
@@ -235,7 +334,8 @@ def submit_quiz(attempt_id):
             'total_questions': total_questions,
             'passed': passed,
             'time_taken': time_taken,
-            'detailed_results': detailed_results
+            'detailed_results': detailed_results,
+            'new_achievements': new_achievements
         }), 200
         
     except Exception as e:
@@ -244,32 +344,32 @@ def submit_quiz(attempt_id):
 @quiz_bp.route('/api/quiz/attempts', methods=['GET'])
 @jwt_required()
 def get_user_attempts():
-    """Get user's quiz attempts history"""
+    """Get user's quiz attempts history, newest first (?limit, ?cursor, ?fields)"""
     try:
         user_id = get_jwt_identity()
         
-        attempts = list(quiz_attempts_collection.find(
+        fields = selected_fields(request.args, ATTEMPT_FIELDS)
+        # Answers are never listed, for privacy
+        attempts, next_cursor = paginate(
+            quiz_attempts_collection,
             {'user_id': user_id},
-            {'answers': 0}  # Exclude answers for privacy
-        ).sort('started_at', -1))
-        
-        # Convert ObjectId to string
-        for attempt in attempts:
-            attempt['_id'] = str(attempt['_id'])
-            attempt['quiz_id'] = str(attempt['quiz_id'])
-            attempt['started_at'] = attempt['started_at'].isoformat()
-            if attempt.get('completed_at'):
-                attempt['completed_at'] = attempt['completed_at'].isoformat()
+            'started_at',
+            request.args,
+            {f: 1 for f in fields}
+        )
+        attempts = [serialize_doc(attempt, fields) for attempt in attempts]
         
-        return jsonify({'attempts': attempts}), 200
+        return jsonify({'attempts': attempts, 'next_cursor': next_cursor}), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Error retrieving attempts: {str(e)}'}), 500
 
 @quiz_bp.route('/api/quiz/available', methods=['GET'])
 @jwt_required()
 def get_available_quizzes():
-    """Get available quizzes by subject"""
+    """Get available quizzes by subject, newest first (?limit, ?cursor, ?fields)"""
     try:
         subject = request.args.get('subject')
         
@@ -277,23 +377,22 @@ def get_available_quizzes():
         if subject:
             query['subject'] = subject
         
-        quizzes = list(quizzes_collection.find(query).sort('created_at', -1))
-        
-        # Convert ObjectId to string
-        for quiz in quizzes:
-            quiz['_id'] = str(quiz['_id'])
-            quiz['created_at'] = quiz['created_at'].isoformat()
-            # Remove questions for list view
-            quiz.pop('questions', None)
+        # Questions are never fetched for the list view
+        fields = selected_fields(request.args, QUIZ_LIST_FIELDS)
+        quizzes, next_cursor = paginate(quizzes_collection, query, 'created_at', request.args, {f: 1 for f in fields})
+        quizzes = [serialize_doc(quiz, fields) for quiz in quizzes]
         
-        return jsonify({'quizzes': quizzes}), 200
+        return jsonify({'quizzes': quizzes, 'next_cursor': next_cursor}), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Error retrieving quizzes: {str(e)}'}), 500 
 
 @quiz_bp.route('/api/quiz/test_gemini', methods=['POST'])
+@jwt_required(optional=True)
 def test_gemini():
-    """Test Gemini question generation directly (no auth, for debugging)"""
+    """Test Gemini question generation directly (no auth, for debugging; async jobs need a token so only their owner can read them)"""
     try:
         data = request.get_json()
         subject = data.get('subject', 'Mathematics')
@@ -301,6 +400,17 @@ def test_gemini():
         difficulty = data.get('difficulty', 'medium')
         num_questions = int(data.get('num_questions', 5))
         exam_type = data.get('exam_type', 'WAEC')
+        if data.get('async'):
+            if not get_jwt_identity():
+                return jsonify({'error': 'Async generation requires authentication'}), 401
+            job_id = job_queue.enqueue('questions_generate', {
+                'subject': subject,
+                'topic': topic,
+                'difficulty': difficulty,
+                'num_questions': num_questions,
+                'exam_type': exam_type
+            }, user_id=get_jwt_identity())
+            return job_accepted_response(job_id)
         # Call Gemini-powered function
         questions = ai_tutor_service.generate_questions(
             subject=subject,
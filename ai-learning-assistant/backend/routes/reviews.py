@@ -0,0 +1,43 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from services.review_scheduler import review_scheduler
+
+reviews_bp = Blueprint('reviews', __name__)
+
+@reviews_bp.route('/api/reviews/now', methods=['GET'])
+@jwt_required()
+def get_review_queue():
+    """Questions due for review today, most overdue first"""
+    try:
+        queue = review_scheduler.queue(get_jwt_identity())
+
+        return jsonify({
+            'items': queue['items'],
+            'due': queue['due'],
+            'computed_at': queue['computed_at'].isoformat()
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': f'Error retrieving review queue: {str(e)}'}), 500
+
+@reviews_bp.route('/api/reviews/<item_id>', methods=['POST'])
+@jwt_required()
+def submit_review(item_id):
+    """Answer a review question ({answer}, or a self-graded {quality} from 0 to 5) and reschedule it"""
+    try:
+        data = request.get_json() or {}
+        quality = data.get('quality')
+
+        try:
+            result = review_scheduler.review(
+                get_jwt_identity(), item_id, data.get('answer'), int(quality) if quality is not None else None
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not result:
+            return jsonify({'error': 'Review item not found'}), 404
+
+        return jsonify({'success': True, **result}), 200
+
+    except Exception as e:
+        return jsonify({'error': f'Error submitting review: {str(e)}'}), 500
@@ -1,45 +1,64 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
 from datetime import datetime
 from bson import ObjectId
 import os
+import json
+import time
+from services.user_stats import user_stats
+from services.chat_relay import chat_relay, message_to_dict
+from services.message_store import message_store
+from services.profile_cache import profile_cache
+from services.group_discovery import group_discovery
+from services.group_membership import group_membership
+from utils.streams import create_stream_token, event_stream_response, read_stream_token
 
 study_groups_bp = Blueprint('study_groups', __name__)
 
 # MongoDB collections - will be set up in main app
 study_groups_collection = None
-group_messages_collection = None
 group_resources_collection = None
 
+CHAT_HISTORY_LIMIT = int(os.getenv('CHAT_HISTORY_LIMIT', 200))
+CHAT_STREAM_MAX_SECONDS = 300
+CHAT_KEEPALIVE_SECONDS = 15
+
 def init_collections(db_instance):
-    global study_groups_collection, group_messages_collection, group_resources_collection
+    global study_groups_collection, group_resources_collection
     study_groups_collection = db_instance.study_groups
-    group_messages_collection = db_instance.group_messages
     group_resources_collection = db_instance.group_resources
 
+def load_messages(group_id, since=None, limit=CHAT_HISTORY_LIMIT):
+    """Messages after the since id, or the latest ones, oldest first"""
+    if since:
+        return message_store.after([group_id], ObjectId(since), limit)
+    return message_store.tail(group_id, limit)
+
 @study_groups_bp.route('/api/groups', methods=['GET'])
 @jwt_required()
 def get_study_groups():
-    """Get all available study groups"""
+    """Discover study groups: public ones and the user's own (?scope=mine for only those).
+
+    Supports ?subject, ?topic, ?grade_level filters, ?q text search, and
+    ?limit/?cursor pagination; results best matching the user's subjects
+    and grade come first."""
     try:
         user_id = get_jwt_identity()
-        
-        # Get public groups and groups user is member of
-        groups = list(study_groups_collection.find({
-            '$or': [
-                {'is_public': True},
-                {'members': user_id}
-            ]
-        }).sort('last_activity', -1))
+        profile = profile_cache.get(user_id) or {}
+        groups, next_cursor = group_discovery.list_groups(user_id, profile, request.args)
         
         # Convert ObjectId to string
         for group in groups:
             group['_id'] = str(group['_id'])
             group['created_at'] = group['created_at'].isoformat()
             group['last_activity'] = group['last_activity'].isoformat()
+            group['member_count'] = group.get('member_count', len(group['members']))
+            group['is_member'] = user_id in group['members']
         
-        return jsonify({'groups': groups}), 200
+        return jsonify({'groups': groups, 'next_cursor': next_cursor}), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Error retrieving groups: {str(e)}'}), 500
 
@@ -57,6 +76,8 @@ def create_study_group():
         topic = data.get('topic')
         max_members = data.get('max_members', 10)
         is_public = data.get('is_public', True)
+        # Discovery ranks groups by grade; default to the creator's grade level
+        grade_level = data.get('grade_level') or (profile_cache.get(user_id) or {}).get('grade_level', '')
         
         if not all([name, description, subject, topic]):
             return jsonify({'error': 'Name, description, subject, and topic are required'}), 400
@@ -66,8 +87,10 @@ def create_study_group():
             'description': description,
             'subject': subject,
             'topic': topic,
+            'grade_level': grade_level,
             'created_by': user_id,
             'members': [user_id],  # Creator is automatically a member
+            'member_count': 1,
             'max_members': max_members,
             'is_public': is_public,
             'created_at': datetime.utcnow(),
@@ -76,6 +99,7 @@ def create_study_group():
         
         result = study_groups_collection.insert_one(group_data)
         group_data['_id'] = result.inserted_id
+        user_stats.record_group_membership(user_id, 1)
         
         return jsonify({
             'success': True,
@@ -98,23 +122,17 @@ def join_study_group(group_id):
     try:
         user_id = get_jwt_identity()
         
-        group = study_groups_collection.find_one({'_id': ObjectId(group_id)})
-        if not group:
+        status = group_membership.join(ObjectId(group_id), user_id)
+        if status == 'not_found':
             return jsonify({'error': 'Group not found'}), 404
         
-        if user_id in group['members']:
+        if status == 'already_member':
             return jsonify({'error': 'You are already a member of this group'}), 400
         
-        if len(group['members']) >= group['max_members']:
+        if status == 'full':
             return jsonify({'error': 'Group is full'}), 400
         
-        study_groups_collection.update_one(
-            {'_id': ObjectId(group_id)},
-            {
-                '$push': {'members': user_id},
-                '$set': {'last_activity': datetime.utcnow()}
-            }
-        )
+        user_stats.record_group_membership(user_id, 1)
         
         return jsonify({'success': True, 'message': 'Successfully joined group'}), 200
         
@@ -128,23 +146,17 @@ def leave_study_group(group_id):
     try:
         user_id = get_jwt_identity()
         
-        group = study_groups_collection.find_one({'_id': ObjectId(group_id)})
-        if not group:
+        status = group_membership.leave(ObjectId(group_id), user_id)
+        if status == 'not_found':
             return jsonify({'error': 'Group not found'}), 404
         
-        if user_id not in group['members']:
+        if status == 'not_member':
             return jsonify({'error': 'You are not a member of this group'}), 400
         
-        if user_id == group['created_by']:
+        if status == 'creator':
             return jsonify({'error': 'Group creator cannot leave. Transfer ownership or delete the group.'}), 400
         
-        study_groups_collection.update_one(
-            {'_id': ObjectId(group_id)},
-            {
-                '$pull': {'members': user_id},
-                '$set': {'last_activity': datetime.utcnow()}
-            }
-        )
+        user_stats.record_group_membership(user_id, -1)
         
         return jsonify({'success': True, 'message': 'Successfully left group'}), 200
         
@@ -166,19 +178,18 @@ def get_group_messages(group_id):
         if user_id not in group['members']:
             return jsonify({'error': 'You are not a member of this group'}), 403
         
-        # Get messages
-        messages = list(group_messages_collection.find(
-            {'group_id': ObjectId(group_id)}
-        ).sort('created_at', 1))
+        since = request.args.get('since')
+        if since and not ObjectId.is_valid(since):
+            return jsonify({'error': 'Invalid since message id'}), 400
+        limit = min(int(request.args.get('limit', CHAT_HISTORY_LIMIT)), CHAT_HISTORY_LIMIT)
         
-        # Convert ObjectId to string
-        for message in messages:
-            message['_id'] = str(message['_id'])
-            message['group_id'] = str(message['group_id'])
-            message['created_at'] = message['created_at'].isoformat()
+        # Backfill after ?since, otherwise the latest messages, oldest first
+        messages = [message_to_dict(m) for m in load_messages(ObjectId(group_id), since, limit)]
         
         return jsonify({'messages': messages}), 200
         
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
     except Exception as e:
         return jsonify({'error': f'Error retrieving messages: {str(e)}'}), 500
 
@@ -204,21 +215,18 @@ def send_group_message(group_id):
         if user_id not in group['members']:
             return jsonify({'error': 'You are not a member of this group'}), 403
         
-        # Get user name
-        from app import users_collection
-        user = users_collection.find_one({'_id': ObjectId(user_id)})
-        user_name = user['full_name'] if user else 'Unknown User'
+        # Get user name (cached; no user read on the hot path)
+        profile = profile_cache.get(user_id)
+        user_name = profile['name'] if profile else 'Unknown User'
         
-        message_data = {
-            'group_id': ObjectId(group_id),
+        message_data = message_store.append(ObjectId(group_id), {
             'user_id': user_id,
             'content': content,
             'message_type': message_type,
             'user_name': user_name,
             'created_at': datetime.utcnow()
-        }
-        
-        result = group_messages_collection.insert_one(message_data)
+        })
+        chat_relay.publish(message_data)
         
         # Update group last activity
         study_groups_collection.update_one(
@@ -229,7 +237,7 @@ def send_group_message(group_id):
         return jsonify({
             'success': True,
             'message': {
-                'id': str(result.inserted_id),
+                'id': str(message_data['_id']),
                 'content': content,
                 'user_name': user_name,
                 'created_at': message_data['created_at'].isoformat()
@@ -239,6 +247,76 @@ def send_group_message(group_id):
     except Exception as e:
         return jsonify({'error': f'Error sending message: {str(e)}'}), 500
 
+@study_groups_bp.route('/api/groups/<group_id>/messages/stream-token', methods=['POST'])
+@jwt_required()
+def create_message_stream_token(group_id):
+    """Short-lived token for opening this group's message stream with EventSource, which cannot send headers"""
+    try:
+        user_id = get_jwt_identity()
+        group = study_groups_collection.find_one({'_id': ObjectId(group_id)}, {'members': 1}) if ObjectId.is_valid(group_id) else None
+        if not group:
+            return jsonify({'error': 'Group not found'}), 404
+        if user_id not in group['members']:
+            return jsonify({'error': 'You are not a member of this group'}), 403
+        
+        return jsonify({'token': create_stream_token(user_id, f'chat:{group_id}')}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Error creating stream token: {str(e)}'}), 500
+
+@study_groups_bp.route('/api/groups/<group_id>/messages/stream', methods=['GET'])
+def stream_group_messages(group_id):
+    """Server-sent events stream of new group messages.
+
+    Authenticated by a ?token= from the stream-token route, so the session
+    JWT never appears in a URL, or by the usual Authorization header.
+    Resumes after the Last-Event-ID header EventSource sends on reconnect,
+    or else after ?since, so clients never need to poll the message list."""
+    user_id = read_stream_token(request.args.get('token'), f'chat:{group_id}')
+    if user_id is None:
+        # Raises the usual 401 when there is no valid header token either
+        verify_jwt_in_request(locations=['headers'])
+        user_id = get_jwt_identity()
+    group = study_groups_collection.find_one({'_id': ObjectId(group_id)}, {'members': 1}) if ObjectId.is_valid(group_id) else None
+    if not group:
+        return jsonify({'error': 'Group not found'}), 404
+    if user_id not in group['members']:
+        return jsonify({'error': 'You are not a member of this group'}), 403
+    # On reconnect the URL still carries the original ?since; the header is newer
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    if since and not ObjectId.is_valid(since):
+        since = None
+    
+    def events():
+        # Subscribe before backfilling so nothing sent in between is lost
+        sub = chat_relay.subscribe(group['_id'])
+        sent = set()
+        try:
+            if since:
+                for message in load_messages(group['_id'], since, CHAT_HISTORY_LIMIT):
+                    payload = message_to_dict(message)
+                    sent.add(payload['_id'])
+                    yield f"id: {payload['_id']}\nevent: message\ndata: {json.dumps(payload)}\n\n"
+            deadline = time.time() + CHAT_STREAM_MAX_SECONDS
+            while time.time() < deadline:
+                payload = sub.get(timeout=CHAT_KEEPALIVE_SECONDS)
+                if sub.overflowed:
+                    # Too far behind: the client reconnects and backfills from its last id
+                    yield "event: reset\ndata: {}\n\n"
+                    return
+                if payload is None:
+                    yield ": keepalive\n\n"
+                elif payload['_id'] not in sent:
+                    sent.add(payload['_id'])
+                    yield f"id: {payload['_id']}\nevent: message\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            chat_relay.unsubscribe(sub)
+    
+    response = event_stream_response(events(), budget='chat')
+    if response is None:
+        return jsonify({'error': 'Too many open streams, please retry shortly'}), 503
+    return response
+
 @study_groups_bp.route('/api/groups/<group_id>/resources', methods=['GET'])
 @jwt_required()
 def get_group_resources(group_id):
@@ -335,18 +413,9 @@ def get_study_group_details(group_id):
         if not group['is_public'] and user_id not in group['members']:
             return jsonify({'error': 'You do not have access to this group'}), 403
         
-        # Get member details
-        from app import users_collection
-        members = []
-        for member_id in group['members']:
-            user = users_collection.find_one({'_id': ObjectId(member_id)})
-            if user:
-                members.append({
-                    'id': str(user['_id']),
-                    'name': user['full_name'],
-                    'grade_level': user.get('grade_level', ''),
-                    'subjects': user.get('subjects', [])
-                })
+        # Get member details with one batched lookup
+        profiles = profile_cache.get_many(group['members'])
+        members = [profiles[str(member_id)] for member_id in group['members'] if str(member_id) in profiles]
         
         group['_id'] = str(group['_id'])
         group['created_at'] = group['created_at'].isoformat()
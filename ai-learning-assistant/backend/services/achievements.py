@@ -0,0 +1,152 @@
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import PyMongoError
+from services.user_stats import user_id_forms
+
+logger = logging.getLogger("gemini.achievements")
+
+# A rule is earned once its counter reaches the threshold; add rules here without touching history
+ACHIEVEMENT_RULES = [
+    {'id': 'first_session', 'title': 'First Step', 'description': 'Completed your first study session', 'icon': '🎯', 'counter': 'sessions', 'threshold': 1},
+    {'id': 'dedicated_learner', 'title': 'Dedicated Learner', 'description': 'Completed 10 study sessions', 'icon': '📚', 'counter': 'sessions', 'threshold': 10},
+    {'id': 'study_master', 'title': 'Study Master', 'description': 'Completed 50 study sessions', 'icon': '🏆', 'counter': 'sessions', 'threshold': 50},
+    {'id': 'first_quiz', 'title': 'Quiz Explorer', 'description': 'Completed your first quiz', 'icon': '🧠', 'counter': 'quizzes', 'threshold': 1},
+    {'id': 'quiz_champion', 'title': 'Quiz Champion', 'description': 'Passed 5 quizzes', 'icon': '🥇', 'counter': 'quizzes_passed', 'threshold': 5},
+    {'id': 'helpful_explanations', 'title': 'Helpful Explanations', 'description': 'Rated 10+ explanations as very helpful', 'icon': '⭐', 'counter': 'high_ratings', 'threshold': 10},
+]
+
+HIGH_RATING = 4
+
+
+def _event_deltas(event: str, data: Dict) -> Dict[str, int]:
+    """Counter changes caused by a domain event"""
+    if event == 'session_created':
+        return {'sessions': 1}
+    if event == 'session_rated':
+        high = lambda rating: int((rating or 0) >= HIGH_RATING)
+        return {'high_ratings': high(data.get('new_rating')) - high(data.get('old_rating'))}
+    if event == 'quiz_started':
+        return {'quizzes': 1}
+    if event == 'quiz_completed':
+        return {'quizzes_passed': int(bool(data.get('passed')))}
+    raise ValueError(f"Unknown achievement event: {event}")
+
+
+def achievement_to_dict(rule: Dict, earned_at: datetime) -> Dict:
+    return {
+        'id': rule['id'],
+        'title': rule['title'],
+        'description': rule['description'],
+        'icon': rule['icon'],
+        'earned': True,
+        'earned_at': earned_at.isoformat()
+    }
+
+
+class AchievementEngine:
+    """Keeps per-user counters and awarded badges in one user_achievements document.
+
+    Events $inc the counters and award any rule whose threshold was crossed.
+    A user without a document is rebuilt from history with a few count
+    queries, after which history is never scanned again."""
+
+    def __init__(self, rules: Optional[List[Dict]] = None):
+        self.rules = rules or ACHIEVEMENT_RULES
+        self.collection = None
+        self.sessions_collection = None
+        self.quiz_attempts_collection = None
+
+    def init_collections(self, db_instance):
+        self.collection = db_instance.user_achievements
+        self.sessions_collection = db_instance.study_sessions
+        self.quiz_attempts_collection = db_instance.quiz_attempts
+
+    def record(self, user_id, event: str, **data) -> List[Dict]:
+        """Apply an event; returns achievements newly earned by it"""
+        if not user_id:
+            return []
+        inc = {f'counters.{k}': v for k, v in _event_deltas(event, data).items() if v}
+        if not inc:
+            return []
+        try:
+            doc = self.collection.find_one_and_update(
+                {'_id': str(user_id)}, {'$inc': inc}, return_document=ReturnDocument.AFTER
+            )
+            if doc is None:
+                # The triggering write is already in history, so a rebuild counts it
+                doc = self.rebuild(user_id)
+            return self._award(doc)
+        except PyMongoError as e:
+            logger.warning(f"Could not record achievement event {event} for {user_id}: {e}")
+            return []
+
+    def record_many(self, events: List[Tuple[str, Dict]], event: str) -> Dict[str, List[Dict]]:
+        """Apply the same event type for many users with one bulk write and one read.
+
+        events holds (user_id, data) pairs; returns newly earned achievements by user id."""
+        incs = {}
+        for user_id, data in events:
+            inc = {f'counters.{k}': v for k, v in _event_deltas(event, data).items() if v}
+            if user_id and inc:
+                incs[str(user_id)] = inc
+        if not incs:
+            return {}
+        try:
+            self.collection.bulk_write([UpdateOne({'_id': user_id}, {'$inc': inc}) for user_id, inc in incs.items()], ordered=False)
+            docs = {doc['_id']: doc for doc in self.collection.find({'_id': {'$in': list(incs)}})}
+            # Users without a document yet are rebuilt, which already counts this event
+            return {user_id: self._award(docs.get(user_id) or self.rebuild(user_id)) for user_id in incs}
+        except PyMongoError as e:
+            logger.warning(f"Could not record achievement event {event} for {len(incs)} users: {e}")
+            return {}
+
+    def _award(self, doc: Dict) -> List[Dict]:
+        counters, earned = doc.get('counters', {}), doc.get('earned', {})
+        awarded = []
+        for rule in self.rules:
+            if rule['id'] in earned or counters.get(rule['counter'], 0) < rule['threshold']:
+                continue
+            now = datetime.utcnow()
+            # Conditional so concurrent events award a badge exactly once
+            result = self.collection.update_one(
+                {'_id': doc['_id'], f"earned.{rule['id']}": {'$exists': False}},
+                {'$set': {f"earned.{rule['id']}": now}}
+            )
+            if result.modified_count:
+                awarded.append(achievement_to_dict(rule, now))
+        return awarded
+
+    def rebuild(self, user_id) -> Dict:
+        forms = user_id_forms(user_id)
+        counters = {
+            'sessions': self.sessions_collection.count_documents({'user_id': {'$in': forms}}),
+            'high_ratings': self.sessions_collection.count_documents({'user_id': {'$in': forms}, 'satisfaction_rating': {'$gte': HIGH_RATING}}),
+            'quizzes': self.quiz_attempts_collection.count_documents({'user_id': {'$in': forms}}),
+            'quizzes_passed': self.quiz_attempts_collection.count_documents({'user_id': {'$in': forms}, 'passed': True})
+        }
+        # Earned badges are kept: they are never revoked
+        return self.collection.find_one_and_update(
+            {'_id': str(user_id)},
+            {'$set': {'counters': counters}, '$setOnInsert': {'earned': {}}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    def get(self, user_id) -> List[Dict]:
+        """Earned achievements in rule order, from a single document read"""
+        doc = self.collection.find_one({'_id': str(user_id)})
+        if doc is None:
+            doc = self.rebuild(user_id)
+            self._award(doc)
+            doc = self.collection.find_one({'_id': str(user_id)})
+        earned = doc.get('earned', {})
+        return [achievement_to_dict(rule, earned[rule['id']]) for rule in self.rules if rule['id'] in earned]
+
+
+achievement_engine = AchievementEngine()
+
+
+def init_collections(db_instance):
+    achievement_engine.init_collections(db_instance)
@@ -0,0 +1,270 @@
+import os
+import math
+import random
+import logging
+from datetime import datetime
+from statistics import NormalDist
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from bson import ObjectId
+from pymongo import UpdateMany
+from models.quiz import ANSWER_KEY_UNKNOWN, SECRET_QUESTION_FIELDS, _letter, answer_string
+from services.item_analytics import point_biserial
+from services.question_bank import DIFFICULTY_PRIOR, make_bucket, question_bank
+
+logger = logging.getLogger("gemini.adaptive")
+
+ADAPTIVE_MAX_QUESTIONS = int(os.getenv('ADAPTIVE_MAX_QUESTIONS', 20))
+ADAPTIVE_TARGET_SE = float(os.getenv('ADAPTIVE_TARGET_SE', 0.3))
+IRT_MIN_RESPONSES = int(os.getenv('IRT_MIN_RESPONSES', 30))
+# Never stop before this many answers, however confident the estimate looks
+ADAPTIVE_MIN_QUESTIONS = 5
+# Items read on each side of the ability estimate; one of the most informative is served
+ADAPTIVE_CANDIDATES = 3
+# Bank payloads whose correct_answer is a single letter or digit; anything else cannot be scored
+SCORABLE = {'$regex': r'^\s*[A-Za-z0-9]\s*$'}
+
+POOL_FIELDS = ('subject', 'topic', 'exam_type')
+# Logistic scaling constant: a 2PL item with D matches the normal-ogive parameters
+D = 1.702
+THETA_GRID = np.linspace(-4, 4, 81)
+NORMAL = NormalDist()
+
+
+def probability(theta, a, b):
+    """2PL probability of a correct answer"""
+    return 1 / (1 + np.exp(-D * a * (theta - b)))
+
+
+def information(theta: float, a: float, b: float) -> float:
+    p = probability(theta, a, b)
+    return float(D ** 2 * a ** 2 * p * (1 - p))
+
+
+def estimate_ability(responses: List[Dict], prior_mean: float = 0.0) -> Tuple[float, float]:
+    """EAP ability estimate and its standard error, with a N(prior_mean, 1) prior"""
+    log_posterior = -0.5 * (THETA_GRID - prior_mean) ** 2
+    for r in responses:
+        p = probability(THETA_GRID, r['a'], r['b'])
+        log_posterior += np.log(p if r['correct'] else 1 - p)
+    weights = np.exp(log_posterior - log_posterior.max())
+    weights /= weights.sum()
+    theta = float((weights * THETA_GRID).sum())
+    return theta, float(math.sqrt((weights * (THETA_GRID - theta) ** 2).sum()))
+
+
+def irt_parameters(p_value: float, point_biserial_r: float) -> Tuple[float, float]:
+    """2PL (a, b) from an item's p-value and point-biserial, assuming abilities are N(0, 1).
+
+    Converts the point-biserial to a biserial correlation r and applies the
+    normal-ogive relations a = r / sqrt(1 - r^2), b = -z(p) / r."""
+    p = min(max(p_value, 0.01), 0.99)
+    z = NORMAL.inv_cdf(p)
+    biserial = point_biserial_r * math.sqrt(p * (1 - p)) / NORMAL.pdf(z)
+    # Non-discriminating items get a small a, so selection by information all but ignores them
+    r = min(max(biserial, 0.05), 0.95)
+    return round(r / math.sqrt(1 - r ** 2), 4), round(min(max(-z / r, -4.0), 4.0), 4)
+
+
+def scaled_score(theta: float) -> float:
+    """Ability as the percentage of the reference population below it"""
+    return round(NORMAL.cdf(theta) * 100, 1)
+
+
+class AdaptiveTesting:
+    """Computerized adaptive tests served from the question bank.
+
+    Bank questions carry 2PL parameters (irt_a, irt_b): seeded from their
+    difficulty label and refitted offline by calibrate() from the item
+    analytics sums. A session keeps an EAP ability estimate and after each
+    answer picks, among the few questions whose difficulty is nearest the
+    estimate on either side, one that is most informative there. Those reads
+    are two short range scans of a (subject, topic, exam_type, irt_b) index,
+    so selection is O(log n) in the bank size. A test stops when the standard
+    error reaches ADAPTIVE_TARGET_SE or after ADAPTIVE_MAX_QUESTIONS, and the
+    final estimate becomes the starting point of the user's next test in the
+    subject."""
+
+    def __init__(self):
+        self.sessions_collection = None
+        self.abilities_collection = None
+        self.bank_collection = None
+        self.question_stats_collection = None
+        # Pools this process has already seeded with prior IRT parameters
+        self._seeded_pools = set()
+
+    def init_collections(self, db_instance):
+        self.sessions_collection = db_instance.adaptive_sessions
+        self.abilities_collection = db_instance.user_abilities
+        self.bank_collection = db_instance.question_bank
+        self.question_stats_collection = db_instance.question_item_stats
+
+    def ability(self, user_id: str, subject: str) -> Dict:
+        subject = make_bucket(subject, '', None, None)['subject']
+        doc = self.abilities_collection.find_one({'user_id': user_id, 'subject': subject}, {'theta': 1, 'se': 1, 'tests': 1})
+        return doc or {'theta': 0.0, 'se': 1.0, 'tests': 0}
+
+    def _select(self, pool: Dict, theta: float, seen: List[str]) -> Optional[Dict]:
+        base = dict(pool, text_hash={'$nin': seen}, **{'payload.correct_answer': SCORABLE})
+        projection = {'text_hash': 1, 'payload': 1, 'irt_a': 1, 'irt_b': 1}
+        candidates = list(self.bank_collection.find(
+            dict(base, irt_b={'$gte': theta}), projection
+        ).sort('irt_b', 1).limit(ADAPTIVE_CANDIDATES))
+        candidates += list(self.bank_collection.find(
+            dict(base, irt_b={'$lt': theta}), projection
+        ).sort('irt_b', -1).limit(ADAPTIVE_CANDIDATES))
+        if not candidates:
+            return None
+        candidates.sort(key=lambda q: information(theta, q['irt_a'], q['irt_b']), reverse=True)
+        # Choosing among the best two keeps every student at a given ability from seeing the same item
+        item = random.choice(candidates[:2])
+        payload = item['payload']
+        return {
+            'text_hash': item['text_hash'],
+            'a': item['irt_a'],
+            'b': item['irt_b'],
+            'answer': _letter(payload.get('correct_answer'), ANSWER_KEY_UNKNOWN),
+            'explanation': payload.get('explanation', ''),
+            'question': {k: v for k, v in payload.items() if k not in SECRET_QUESTION_FIELDS}
+        }
+
+    def _seed_parameters(self, pool: Dict) -> int:
+        """Give questions stored before IRT parameters existed the prior of their difficulty label; returns questions seeded"""
+        seeded = 0
+        for difficulty, b in DIFFICULTY_PRIOR.items():
+            seeded += self.bank_collection.update_many(
+                dict(pool, difficulty=difficulty, irt_b={'$exists': False}), {'$set': {'irt_a': 1.0, 'irt_b': b}}
+            ).modified_count
+        return seeded
+
+    def start(self, user_id: str, subject: str, topic: str, exam_type: Optional[str]) -> Optional[Dict]:
+        """Create a session and its first question; None if the bank has no questions for the topic yet.
+
+        Questions that predate IRT parameters are seeded the first time a
+        process serves their pool, rather than waiting for calibrate_irt.py."""
+        pool = {f: v for f, v in make_bucket(subject, topic, exam_type, None).items() if f in POOL_FIELDS}
+        prior = self.ability(user_id, subject)['theta']
+        key = tuple(sorted(pool.items()))
+        if key not in self._seeded_pools:
+            self._seed_parameters(pool)
+            self._seeded_pools.add(key)
+        first = self._select(pool, prior, [])
+        if first is None:
+            for difficulty in DIFFICULTY_PRIOR:
+                question_bank.request_refill(dict(pool, difficulty=difficulty))
+            return None
+        session = {
+            'user_id': user_id,
+            'subject': subject,
+            'topic': topic,
+            'pool': pool,
+            'prior': prior,
+            'theta': prior,
+            'se': 1.0,
+            'responses': [],
+            'current': first,
+            'completed': False,
+            'started_at': datetime.utcnow()
+        }
+        session['_id'] = self.sessions_collection.insert_one(session).inserted_id
+        return session
+
+    def get(self, session_id: str, user_id: str) -> Optional[Dict]:
+        if not ObjectId.is_valid(session_id):
+            return None
+        return self.sessions_collection.find_one({'_id': ObjectId(session_id), 'user_id': user_id})
+
+    def answer(self, session: Dict, question_id: str, answer) -> Dict:
+        """Score the answer to the current question, re-estimate ability and pick the next question.
+
+        Raises ValueError if the session is finished or question_id is not
+        its current question (e.g. a repeated submit)."""
+        current = session.get('current')
+        if session['completed'] or not current or current['text_hash'] != question_id:
+            raise ValueError('This question is not the current question of the session')
+        submitted = answer_string({'0': answer}, 1)
+        # Sessions started before keys were read with _letter may hold the blank placeholder as their key
+        key = _letter(current['answer'], ANSWER_KEY_UNKNOWN)
+        response = {
+            'text_hash': current['text_hash'],
+            'a': current['a'],
+            'b': current['b'],
+            'answer': submitted,
+            'correct': submitted == key
+        }
+        responses = session['responses'] + [response]
+        theta, se = estimate_ability(responses, session['prior'])
+        done = len(responses) >= ADAPTIVE_MAX_QUESTIONS or (len(responses) >= ADAPTIVE_MIN_QUESTIONS and se <= ADAPTIVE_TARGET_SE)
+        following = None if done else self._select(session['pool'], theta, [r['text_hash'] for r in responses])
+        now = datetime.utcnow()
+        update = {'theta': theta, 'se': se, 'current': following, 'completed': following is None}
+        if following is None:
+            update['completed_at'] = now
+        # Matching the current question makes a concurrent second answer a no-op
+        result = self.sessions_collection.update_one(
+            {'_id': session['_id'], 'completed': False, 'current.text_hash': current['text_hash']},
+            {'$push': {'responses': response}, '$set': update}
+        )
+        if not result.modified_count:
+            raise ValueError('This question is not the current question of the session')
+        if following is None:
+            self.abilities_collection.update_one(
+                {'user_id': session['user_id'], 'subject': session['pool']['subject']},
+                {'$set': {'theta': theta, 'se': se, 'updated_at': now}, '$inc': {'tests': 1}},
+                upsert=True
+            )
+        session.update(update, responses=responses)
+        return {
+            'is_correct': response['correct'],
+            'correct_answer': current['answer'],
+            'explanation': current['explanation']
+        }
+
+    def calibrate(self, min_responses: int = IRT_MIN_RESPONSES, batch_size: int = 500) -> int:
+        """Refit irt_a/irt_b of bank questions with at least min_responses scored answers; returns items fitted.
+
+        Reads the running sums kept by item analytics, so run
+        update_item_analytics.py first. Adaptive responses are not used:
+        they come from ability-matched students and would bias the fit."""
+        now = datetime.utcnow()
+        fitted, ops = 0, []
+        for doc in self.question_stats_collection.find({'n': {'$gte': min_responses}}):
+            discrimination = point_biserial(doc['n'], doc['correct'], doc['sum_rest'], doc['sum_rest2'], doc['sum_rest_correct'])
+            if np.isnan(discrimination):
+                continue
+            a, b = irt_parameters(doc['correct'] / doc['n'], float(discrimination))
+            ops.append(UpdateMany({'text_hash': doc['_id']}, {'$set': {
+                'irt_a': a, 'irt_b': b, 'irt_responses': doc['n'], 'irt_calibrated_at': now
+            }}))
+            if len(ops) >= batch_size:
+                fitted += self.bank_collection.bulk_write(ops, ordered=False).matched_count
+                ops = []
+        if ops:
+            fitted += self.bank_collection.bulk_write(ops, ordered=False).matched_count
+        self._seed_parameters({})
+        logger.info(f"IRT calibration: fitted {fitted} bank questions")
+        return fitted
+
+
+def session_to_dict(session: Dict) -> Dict:
+    responses = session['responses']
+    current = session.get('current')
+    return {
+        'id': str(session['_id']),
+        'subject': session['subject'],
+        'topic': session['topic'],
+        'completed': session['completed'],
+        'questions_answered': len(responses),
+        'correct_answers': sum(1 for r in responses if r['correct']),
+        'ability': round(session['theta'], 3),
+        'standard_error': round(session['se'], 3),
+        'score': scaled_score(session['theta']),
+        'question': dict(current['question'], id=current['text_hash']) if current else None
+    }
+
+
+adaptive_testing = AdaptiveTesting()
+
+
+def init_collections(db_instance):
+    adaptive_testing.init_collections(db_instance)
@@ -1,9 +1,13 @@
 import os
-from typing import Dict, List, Optional
-import google.generativeai as genai  # type: ignore
+from typing import Callable, Dict, Iterator, List, Optional
 import re
-import json
 import logging
+import threading
+from services.response_cache import response_cache
+from services.llm_provider import LLMProvider, get_provider
+from services.rate_limiter import SingleFlight
+from services.prompt_builder import build_questions_prompt
+from utils.json_stream import QuestionStreamParser
 
 # Removed genai.configure to avoid linter error
 
@@ -16,30 +20,120 @@ if not logger.handlers:
     handler.setFormatter(formatter)
     logger.addHandler(handler)
 
-class AITutorService:
+# Question fan-out: large requests are split into chunks of this size and
+# generated concurrently through the provider's batch_generate
+QUESTION_CHUNK_SIZE = int(os.getenv('QUESTION_CHUNK_SIZE', 5))
+# Identical concurrent generate_questions calls share one upstream generation
+_question_flights = SingleFlight()
+
+def clean_explanation(text: str) -> str:
+    """Strip markdown bullets/headings the frontend renders as plain text"""
+    text = text.strip()
+    text_clean = re.sub(r'^\*+|\*+$', '', text, flags=re.MULTILINE)
+    text_clean = re.sub(r'^#+', '', text_clean, flags=re.MULTILINE)
+    text_clean = text_clean.strip()
+    return text_clean or text
+
+class MarkdownStripper:
+    """Incremental version of clean_explanation for streamed chunks.
+
+    Text is released as soon as it cannot be affected by the line-anchored
+    regexes: a line's start is held until it contains something other than
+    '*' or '#', and trailing asterisks are held until the line continues."""
+
     def __init__(self):
-        # type: ignore is used to suppress linter errors for generativeai
-        self.model = genai.GenerativeModel('gemini-1.5-flash')  # type: ignore
+        self._line = ''
+        self._prefix_done = False
+        self._started = False
+
+    def _emit(self, text: str) -> str:
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
 
-    def generate_explanation(self, subject: str, topic: str, question: str, grade_level: Optional[str] = None) -> str:
-        """Generate AI-powered explanation for student questions"""
-        prompt = self._create_explanation_prompt(subject, topic, question, grade_level)
+    def feed(self, chunk: str) -> str:
+        out = []
+        for part in re.split(r'(\n)', chunk):
+            if part == '\n':
+                line = self._resolve_prefix(self._line) if not self._prefix_done else self._line
+                out.append(self._emit(re.sub(r'\*+$', '', line)))
+                if self._started:
+                    out.append('\n')
+                self._line, self._prefix_done = '', False
+                continue
+            self._line += part
+            if not self._prefix_done and self._line.strip('*#'):
+                self._line = self._resolve_prefix(self._line)
+                self._prefix_done = True
+            if self._prefix_done:
+                held = len(self._line) - len(self._line.rstrip('*'))
+                ready, self._line = self._line[:len(self._line) - held], self._line[len(self._line) - held:]
+                out.append(self._emit(ready))
+        return ''.join(out)
+
+    def flush(self) -> str:
+        line = self._resolve_prefix(self._line) if not self._prefix_done else self._line
+        self._line, self._prefix_done = '', False
+        return self._emit(re.sub(r'\*+$', '', line))
+
+    @staticmethod
+    def _resolve_prefix(line: str) -> str:
+        return re.sub(r'^#+', '', re.sub(r'^\*+', '', line))
+
+class AITutorService:
+    def __init__(self, provider: Optional[LLMProvider] = None):
+        # Backend is chosen by LLM_PROVIDER (gemini, or fake for offline load tests)
+        self.provider = provider or get_provider()
+
+    def generate_explanation(self, subject: str, topic: str, question: str, grade_level: Optional[str] = None,
+                             user_context: Optional[Dict] = None, conversation_history: Optional[List[Dict]] = None) -> str:
+        """Generate AI-powered explanation for student questions.
+
+        With conversation history the answer builds on the student's recent
+        exchanges, so it is neither served from nor stored in the shared cache."""
+        personal = bool(conversation_history)
+        cached = None if personal else response_cache.get(subject, topic, question, grade_level)
+        if cached is not None:
+            return cached
+        prompt = self._create_explanation_prompt(subject, topic, question, grade_level, user_context, conversation_history)
         try:
-            response = self.model.generate_content(prompt)
-            text = response.text.strip()
-            text_clean = re.sub(r'^\*+|\*+$', '', text, flags=re.MULTILINE)
-            text_clean = re.sub(r'^#+', '', text_clean, flags=re.MULTILINE)
-            text_clean = text_clean.strip()
-            if not text_clean:
-                text_clean = text
+            text_clean = clean_explanation(self.provider.generate(prompt))
+            if not personal:
+                response_cache.set(subject, topic, question, grade_level, text_clean)
             return text_clean
         except Exception as e:
             logger.error(f"Gemini explanation error: {e}")
             return f"Error: {str(e)}"
 
-    def _validate_questions(self, questions, num_questions):
+    def generate_explanation_stream(self, subject: str, topic: str, question: str, grade_level: Optional[str] = None,
+                                    user_context: Optional[Dict] = None, conversation_history: Optional[List[Dict]] = None) -> Iterator[str]:
+        """Stream an explanation as cleaned text chunks; the generator returns the full cleaned text"""
+        personal = bool(conversation_history)
+        cached = None if personal else response_cache.get(subject, topic, question, grade_level)
+        if cached is not None:
+            yield cached
+            return cached
+        prompt = self._create_explanation_prompt(subject, topic, question, grade_level, user_context, conversation_history)
+        stripper = MarkdownStripper()
+        raw = []
+        for text in self.provider.generate_stream(prompt):
+            raw.append(text)
+            cleaned = stripper.feed(text)
+            if cleaned:
+                yield cleaned
+        tail = stripper.flush()
+        if tail:
+            yield tail
+        # Persist exactly what the non-streaming path would have produced
+        text_clean = clean_explanation(''.join(raw))
+        if not personal:
+            response_cache.set(subject, topic, question, grade_level, text_clean)
+        return text_clean
+
+    def _validate_questions(self, questions, num_questions, seen=None):
         # Flexible validation for practice questions (explanation-based)
-        seen = set()
+        seen = set() if seen is None else seen
         valid_questions = []
         for q in questions:
             q_text = q.get('question', '').strip()
@@ -53,118 +147,110 @@ class AITutorService:
                 break
         return valid_questions
 
-    def generate_questions(self, subject: str, topic: str, difficulty: str = "medium", num_questions: int = 5, exam_type: Optional[str] = None, exclude_questions: Optional[list] = None) -> List[Dict]:
-        """Unified Gemini-powered question generator for quizzes and practice, with subject/topic enforcement and separation."""
-        exam_context = {
-            "WAEC": "West African Examinations Council (WAEC) style questions",
-            "JAMB": "Joint Admissions and Matriculation Board (JAMB) style questions",
-            "NECO": "National Examinations Council (NECO) style questions",
-            "IGCSE": "International General Certificate of Secondary Education style questions"
-        }
-        exclude_text = ''
-        if exclude_questions:
-            exclude_text = '\nDo NOT repeat or reuse any of these questions:'
-            for q in exclude_questions:
-                exclude_text += f"\n- {q}"
-        if not exam_type or exam_type.lower() == 'practice':
-            prompt_template = f'''
-Generate {num_questions} practice questions for the subject: {subject}, topic: {topic}.
-Requirements:
-- Each question must be open-ended and require a written explanation.
-- Each question must be unique, not repeated, and strictly related to the subject and topic provided.
-- Do NOT use multiple choice, options, or correct answer letters.
-- Do NOT include questions from other subjects or topics.
-- For each question, provide a clear, step-by-step explanation as the answer.
-{exclude_text}
-Return as a JSON array:
-{{
-  "questions": [
-    {{
-      "question": "...",
-      "explanation": "..."
-    }}
-  ]
-}}
-Make sure the JSON is valid and properly formatted.
-'''
-        else:
-            style = exam_context.get(exam_type, exam_context["WAEC"])
-            prompt_template = f'''
-Generate {num_questions} unique multiple choice questions for the subject: {subject}, topic: {topic}.
-Requirements:
-- Each question must be different, not repeated, and strictly related to the subject and topic provided.
-- Each question must be unique and not similar to any other in the set.
-- Style: {style}
-- Difficulty: {difficulty}
-- Format: Each question should have 4 options (A, B, C, D)
-- Include explanations for correct answers
-- Questions should be objective and test understanding
-- Use Nigerian context where appropriate
-- For each question, specify the exam type (e.g., 'WAEC', 'JAMB', 'NECO') and the year (e.g., '2019', '2021') the question is drafted from. Use realistic years between 2015 and 2023. If the question is not from a real past exam, make a plausible year and type.
-- Do NOT include any questions from other subjects or topics.
-{exclude_text}
-You must return exactly {num_questions} unique questions in a valid JSON array as shown below. Do not repeat any question. Do not return only one question. Each question must have exam_type and exam_year fields.
-Return the questions in this exact JSON format:
-{{
-    "questions": [
-        {{
-            "question": "Question text here?",
-            "options": {{
-                "A": "Option A",
-                "B": "Option B", 
-                "C": "Option C",
-                "D": "Option D"
-            }},
-            "correct_answer": "A",
-            "explanation": "Explanation of why this is correct",
-            "difficulty": "{difficulty}",
-            "topic": "{topic}",
-            "exam_type": "{exam_type}",
-            "exam_year": "2019"
-        }}
-    ]
-}}
-Make sure the JSON is valid and properly formatted.
-'''
+    def _build_questions_prompt(self, subject: str, topic: str, difficulty: str, num_questions: int, exam_type: Optional[str], exclude_questions: Optional[list] = None, batch_hint: str = '') -> str:
+        return build_questions_prompt(subject, topic, difficulty, num_questions, exam_type, exclude_questions, batch_hint)
+
+    def _read_questions(self, chunks: Iterator[str], on_question: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """Raw (unvalidated) question dicts from one streamed model response.
+        Each question is parsed, and handed to on_question, as soon as its closing brace arrives;
+        well-formed questions are salvaged from malformed or truncated responses."""
+        parser = QuestionStreamParser()
+        questions, raw = [], []
+        try:
+            for chunk in chunks:
+                raw.append(chunk)
+                for q in parser.feed(chunk):
+                    questions.append(q)
+                    if on_question:
+                        on_question(q)
+        except Exception as e:
+            if not questions:
+                raise
+            logger.warning(f"Gemini stream failed after {len(questions)} questions, keeping them: {e}")
+        finally:
+            logger.info(f"Gemini raw response: {''.join(raw).strip()}")
+        if parser.malformed:
+            logger.warning(f"Skipped {parser.malformed} malformed JSON object(s) in Gemini response")
+        if not questions:
+            raise ValueError("No question objects found in Gemini response")
+        return questions
+
+    def generate_questions(self, subject: str, topic: str, difficulty: str = "medium", num_questions: int = 5, exam_type: Optional[str] = None, exclude_questions: Optional[list] = None, allow_fallback: bool = True, progress_callback: Optional[Callable] = None) -> List[Dict]:
+        """Unified Gemini-powered question generator for quizzes and practice, with subject/topic enforcement and separation.
+        Large requests are split into chunks generated concurrently; each round only re-requests the missing count.
+        With allow_fallback=False an empty list is returned instead of static fallback questions.
+        progress_callback(done, total, message) is called as generation proceeds.
+        Concurrent identical calls are coalesced into a single generation."""
+        key = (subject, topic, difficulty, num_questions, exam_type, tuple(exclude_questions or ()), allow_fallback)
+        questions = _question_flights.do(key, lambda progress: self._generate_questions(
+            subject, topic, difficulty, num_questions, exam_type, exclude_questions, allow_fallback, progress
+        ), progress_callback)
+        return [dict(q) for q in questions]
+
+    def _generate_questions(self, subject, topic, difficulty, num_questions, exam_type, exclude_questions, allow_fallback, progress_callback) -> List[Dict]:
+        progress = progress_callback or (lambda done, total, message='': None)
         max_attempts = 3
         attempts = 0
         last_error = None
+        # Exclusions trimmed from the prompt are still enforced here
+        seen = {q.strip().lower() for q in exclude_questions or []}
+        valid_questions = []
+        lock = threading.Lock()
+
+        def accept(q):
+            # Validate each question the moment the stream parser completes it
+            with lock:
+                if len(valid_questions) >= num_questions or not self._validate_questions([q], 1, seen):
+                    return
+                valid_questions.append(q)
+                done = len(valid_questions)
+            progress(done, num_questions, f"{done}/{num_questions} questions validated")
+
         logger.info(f"Gemini subject: {subject}, topic: {topic}, exam_type: {exam_type}, num_questions: {num_questions}")
-        while attempts < max_attempts:
-            prompt = prompt_template
-            logger.info(f"Gemini prompt: {prompt}")
-            try:
-                response = self.model.generate_content(prompt)
-                response_text = response.text.strip()
-                logger.info(f"Gemini raw response: {response_text}")
-                if '```json' in response_text:
-                    json_start = response_text.find('```json') + 7
-                    json_end = response_text.find('```', json_start)
-                    response_text = response_text[json_start:json_end].strip()
-                elif '```' in response_text:
-                    json_start = response_text.find('```') + 3
-                    json_end = response_text.find('```', json_start)
-                    response_text = response_text[json_start:json_end].strip()
-                response_text = self._repair_json(response_text)
-                questions_data = json.loads(response_text)
-                logger.info(f"Parsed questions: {questions_data.get('questions', [])}")
-                questions = questions_data.get('questions', [])
-                valid_questions = self._validate_questions(questions, num_questions)
-                if valid_questions:
-                    return valid_questions
-                else:
-                    logger.warning(f"Gemini did not return any valid questions.")
-            except Exception as e:
-                logger.error(f"Error generating questions: {e}")
-                last_error = str(e)
+        while attempts < max_attempts and len(valid_questions) < num_questions:
+            missing = num_questions - len(valid_questions)
+            chunks = [min(QUESTION_CHUNK_SIZE, missing - i) for i in range(0, missing, QUESTION_CHUNK_SIZE)]
+            # Later rounds must not repeat what earlier rounds already produced
+            exclude = list(exclude_questions or []) + [q['question'] for q in valid_questions]
+            progress(len(valid_questions), num_questions, f"Requesting {missing} questions in {len(chunks)} chunk(s) (attempt {attempts + 1}/{max_attempts})")
+            prompts = []
+            for i, size in enumerate(chunks):
+                batch_hint = f"\nThis is batch {i + 1} of {len(chunks)}; cover different aspects of the topic than the other batches." if len(chunks) > 1 else ''
+                prompts.append(self._build_questions_prompt(subject, topic, difficulty, size, exam_type, exclude, batch_hint))
+                logger.info(f"Gemini prompt: {prompts[-1]}")
+            for result in self.provider.batch_generate(prompts, lambda stream: self._read_questions(stream, accept)):
+                if isinstance(result, Exception):
+                    logger.error(f"Error generating questions: {result}")
+                    last_error = str(result)
             attempts += 1
+        if valid_questions:
+            if len(valid_questions) < num_questions:
+                logger.warning(f"Gemini returned {len(valid_questions)}/{num_questions} valid questions after {attempts} attempts.")
+            return valid_questions
+        if not allow_fallback:
+            logger.warning(f"No valid questions after {attempts} attempts. Last error: {last_error}")
+            return []
         logger.warning(f"Falling back to static questions after {attempts} attempts. Last error: {last_error}")
         fallback = self._get_fallback_questions(subject, topic, num_questions, exam_type)
         return fallback
 
-    def _create_explanation_prompt(self, subject: str, topic: str, question: str, grade_level: Optional[str]) -> str:
+    def _create_explanation_prompt(self, subject: str, topic: str, question: str, grade_level: Optional[str],
+                                   user_context: Optional[Dict] = None, conversation_history: Optional[List[Dict]] = None) -> str:
         grade_context = f"for a {grade_level} student" if grade_level else "for a secondary school student"
-        return f'''
+        student = ''
+        if user_context:
+            student = f"""
+Student Information:
+- Subjects: {', '.join(user_context.get('subjects') or []) or 'Not specified'}
+- Recent Topics: {', '.join(user_context.get('recent_topics') or []) or 'None'}
+"""
+        history = ''
+        if conversation_history:
+            # Newest first; the three latest exchanges are enough to build on
+            history = "\nRecent Conversation History (build on it where relevant):\n" + '\n'.join(
+                f"- Q: {h.get('question', '')} | A: {h.get('ai_response', '')[:100]}..." for h in conversation_history[:3]
+            ) + '\n'
+        return f'''{student}{history}
 Subject: {subject}
 Topic: {topic}
 Student's Question: {question}
@@ -173,11 +259,6 @@ Please provide a clear, step-by-step explanation {grade_context}.
 Use simple language. Focus on the calculation and final answer. Answer concisely in 2-4 sentences. Do not include extra examples or encouragement.
 '''
 
-    def _repair_json(self, text: str) -> str:
-        text = re.sub(r',([ \t\r\n]*[}}\]])', r'\1', text)
-        text = text.replace('“', '"').replace('”', '"').replace("‘", "'").replace("’", "'")
-        return text
-
     def _get_fallback_questions(self, subject, topic, num_questions, exam_type):
         # Subject-specific, explanation-based fallback questions
         fallback_questions = {
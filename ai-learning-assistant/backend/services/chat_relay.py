@@ -0,0 +1,136 @@
+import os
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Set
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger("gemini.chat")
+
+CHAT_POLL_INTERVAL = float(os.getenv('CHAT_POLL_INTERVAL', 0.5))
+# ObjectIds from other workers can become visible slightly out of order; re-read this window
+CHAT_LOOKBACK_SECONDS = 5
+CHAT_SUBSCRIBER_QUEUE = 256
+
+
+def message_to_dict(message_doc):
+    return {
+        '_id': str(message_doc['_id']),
+        'group_id': str(message_doc['group_id']),
+        'user_id': message_doc.get('user_id'),
+        'content': message_doc.get('content'),
+        'message_type': message_doc.get('message_type', 'text'),
+        'user_name': message_doc.get('user_name'),
+        'created_at': message_doc['created_at'].isoformat()
+    }
+
+
+class Subscription:
+    def __init__(self, group_id: ObjectId):
+        self.group_id = group_id
+        self.queue: "queue.Queue[Dict]" = queue.Queue(maxsize=CHAT_SUBSCRIBER_QUEUE)
+        # Set when the client fell too far behind; it should reconnect and backfill
+        self.overflowed = False
+
+    def get(self, timeout: float):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class ChatRelay:
+    """Fans new group messages out to the SSE subscribers in this process.
+
+    Messages sent through this process are delivered immediately. Messages
+    written by other workers or pods are picked up by one background poll per
+    process, covering only groups that have local subscribers, so MongoDB
+    load does not grow with the number of open chat windows."""
+
+    def __init__(self):
+        self.store = None
+        self._subscribers: Dict[ObjectId, Set[Subscription]] = {}
+        self._delivered: "OrderedDict[ObjectId, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+
+    def init_store(self, store):
+        self.store = store
+
+    def subscribe(self, group_id) -> Subscription:
+        sub = Subscription(ObjectId(group_id))
+        with self._lock:
+            self._subscribers.setdefault(sub.group_id, set()).add(sub)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='chat-relay', daemon=True)
+                self._worker.start()
+        self._wakeup.set()
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            subs = self._subscribers.get(sub.group_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.group_id]
+
+    def publish(self, message_doc: Dict):
+        """Deliver a message just written by this process without waiting for the poll"""
+        self._deliver(message_doc)
+
+    def _deliver(self, message_doc: Dict):
+        now = time.monotonic()
+        with self._lock:
+            if message_doc['_id'] in self._delivered:
+                return
+            self._delivered[message_doc['_id']] = now
+            while self._delivered and now - next(iter(self._delivered.values())) > CHAT_LOOKBACK_SECONDS * 4:
+                self._delivered.popitem(last=False)
+            subs = list(self._subscribers.get(message_doc['group_id'], ()))
+        payload = message_to_dict(message_doc)
+        for sub in subs:
+            try:
+                sub.queue.put_nowait(payload)
+            except queue.Full:
+                sub.overflowed = True
+
+    def _poll(self, since: datetime):
+        with self._lock:
+            group_ids = list(self._subscribers)
+        if not group_ids:
+            return
+        since_id = ObjectId.from_datetime(since - timedelta(seconds=CHAT_LOOKBACK_SECONDS))
+        for message_doc in self.store.after(group_ids, since_id):
+            self._deliver(message_doc)
+
+    def _run(self):
+        last_poll = datetime.utcnow()
+        while True:
+            with self._lock:
+                idle = not self._subscribers
+            if idle:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                last_poll = datetime.utcnow()
+            started = datetime.utcnow()
+            try:
+                # Each poll covers everything since the previous successful one
+                self._poll(last_poll)
+                last_poll = started
+            except PyMongoError as e:
+                logger.warning(f"Chat relay poll failed: {e}")
+            time.sleep(CHAT_POLL_INTERVAL)
+
+
+chat_relay = ChatRelay()
+
+
+def init_collections(db_instance):
+    from services.message_store import message_store
+    chat_relay.init_store(message_store)
@@ -0,0 +1,151 @@
+import os
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Dict, List, Optional
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger("gemini.context")
+
+CONTEXT_HISTORY_SIZE = int(os.getenv('TUTOR_CONTEXT_HISTORY', 5))
+CONTEXT_ANSWER_CHARS = int(os.getenv('TUTOR_CONTEXT_ANSWER_CHARS', 200))
+CONTEXT_CACHE_SIZE = int(os.getenv('TUTOR_CONTEXT_CACHE_SIZE', 4096))
+# Other workers append to the persisted ring buffer, so cached entries are reloaded after this
+CONTEXT_TTL_SECONDS = int(os.getenv('TUTOR_CONTEXT_TTL_SECONDS', 300))
+
+PROFILE_FIELDS = ('grade_level', 'subjects')
+
+
+class UserContext:
+    """Profile fields plus a ring buffer of the user's most recent Q/A summaries"""
+
+    def __init__(self, profile: Dict, history: List[Dict]):
+        self.profile = profile
+        self.history = deque(history, maxlen=CONTEXT_HISTORY_SIZE)
+        self.loaded_at = time.monotonic()
+
+    @property
+    def grade_level(self) -> Optional[str]:
+        return self.profile.get('grade_level')
+
+    def user_context(self) -> Dict:
+        recent_topics = list(dict.fromkeys(h['topic'] for h in reversed(self.history) if h.get('topic')))
+        return {
+            'grade_level': self.profile.get('grade_level'),
+            'subjects': self.profile.get('subjects') or [],
+            'recent_topics': recent_topics
+        }
+
+    def conversation_history(self) -> List[Dict]:
+        """Newest first, matching the old per-request study_sessions query"""
+        return list(reversed(self.history))
+
+
+def summarize_exchange(subject: str, topic: str, question: str, answer: str) -> Dict:
+    return {
+        'subject': subject,
+        'topic': topic,
+        'question': question,
+        'ai_response': (answer or '')[:CONTEXT_ANSWER_CHARS],
+        'created_at': datetime.utcnow()
+    }
+
+
+class ConversationContextStore:
+    """In-process LRU of UserContext backed by one tutor_context document per user.
+
+    Saving a session writes through to both the cache and the document (a
+    capped $push), so building prompt context on the hot path is a dict
+    lookup, and a cold load is two point reads instead of a sorted scan."""
+
+    def __init__(self, max_users: int = CONTEXT_CACHE_SIZE):
+        self.max_users = max_users
+        self.users_collection = None
+        self.sessions_collection = None
+        self.collection = None
+        self._entries: "OrderedDict[str, UserContext]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_collections(self, users_collection, sessions_collection, context_collection):
+        self.users_collection = users_collection
+        self.sessions_collection = sessions_collection
+        self.collection = context_collection
+
+    def _load(self, user_id: str) -> Optional[UserContext]:
+        user = self.users_collection.find_one({'_id': ObjectId(user_id)}, {f: 1 for f in PROFILE_FIELDS})
+        if not user:
+            return None
+        doc = self.collection.find_one({'_id': user_id}, {'history': 1})
+        history = doc['history'] if doc else self._seed(user_id)
+        return UserContext({f: user.get(f) for f in PROFILE_FIELDS}, history)
+
+    def _seed(self, user_id: str) -> List[Dict]:
+        # First load for a user: build the ring buffer once from their saved sessions
+        sessions = self.sessions_collection.find(
+            {'user_id': {'$in': [user_id, ObjectId(user_id)]}},
+            {'subject': 1, 'topic': 1, 'question': 1, 'ai_response': 1, 'created_at': 1}
+        ).sort('created_at', -1).limit(CONTEXT_HISTORY_SIZE)
+        history = [
+            dict(summarize_exchange(s.get('subject'), s.get('topic'), s.get('question'), s.get('ai_response')), created_at=s['created_at'])
+            for s in reversed(list(sessions))
+        ]
+        self.collection.update_one({'_id': user_id}, {'$setOnInsert': {'history': history}}, upsert=True)
+        return history
+
+    def get(self, user_id: Optional[str]) -> Optional[UserContext]:
+        if not user_id:
+            return None
+        user_id = str(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and time.monotonic() - entry.loaded_at < CONTEXT_TTL_SECONDS:
+                self._entries.move_to_end(user_id)
+                return entry
+        try:
+            entry = self._load(user_id)
+        except PyMongoError as e:
+            logger.warning(f"Could not load tutor context for {user_id}: {e}")
+            return None
+        if entry is not None:
+            with self._lock:
+                self._entries[user_id] = entry
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def record(self, user_id: Optional[str], subject: str, topic: str, question: str, answer: str):
+        """Write-through update after a study session is saved"""
+        if not user_id:
+            return
+        user_id = str(user_id)
+        summary = summarize_exchange(subject, topic, question, answer)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                entry.history.append(summary)
+        try:
+            self.collection.update_one(
+                {'_id': user_id},
+                {'$push': {'history': {'$each': [summary], '$slice': -CONTEXT_HISTORY_SIZE}}},
+                upsert=True
+            )
+        except PyMongoError as e:
+            logger.warning(f"Could not persist tutor context for {user_id}: {e}")
+
+    def update_profile(self, user_id: str, fields: Dict):
+        """Apply profile edits to a cached entry (the users document is the source of truth)"""
+        with self._lock:
+            entry = self._entries.get(str(user_id))
+            if entry is not None:
+                entry.profile.update({f: fields[f] for f in PROFILE_FIELDS if f in fields})
+
+
+context_store = ConversationContextStore()
+
+
+def init_collections(db_instance):
+    context_store.init_collections(db_instance.users, db_instance.study_sessions, db_instance.tutor_context)
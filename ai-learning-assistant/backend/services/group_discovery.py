@@ -0,0 +1,114 @@
+from typing import Dict, List, Optional, Tuple
+from utils.pagination import decode_ranked_cursor, encode_ranked_cursor, page_size
+
+GROUP_FILTERS = ('subject', 'topic', 'grade_level')
+
+# Added to the text score when a search result fits the user's profile
+SUBJECT_FIT_BONUS = 0.5
+GRADE_FIT_BONUS = 0.25
+
+
+def _keyset_after(sort_field: str, sort_value, doc_id) -> Dict:
+    return {'$or': [
+        {sort_field: {'$lt': sort_value}},
+        {sort_field: sort_value, '_id': {'$lt': doc_id}}
+    ]}
+
+
+class GroupDiscovery:
+    """Filtered, ranked and paginated study group listing.
+
+    Without a search term, groups are ranked in fit tiers (the user's
+    subjects and grade, subjects only, grade only, the rest) and by
+    last_activity within a tier. Each tier is its own query on a
+    (..., last_activity) index and a page stops reading once it is full, so
+    the cost follows the page size rather than the number of groups. With
+    ?q, the text index finds matches and the text score plus a small fit
+    bonus orders them."""
+
+    def __init__(self):
+        self.collection = None
+
+    def init_collection(self, collection):
+        self.collection = collection
+
+    def _base_query(self, user_id: str, args) -> Dict:
+        if args.get('scope') == 'mine':
+            query = {'members': user_id}
+        else:
+            query = {'$or': [{'is_public': True}, {'members': user_id}]}
+        for field in GROUP_FILTERS:
+            value = (args.get(field) or '').strip()
+            if value:
+                query[field] = value
+        return query
+
+    @staticmethod
+    def _tiers(profile: Dict) -> List[Dict]:
+        subjects, grade = profile.get('subjects') or [], profile.get('grade_level')
+        subject_in, subject_out = {'subject': {'$in': subjects}}, {'subject': {'$nin': subjects}}
+        grade_eq, grade_ne = {'grade_level': grade}, {'grade_level': {'$ne': grade}}
+        if subjects and grade:
+            return [{**subject_in, **grade_eq}, {**subject_in, **grade_ne}, {**subject_out, **grade_eq}, {**subject_out, **grade_ne}]
+        if subjects:
+            return [subject_in, subject_out]
+        if grade:
+            return [grade_eq, grade_ne]
+        return [{}]
+
+    def list_groups(self, user_id: str, profile: Dict, args) -> Tuple[List[Dict], Optional[str]]:
+        """One page of groups and the cursor for the next (None on the last page).
+
+        Raises ValueError for a bad limit or cursor."""
+        if (args.get('q') or '').strip():
+            return self._search(user_id, profile, args)
+        limit = page_size(args)
+        start_tier, after = 0, None
+        if args.get('cursor'):
+            rank, last_activity, doc_id = decode_ranked_cursor(args['cursor'])
+            start_tier, after = int(rank), _keyset_after('last_activity', last_activity, doc_id)
+        base, tiers = self._base_query(user_id, args), self._tiers(profile)
+        ranked: List[Tuple[int, Dict]] = []
+        for tier in range(start_tier, len(tiers)):
+            clauses = [base, tiers[tier]] + ([after] if after and tier == start_tier else [])
+            found = self.collection.find({'$and': clauses}).sort([('last_activity', -1), ('_id', -1)]).limit(limit + 1 - len(ranked))
+            ranked.extend((tier, group) for group in found)
+            if len(ranked) > limit:
+                break
+        next_cursor = None
+        if len(ranked) > limit:
+            ranked = ranked[:limit]
+            tier, last = ranked[-1]
+            next_cursor = encode_ranked_cursor(tier, last['last_activity'], last['_id'])
+        return [group for _, group in ranked], next_cursor
+
+    def _search(self, user_id: str, profile: Dict, args) -> Tuple[List[Dict], Optional[str]]:
+        limit = page_size(args)
+        subjects, grade = profile.get('subjects') or [], profile.get('grade_level')
+        pipeline = [
+            {'$match': dict(self._base_query(user_id, args), **{'$text': {'$search': args['q'].strip()}})},
+            {'$addFields': {'relevance': {'$add': [
+                {'$meta': 'textScore'},
+                {'$cond': [{'$in': ['$subject', subjects]}, SUBJECT_FIT_BONUS, 0]},
+                {'$cond': [{'$eq': ['$grade_level', grade]}, GRADE_FIT_BONUS, 0]}
+            ]}}}
+        ]
+        if args.get('cursor'):
+            relevance, _, doc_id = decode_ranked_cursor(args['cursor'])
+            pipeline.append({'$match': _keyset_after('relevance', relevance, doc_id)})
+        pipeline += [{'$sort': {'relevance': -1, '_id': -1}}, {'$limit': limit + 1}]
+        groups = list(self.collection.aggregate(pipeline))
+        next_cursor = None
+        if len(groups) > limit:
+            groups = groups[:limit]
+            next_cursor = encode_ranked_cursor(groups[-1]['relevance'], None, groups[-1]['_id'])
+        for group in groups:
+            group.pop('relevance', None)
+        return groups, next_cursor
+
+
+group_discovery = GroupDiscovery()
+
+
+def init_collections(db_instance):
+    group_discovery.init_collection(db_instance.study_groups)
@@ -0,0 +1,76 @@
+from datetime import datetime
+from bson import ObjectId
+
+
+class GroupMembership:
+    """Join and leave as single conditional updates on the group document.
+
+    The duplicate, capacity and creator checks are part of the update
+    filter, so concurrent joins to a nearly full group cannot oversubscribe
+    it and the success path is one round trip with no read. member_count
+    keeps capacity checks off the members array and is counted on first use
+    for groups created before it existed. "My groups" is served from the
+    members array through its (members, last_activity) index, so there is
+    no separate membership collection to keep in step."""
+
+    def __init__(self):
+        self.groups_collection = None
+
+    def init_collections(self, db_instance):
+        self.groups_collection = db_instance.study_groups
+
+    def join(self, group_id: ObjectId, user_id: str) -> str:
+        """Returns 'joined', 'not_found', 'already_member' or 'full'"""
+        result = self.groups_collection.update_one(
+            {
+                '_id': group_id,
+                'members': {'$ne': user_id},
+                'member_count': {'$exists': True},
+                '$expr': {'$lt': ['$member_count', '$max_members']}
+            },
+            {'$push': {'members': user_id}, '$inc': {'member_count': 1}, '$set': {'last_activity': datetime.utcnow()}}
+        )
+        if result.modified_count:
+            return 'joined'
+        group = self.groups_collection.find_one({'_id': group_id}, {'members': 1, 'member_count': 1, 'max_members': 1})
+        if not group:
+            return 'not_found'
+        if user_id in group['members']:
+            return 'already_member'
+        if 'member_count' not in group:
+            # Created before member_count existed; count once and retry
+            self.groups_collection.update_one(
+                {'_id': group_id, 'member_count': {'$exists': False}},
+                {'$set': {'member_count': len(group['members'])}}
+            )
+            return self.join(group_id, user_id)
+        return 'full'
+
+    def leave(self, group_id: ObjectId, user_id: str) -> str:
+        """Returns 'left', 'not_found', 'not_member' or 'creator'"""
+        result = self.groups_collection.update_one(
+            {'_id': group_id, 'members': user_id, 'created_by': {'$ne': user_id}, 'member_count': {'$exists': True}},
+            {'$pull': {'members': user_id}, '$inc': {'member_count': -1}, '$set': {'last_activity': datetime.utcnow()}}
+        )
+        if result.modified_count:
+            return 'left'
+        group = self.groups_collection.find_one({'_id': group_id}, {'members': 1, 'member_count': 1, 'created_by': 1})
+        if not group:
+            return 'not_found'
+        if user_id not in group['members']:
+            return 'not_member'
+        if group.get('created_by') != user_id and 'member_count' not in group:
+            # Created before member_count existed; count once and retry
+            self.groups_collection.update_one(
+                {'_id': group_id, 'member_count': {'$exists': False}},
+                {'$set': {'member_count': len(group['members'])}}
+            )
+            return self.leave(group_id, user_id)
+        return 'creator'
+
+
+group_membership = GroupMembership()
+
+
+def init_collections(db_instance):
+    group_membership.init_collections(db_instance)
@@ -0,0 +1,145 @@
+import os
+import logging
+import threading
+from typing import Dict, List
+from pymongo import TEXT
+from pymongo.errors import PyMongoError
+from services.question_bank import BUCKET_FIELDS
+
+logger = logging.getLogger("gemini.indexes")
+
+INDEX_BOOTSTRAP_ENABLED = os.getenv('INDEX_BOOTSTRAP_ENABLED', 'true').lower() == 'true'
+
+# Every index the application relies on; created (if missing) at startup and by manage_indexes.py
+INDEXES = [
+    # Auth: login, registration checks, email verification
+    {'collection': 'users', 'keys': [('username', 1)], 'options': {'unique': True}},
+    {'collection': 'users', 'keys': [('email', 1)], 'options': {'unique': True}},
+    {'collection': 'users', 'keys': [('verification_token', 1)], 'options': {'sparse': True}},
+
+    # Session history (keyset pagination) and per-subject progress
+    {'collection': 'study_sessions', 'keys': [('user_id', 1), ('created_at', -1), ('_id', -1)]},
+    {'collection': 'study_sessions', 'keys': [('user_id', 1), ('subject', 1)]},
+
+    # Quiz listing and attempt history, the open-attempt check on start, progress
+    {'collection': 'quizzes', 'keys': [('created_at', -1), ('_id', -1)]},
+    {'collection': 'quizzes', 'keys': [('subject', 1), ('created_at', -1), ('_id', -1)]},
+    {'collection': 'quiz_attempts', 'keys': [('user_id', 1), ('started_at', -1), ('_id', -1)]},
+    {'collection': 'quiz_attempts', 'keys': [('user_id', 1), ('quiz_id', 1), ('completed', 1)]},
+    {'collection': 'quiz_attempts', 'keys': [('user_id', 1), ('subject', 1)]},
+    # Item analytics reads completed attempts past its watermark
+    {'collection': 'quiz_attempts', 'keys': [('completed', 1), ('completed_at', 1), ('_id', 1)]},
+
+    # Exam sessions: a teacher's sessions, and one attempt per student per session
+    {'collection': 'exam_sessions', 'keys': [('created_by', 1), ('created_at', -1)]},
+    {'collection': 'quiz_attempts', 'keys': [('exam_session_id', 1), ('user_id', 1)],
+     'options': {'unique': True, 'partialFilterExpression': {'exam_session_id': {'$exists': True}}}},
+
+    # Group discovery, membership and resources
+    {'collection': 'study_groups', 'keys': [('is_public', 1), ('subject', 1), ('grade_level', 1), ('last_activity', -1)]},
+    {'collection': 'study_groups', 'keys': [('is_public', 1), ('topic', 1), ('last_activity', -1)]},
+    {'collection': 'study_groups', 'keys': [('is_public', 1), ('last_activity', -1)]},
+    {'collection': 'study_groups', 'keys': [('members', 1), ('last_activity', -1)]},
+    {'collection': 'study_groups', 'keys': [('name', TEXT), ('topic', TEXT), ('description', TEXT)],
+     'options': {'weights': {'name': 5, 'topic': 3, 'description': 1}, 'name': 'group_search'}},
+    {'collection': 'group_resources', 'keys': [('group_id', 1), ('created_at', -1)]},
+
+    # Bucketed group chat: tail/backfill reads and the compaction sweep
+    {'collection': 'group_message_buckets', 'keys': [('group_id', 1), ('bucket', -1), ('first_id', -1)]},
+    {'collection': 'group_message_buckets', 'keys': [('bucket', 1)]},
+    {'collection': 'group_message_archive', 'keys': [('group_id', 1), ('bucket', -1), ('first_id', -1)]},
+    # Legacy one-document-per-message chat, read until compact_group_messages.py --migrate empties it
+    {'collection': 'group_messages', 'keys': [('group_id', 1), ('_id', 1)]},
+
+    # AI response cache, question bank and background jobs
+    {'collection': 'ai_response_cache', 'keys': [('expires_at', 1)], 'options': {'expireAfterSeconds': 0}},
+    {'collection': 'ai_response_cache', 'keys': [('bucket', 1), ('bands', 1)]},
+    {'collection': 'question_bank', 'keys': [(f, 1) for f in BUCKET_FIELDS] + [('text_hash', 1)], 'options': {'unique': True}},
+    # Adaptive tests: next-item selection by difficulty, per-user ability, a user's sessions
+    {'collection': 'question_bank', 'keys': [('subject', 1), ('topic', 1), ('exam_type', 1), ('irt_b', 1)]},
+    {'collection': 'question_bank', 'keys': [('text_hash', 1)]},
+    {'collection': 'user_abilities', 'keys': [('user_id', 1), ('subject', 1)], 'options': {'unique': True}},
+    {'collection': 'adaptive_sessions', 'keys': [('user_id', 1), ('started_at', -1)]},
+    # Spaced repetition: one item per user and question, due items per user, the daily queue build
+    {'collection': 'review_items', 'keys': [('user_id', 1), ('text_hash', 1)], 'options': {'unique': True}},
+    {'collection': 'review_items', 'keys': [('user_id', 1), ('due_at', 1)]},
+    {'collection': 'review_items', 'keys': [('due_at', 1)]},
+    {'collection': 'question_bank_buckets', 'keys': [('last_requested_at', -1), ('requests', -1)]},
+    {'collection': 'generation_jobs', 'keys': [('status', 1), ('created_at', 1)]},
+    {'collection': 'generation_jobs', 'keys': [('expires_at', 1)], 'options': {'expireAfterSeconds': 0}},
+]
+
+# Representative filters of the hot queries; find_collscans() reports any the planner would run as a COLLSCAN
+QUERY_SHAPES = [
+    {'name': 'login', 'collection': 'users', 'filter': {'username': ''}},
+    {'name': 'verify email', 'collection': 'users', 'filter': {'verification_token': ''}},
+    {'name': 'session history', 'collection': 'study_sessions', 'filter': {'user_id': ''}, 'sort': {'created_at': -1, '_id': -1}},
+    {'name': 'quiz list', 'collection': 'quizzes', 'filter': {}, 'sort': {'created_at': -1, '_id': -1}},
+    {'name': 'quiz list by subject', 'collection': 'quizzes', 'filter': {'subject': ''}, 'sort': {'created_at': -1, '_id': -1}},
+    {'name': 'attempt history', 'collection': 'quiz_attempts', 'filter': {'user_id': ''}, 'sort': {'started_at': -1, '_id': -1}},
+    {'name': 'open attempt check', 'collection': 'quiz_attempts', 'filter': {'user_id': '', 'quiz_id': None, 'completed': False}},
+    {'name': 'exam session results', 'collection': 'quiz_attempts', 'filter': {'exam_session_id': None}},
+    {'name': 'group discovery', 'collection': 'study_groups', 'filter': {'is_public': True, 'subject': {'$in': ['']}, 'grade_level': ''}, 'sort': {'last_activity': -1}},
+    {'name': 'my groups', 'collection': 'study_groups', 'filter': {'members': ''}, 'sort': {'last_activity': -1}},
+    {'name': 'group resources', 'collection': 'group_resources', 'filter': {'group_id': None}, 'sort': {'created_at': -1}},
+    {'name': 'chat tail', 'collection': 'group_message_buckets', 'filter': {'group_id': None}, 'sort': {'bucket': -1, 'first_id': -1}},
+    {'name': 'adaptive next item', 'collection': 'question_bank', 'filter': {'subject': '', 'topic': '', 'exam_type': '', 'irt_b': {'$gte': 0}}, 'sort': {'irt_b': 1}},
+    {'name': 'due reviews', 'collection': 'review_items', 'filter': {'user_id': '', 'due_at': {'$lte': None}}, 'sort': {'due_at': 1}},
+    {'name': 'job claim', 'collection': 'generation_jobs', 'filter': {'status': 'queued'}, 'sort': {'created_at': 1}},
+]
+
+
+def _plan_stages(plan: Dict) -> List[str]:
+    stages = [plan.get('stage')]
+    for child in [plan.get('inputStage')] + plan.get('inputStages', []):
+        if child:
+            stages += _plan_stages(child)
+    return stages
+
+
+def ensure_indexes(db_instance) -> Dict:
+    """Create any declared index that is missing; existing ones are left as they are"""
+    created = failed = 0
+    for spec in INDEXES:
+        try:
+            db_instance[spec['collection']].create_index(spec['keys'], background=True, **spec.get('options', {}))
+            created += 1
+        except PyMongoError as e:
+            failed += 1
+            logger.warning(f"Could not create index {spec['keys']} on {spec['collection']}: {e}")
+    return {'ensured': created, 'failed': failed}
+
+
+def find_collscans(db_instance) -> List[str]:
+    """Names of QUERY_SHAPES whose winning plan scans the whole collection"""
+    collscans = []
+    for shape in QUERY_SHAPES:
+        command = {'find': shape['collection'], 'filter': shape['filter']}
+        if shape.get('sort'):
+            command['sort'] = shape['sort']
+        try:
+            explain = db_instance.command('explain', command, verbosity='queryPlanner')
+        except PyMongoError as e:
+            logger.warning(f"Could not explain query '{shape['name']}': {e}")
+            continue
+        winning_plan = explain['queryPlanner']['winningPlan']
+        # Plans from the slot-based engine nest the classic plan under queryPlan
+        if 'COLLSCAN' in _plan_stages(winning_plan.get('queryPlan', winning_plan)):
+            collscans.append(shape['name'])
+    return collscans
+
+
+def bootstrap(db_instance):
+    result = ensure_indexes(db_instance)
+    logger.info(f"Index bootstrap: {result['ensured']} ensured, {result['failed']} failed")
+    try:
+        for name in find_collscans(db_instance):
+            logger.warning(f"Query '{name}' runs as a collection scan")
+    except Exception as e:
+        logger.warning(f"Index verification failed: {e}")
+
+
+def init_indexes(db_instance):
+    """Create and verify indexes in the background so startup does not wait on index builds"""
+    if INDEX_BOOTSTRAP_ENABLED:
+        threading.Thread(target=bootstrap, args=(db_instance,), name='index-bootstrap', daemon=True).start()
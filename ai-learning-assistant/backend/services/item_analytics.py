@@ -0,0 +1,228 @@
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import numpy as np
+from bson import ObjectId
+from pymongo import UpdateOne
+from models.quiz import ANSWER_KEY_UNKNOWN, answer_string, compile_questions
+from services.question_bank import question_hash
+
+logger = logging.getLogger("gemini.analytics")
+
+ANALYTICS_BATCH_SIZE = int(os.getenv('ANALYTICS_BATCH_SIZE', 5000))
+# Attempts completed more recently than this are left for the next run, so
+# writes still in flight on other workers are not skipped by the watermark
+ANALYTICS_SETTLE_SECONDS = 60
+
+OPTION_LETTERS = ('A', 'B', 'C', 'D')
+STATE_ID = 'item_analytics'
+
+
+def response_matrix(answer_strings: List[str], num_items: int) -> np.ndarray:
+    """Students x items array of single-byte answers"""
+    raw = b''.join(s.encode('ascii', 'replace') for s in answer_strings)
+    return np.frombuffer(raw, dtype='S1').reshape(len(answer_strings), num_items)
+
+
+def point_biserial(n, correct, sum_x, sum_x2, sum_x_correct):
+    """Point-biserial correlation of item correctness with a criterion score x, from running sums.
+
+    All arguments may be NumPy arrays (one entry per item). Items everyone
+    or no one answered correctly, or with a constant criterion, give NaN."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = correct / n
+        mean_correct = sum_x_correct / correct
+        mean_wrong = (sum_x - sum_x_correct) / (n - correct)
+        std = np.sqrt(sum_x2 / n - (sum_x / n) ** 2)
+        return (mean_correct - mean_wrong) / std * np.sqrt(p * (1 - p))
+
+
+def _rounded(values) -> List[Optional[float]]:
+    return [None if np.isnan(v) else round(float(v), 4) for v in np.atleast_1d(values)]
+
+
+def _options(counts: Dict, n: int) -> Dict[str, float]:
+    counts = counts or {}
+    result = {letter: round(counts.get(letter, 0) / n, 4) for letter in OPTION_LETTERS}
+    result['omitted'] = round(counts.get('omitted', 0) / n, 4)
+    return result
+
+
+class ItemAnalytics:
+    """Classical item analysis of completed quiz attempts, maintained incrementally.
+
+    Each run reads the attempts completed since the last watermark in
+    (completed_at, _id) order, builds a students x items response matrix per
+    quiz with NumPy and $incs running sums into quiz_item_stats (per quiz) and
+    question_item_stats (per bank question, keyed by question text hash,
+    with the creators of the quizzes it appeared in).
+    P-values, item-rest point-biserial discrimination, distractor shares and
+    KR-20 are derived from those sums on read, so the cost of a run follows
+    the number of new attempts, not the history."""
+
+    def __init__(self):
+        self.quiz_attempts_collection = None
+        self.quizzes_collection = None
+        self.quiz_stats_collection = None
+        self.question_stats_collection = None
+        self.state_collection = None
+
+    def init_collections(self, db_instance):
+        self.quiz_attempts_collection = db_instance.quiz_attempts
+        self.quizzes_collection = db_instance.quizzes
+        self.quiz_stats_collection = db_instance.quiz_item_stats
+        self.question_stats_collection = db_instance.question_item_stats
+        self.state_collection = db_instance.analytics_state
+
+    def run(self, batch_size: int = ANALYTICS_BATCH_SIZE) -> int:
+        """Fold attempts completed since the last run into the stats; returns attempts processed.
+
+        A crash between a batch's writes and the watermark update can count
+        that batch twice; rebuild() recomputes everything from scratch."""
+        state = self.state_collection.find_one({'_id': STATE_ID}) or {}
+        after = (state.get('completed_at'), state.get('attempt_id'))
+        until = datetime.utcnow() - timedelta(seconds=ANALYTICS_SETTLE_SECONDS)
+        processed = 0
+        while True:
+            query = {'completed': True, 'completed_at': {'$lt': until}}
+            if after[0]:
+                query['$or'] = [
+                    {'completed_at': {'$gt': after[0]}},
+                    {'completed_at': after[0], '_id': {'$gt': after[1]}}
+                ]
+            attempts = list(self.quiz_attempts_collection.find(
+                query, {'quiz_id': 1, 'answer_string': 1, 'answers': 1, 'completed_at': 1}
+            ).sort([('completed_at', 1), ('_id', 1)]).limit(batch_size))
+            if not attempts:
+                return processed
+            self._fold(attempts)
+            after = (attempts[-1]['completed_at'], attempts[-1]['_id'])
+            self.state_collection.update_one(
+                {'_id': STATE_ID},
+                {'$set': {'completed_at': after[0], 'attempt_id': after[1], 'updated_at': datetime.utcnow()}},
+                upsert=True
+            )
+            processed += len(attempts)
+
+    def rebuild(self) -> int:
+        self.quiz_stats_collection.delete_many({})
+        self.question_stats_collection.delete_many({})
+        self.state_collection.delete_one({'_id': STATE_ID})
+        return self.run()
+
+    def _load_quizzes(self, quiz_ids) -> Dict:
+        quizzes = {}
+        for quiz in self.quizzes_collection.find(
+            {'_id': {'$in': list(quiz_ids)}}, {'answer_key': 1, 'created_by': 1, 'public_questions.question': 1, 'questions.question': 1, 'questions.correct_answer': 1}
+        ):
+            if 'answer_key' not in quiz:
+                quiz.update(compile_questions(quiz['questions']))
+            quizzes[quiz['_id']] = {
+                'answer_key': quiz['answer_key'],
+                'created_by': quiz.get('created_by'),
+                'hashes': [question_hash(q.get('question', '')) for q in quiz['public_questions']]
+            }
+        return quizzes
+
+    def _fold(self, attempts: List[Dict]):
+        by_quiz: Dict[ObjectId, List[Dict]] = {}
+        for attempt in attempts:
+            by_quiz.setdefault(attempt['quiz_id'], []).append(attempt)
+        quizzes = self._load_quizzes(by_quiz)
+        quiz_ops, question_ops = [], []
+        for quiz_id, quiz_attempts in by_quiz.items():
+            quiz = quizzes.get(quiz_id)
+            if quiz is None or not quiz['answer_key']:
+                continue
+            key = quiz['answer_key']
+            k = len(key)
+            responses = response_matrix(
+                [a.get('answer_string') or answer_string(a.get('answers') or {}, k) for a in quiz_attempts], k
+            )
+            key_row = np.frombuffer(key.encode('ascii', 'replace'), dtype='S1')
+            scored = (responses == key_row) & (key_row != ANSWER_KEY_UNKNOWN.encode())
+            x = scored.astype(np.int64)
+            totals = x.sum(axis=1)
+            option_counts = {letter: (responses == letter.encode()).sum(axis=0) for letter in OPTION_LETTERS}
+            omitted = len(quiz_attempts) - sum(option_counts.values())
+
+            inc = {'n': len(quiz_attempts), 'sum_t': int(totals.sum()), 'sum_t2': int((totals ** 2).sum())}
+            correct, sum_t_correct = x.sum(axis=0), (x * totals[:, None]).sum(axis=0)
+            # Rest score (total minus the item) as a share of the other items, comparable across quizzes
+            rest = (totals[:, None] - x) / max(k - 1, 1)
+            sum_rest, sum_rest2, sum_rest_correct = rest.sum(axis=0), (rest ** 2).sum(axis=0), (rest * x).sum(axis=0)
+            for i in range(k):
+                inc[f'items.{i}.correct'] = int(correct[i])
+                inc[f'items.{i}.sum_t'] = int(sum_t_correct[i])
+                item_options = {f'options.{letter}': int(option_counts[letter][i]) for letter in OPTION_LETTERS}
+                item_options['options.omitted'] = int(omitted[i])
+                inc.update({f'items.{i}.{field}': count for field, count in item_options.items()})
+                question_update = {'$inc': dict(
+                    item_options,
+                    n=len(quiz_attempts),
+                    correct=int(correct[i]),
+                    sum_rest=float(sum_rest[i]),
+                    sum_rest2=float(sum_rest2[i]),
+                    sum_rest_correct=float(sum_rest_correct[i])
+                )}
+                if quiz['created_by']:
+                    question_update['$addToSet'] = {'creators': quiz['created_by']}
+                question_ops.append(UpdateOne({'_id': quiz['hashes'][i]}, question_update, upsert=True))
+            quiz_ops.append(UpdateOne({'_id': quiz_id}, {'$inc': inc, '$set': {'num_items': k, 'updated_at': datetime.utcnow()}}, upsert=True))
+        if quiz_ops:
+            self.quiz_stats_collection.bulk_write(quiz_ops, ordered=False)
+        if question_ops:
+            self.question_stats_collection.bulk_write(question_ops, ordered=False)
+
+    def quiz_report(self, quiz_id: ObjectId) -> Optional[Dict]:
+        doc = self.quiz_stats_collection.find_one({'_id': quiz_id})
+        if not doc or not doc.get('n'):
+            return None
+        n, k = doc['n'], doc['num_items']
+        items = [doc['items'].get(str(i), {}) for i in range(k)]
+        correct = np.array([item.get('correct', 0) for item in items], dtype=float)
+        sum_t_correct = np.array([item.get('sum_t', 0) for item in items], dtype=float)
+        p = correct / n
+        # Item-rest correlation: each item against the total of the other items
+        discrimination = point_biserial(
+            n, correct, doc['sum_t'] - correct, doc['sum_t2'] - 2 * sum_t_correct + correct, sum_t_correct - correct
+        )
+        variance = doc['sum_t2'] / n - (doc['sum_t'] / n) ** 2
+        kr20 = k / (k - 1) * (1 - float((p * (1 - p)).sum()) / variance) if k > 1 and variance > 0 else None
+        return {
+            'quiz_id': str(quiz_id),
+            'attempts': n,
+            'num_items': k,
+            'mean_score': round(doc['sum_t'] / n, 4),
+            'kr20': round(kr20, 4) if kr20 is not None else None,
+            'items': [{
+                'index': i,
+                'p_value': round(float(p[i]), 4),
+                'discrimination': d,
+                'options': _options(items[i].get('options'), n)
+            } for i, d in enumerate(_rounded(discrimination))],
+            'updated_at': doc['updated_at'].isoformat()
+        }
+
+    def question_report(self, text_hash: str, user_id: str) -> Optional[Dict]:
+        """Stats of a question for a user who created a quiz it appeared in; None otherwise"""
+        doc = self.question_stats_collection.find_one({'_id': text_hash, 'creators': user_id})
+        if not doc or not doc.get('n'):
+            return None
+        n = doc['n']
+        discrimination = point_biserial(n, doc['correct'], doc['sum_rest'], doc['sum_rest2'], doc['sum_rest_correct'])
+        return {
+            'question_hash': text_hash,
+            'responses': n,
+            'p_value': round(doc['correct'] / n, 4),
+            'discrimination': _rounded(discrimination)[0],
+            'options': _options(doc.get('options'), n)
+        }
+
+
+item_analytics = ItemAnalytics()
+
+
+def init_collections(db_instance):
+    item_analytics.init_collections(db_instance)
@@ -0,0 +1,164 @@
+import os
+import logging
+import threading
+import traceback
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+from bson import ObjectId
+from bson.errors import BSONError
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger("gemini.jobs")
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 300))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 2))
+JOB_RETENTION_HOURS = int(os.getenv('JOB_RETENTION_HOURS', 24))
+JOB_POLL_INTERVAL = 2.0
+
+
+def job_to_dict(job_doc):
+    return {
+        'id': str(job_doc['_id']),
+        'type': job_doc['type'],
+        'status': job_doc['status'],
+        'progress': job_doc.get('progress', {}),
+        'result': job_doc.get('result'),
+        'error': job_doc.get('error'),
+        'created_at': job_doc['created_at'].isoformat(),
+        'started_at': job_doc['started_at'].isoformat() if job_doc.get('started_at') else None,
+        'finished_at': job_doc['finished_at'].isoformat() if job_doc.get('finished_at') else None
+    }
+
+
+class JobQueue:
+    """MongoDB-backed queue for slow AI work, executed by a pool of worker threads"""
+
+    def __init__(self):
+        self.collection = None
+        self._handlers: Dict[str, Callable] = {}
+        self._wakeup = threading.Event()
+        self._workers = []
+
+    def init_collection(self, collection):
+        self.collection = collection
+
+    def register_handler(self, job_type: str, handler: Callable):
+        """Register handler(params, progress) for a job type; its return value is stored as the job result"""
+        self._handlers[job_type] = handler
+
+    def enqueue(self, job_type: str, params: Dict, user_id: Optional[str] = None) -> str:
+        if job_type not in self._handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        now = datetime.utcnow()
+        result = self.collection.insert_one({
+            'type': job_type,
+            'params': params,
+            'user_id': user_id,
+            'status': 'queued',
+            'progress': {'done': 0, 'total': params.get('num_questions', 0), 'message': 'Queued'},
+            'attempts': 0,
+            'created_at': now,
+            'expires_at': now + timedelta(hours=JOB_RETENTION_HOURS)
+        })
+        self._wakeup.set()
+        return str(result.inserted_id)
+
+    def get(self, job_id: str):
+        return self.collection.find_one({'_id': ObjectId(job_id)})
+
+    def _claim(self):
+        now = datetime.utcnow()
+        # A job whose lease ran out on its last attempt will never be claimed again
+        self.collection.update_many(
+            {'status': 'running', 'lease_until': {'$lt': now}, 'attempts': {'$gte': JOB_MAX_ATTEMPTS}},
+            {
+                '$set': {'status': 'failed', 'error': f'Job did not finish within {JOB_MAX_ATTEMPTS} attempts', 'finished_at': now},
+                '$unset': {'lease_until': ''}
+            }
+        )
+        return self.collection.find_one_and_update(
+            {
+                'type': {'$in': list(self._handlers)},
+                'attempts': {'$lt': JOB_MAX_ATTEMPTS},
+                '$or': [
+                    {'status': 'queued'},
+                    {'status': 'running', 'lease_until': {'$lt': now}}
+                ]
+            },
+            {
+                '$set': {'status': 'running', 'started_at': now, 'lease_until': now + timedelta(seconds=JOB_LEASE_SECONDS)},
+                '$inc': {'attempts': 1}
+            },
+            sort=[('created_at', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _progress_callback(self, job_id):
+        def progress(done: int, total: int, message: str = ''):
+            try:
+                self.collection.update_one(
+                    {'_id': job_id},
+                    {'$set': {
+                        'progress': {'done': done, 'total': total, 'message': message},
+                        'lease_until': datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)
+                    }}
+                )
+            except PyMongoError as e:
+                logger.warning(f"Could not record progress for job {job_id}: {e}")
+        return progress
+
+    def _execute(self, job):
+        handler = self._handlers[job['type']]
+        try:
+            result = handler(job['params'], self._progress_callback(job['_id']))
+            update = {'status': 'completed', 'result': result}
+        except Exception as e:
+            logger.error(f"Job {job['_id']} ({job['type']}) failed: {e}\n{traceback.format_exc()}")
+            update = {'status': 'failed', 'error': str(e)}
+        update['finished_at'] = datetime.utcnow()
+        try:
+            self._finish(job['_id'], update)
+        except (PyMongoError, BSONError) as e:
+            logger.error(f"Could not store the outcome of job {job['_id']}: {e}")
+            if update['status'] == 'completed':
+                # Most likely a result BSON cannot encode; record the failure instead
+                self._finish(job['_id'], {'status': 'failed', 'error': f'Job result could not be stored: {e}', 'finished_at': update['finished_at']})
+
+    def _finish(self, job_id, update: Dict):
+        self.collection.update_one({'_id': job_id}, {'$set': update, '$unset': {'lease_until': ''}})
+
+    def _worker_loop(self):
+        while True:
+            try:
+                job = self._claim()
+            except PyMongoError as e:
+                logger.warning(f"Job claim failed: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(JOB_POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            try:
+                self._execute(job)
+            except Exception as e:
+                # Never let one job take the worker thread down; its lease expiry retries or fails it
+                logger.error(f"Job {job['_id']} could not be completed: {e}")
+
+    def start_workers(self, num_workers: int = JOB_WORKERS):
+        """Start worker threads in this process (idempotent)"""
+        while len(self._workers) < num_workers:
+            worker = threading.Thread(target=self._worker_loop, name=f'job-worker-{len(self._workers)}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+
+job_queue = JobQueue()
+
+
+def init_collections(db_instance):
+    job_queue.init_collection(db_instance.generation_jobs)
+    if JOB_WORKERS > 0:
+        job_queue.start_workers(JOB_WORKERS)
+
@@ -0,0 +1,226 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import google.generativeai as genai  # type: ignore
+from services.rate_limiter import AdaptiveRateLimiter, LLM_RATE_LIMIT_EXPLICIT, LLM_RATE_LIMIT_RPS, is_rate_limit_error
+
+LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'gemini').lower()
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+FAKE_LLM_LATENCY_MS = float(os.getenv('FAKE_LLM_LATENCY_MS', 800))
+FAKE_LLM_JITTER_MS = float(os.getenv('FAKE_LLM_JITTER_MS', 200))
+FAKE_LLM_STREAM_CHUNKS = int(os.getenv('FAKE_LLM_STREAM_CHUNKS', 8))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 3))
+LLM_ACQUIRE_TIMEOUT = float(os.getenv('LLM_ACQUIRE_TIMEOUT', 30))
+# batch_generate runs prompts on a pool shared by every caller in the process
+LLM_BATCH_WORKERS = int(os.getenv('LLM_BATCH_WORKERS', 8))
+
+_batch_pool = ThreadPoolExecutor(max_workers=LLM_BATCH_WORKERS, thread_name_prefix='llm-batch')
+
+
+class LLMProvider:
+    """Interface for text-generation backends used by AITutorService"""
+
+    name = 'base'
+
+    def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        yield self.generate(prompt)
+
+    def batch_generate(self, prompts: List[str], consume: Optional[Callable[[Iterator[str]], Any]] = None) -> List[Any]:
+        """Responses to several prompts, generated concurrently and returned in prompt order.
+
+        With consume, each prompt's stream is handed to consume(chunks) as it
+        arrives and its return value takes the place of the text. A prompt
+        that fails gives its exception in its place, so one failure does not
+        lose the others."""
+        def run(prompt):
+            try:
+                return consume(self.generate_stream(prompt)) if consume else self.generate(prompt)
+            except Exception as e:
+                return e
+        if len(prompts) <= 1:
+            return [run(p) for p in prompts]
+        return list(_batch_pool.map(run, prompts))
+
+
+class GeminiProvider(LLMProvider):
+    name = 'gemini'
+
+    def __init__(self, model_name: str = GEMINI_MODEL):
+        # type: ignore is used to suppress linter errors for generativeai
+        self.model = genai.GenerativeModel(model_name)  # type: ignore
+
+    def generate(self, prompt: str) -> str:
+        return self.model.generate_content(prompt).text
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self.model.generate_content(prompt, stream=True):
+            yield chunk.text
+
+
+class FakeProvider(LLMProvider):
+    """Deterministic offline stand-in for load tests and benchmarks.
+
+    Responses are derived from a hash of the prompt, so the same prompt
+    always yields the same output, and each call sleeps for a configurable
+    latency so the Flask stack can be benchmarked without Google."""
+
+    name = 'fake'
+
+    def __init__(self, latency_ms: float = FAKE_LLM_LATENCY_MS, jitter_ms: float = FAKE_LLM_JITTER_MS,
+                 stream_chunks: int = FAKE_LLM_STREAM_CHUNKS):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.stream_chunks = max(1, stream_chunks)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _rng(self, prompt: str) -> random.Random:
+        return random.Random(int(hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:16], 16))
+
+    def _latency(self, rng: random.Random) -> float:
+        return max(0.0, self.latency_ms + rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+
+    def _respond(self, prompt: str, rng: random.Random) -> str:
+        if '"questions"' in prompt:
+            return self._questions_response(prompt, rng)
+        return self._explanation_response(prompt, rng)
+
+    def _questions_response(self, prompt: str, rng: random.Random) -> str:
+        count = re.search(r'Generate (\d+)', prompt)
+        num_questions = int(count.group(1)) if count else 5
+        context = re.search(r'subject: (.*?), topic: (.*?)\.\n', prompt)
+        subject, topic = context.groups() if context else ('General', 'General')
+        multiple_choice = 'multiple choice' in prompt
+        exam_type = re.search(r'"exam_type": "(\w+)"', prompt)
+        questions = []
+        for i in range(num_questions):
+            token = rng.randrange(10 ** 6)
+            question: Dict = {
+                'question': f"[{subject} / {topic}] Sample question {token}: which statement about concept {i + 1} is correct?",
+                'explanation': f"Concept {i + 1} of {topic} is explained step by step here (sample {token})."
+            }
+            if multiple_choice:
+                question.update({
+                    'options': {letter: f"Option {letter} for sample {token}" for letter in 'ABCD'},
+                    'correct_answer': rng.choice('ABCD'),
+                    'difficulty': 'medium',
+                    'topic': topic,
+                    'exam_type': exam_type.group(1) if exam_type else 'WAEC',
+                    'exam_year': str(rng.randint(2015, 2023))
+                })
+            questions.append(question)
+        return '```json\n' + json.dumps({'questions': questions}, indent=2) + '\n```'
+
+    def _explanation_response(self, prompt: str, rng: random.Random) -> str:
+        question = re.search(r"Student's Question: (.*)", prompt)
+        question = question.group(1).strip() if question else 'your question'
+        steps = rng.randint(2, 4)
+        lines = [f"## Explanation", f"**Question:** {question}", '']
+        lines += [f"**Step {i + 1}:** Work through part {i + 1} of the problem carefully." for i in range(steps)]
+        lines += ['', f"**Answer:** The final answer follows from step {steps}."]
+        return '\n'.join(lines)
+
+    def _count(self):
+        with self._lock:
+            self.calls += 1
+
+    def generate(self, prompt: str) -> str:
+        self._count()
+        rng = self._rng(prompt)
+        time.sleep(self._latency(rng))
+        return self._respond(prompt, rng)
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        self._count()
+        rng = self._rng(prompt)
+        total = self._latency(rng)
+        text = self._respond(prompt, rng)
+        size = max(1, -(-len(text) // self.stream_chunks))
+        # Time-to-first-chunk is a quarter of the total latency, the rest is spread over chunks
+        time.sleep(total / 4)
+        for i in range(0, len(text), size):
+            time.sleep(total * 3 / 4 / self.stream_chunks)
+            yield text[i:i + size]
+
+
+class RateLimitedProvider(LLMProvider):
+    """Wraps a provider with a shared token bucket and retries 429s with adaptive backoff.
+
+    batch_generate is the base one on purpose: each prompt then goes
+    through this class's generate or generate_stream, and so through the
+    limiter, rather than straight to the inner provider."""
+
+    def __init__(self, inner: LLMProvider, limiter: Optional[AdaptiveRateLimiter] = None, max_retries: int = LLM_MAX_RETRIES):
+        self.inner = inner
+        self.name = inner.name
+        self.limiter = limiter or AdaptiveRateLimiter()
+        self.max_retries = max_retries
+
+    def _acquire(self):
+        if not self.limiter.acquire(timeout=LLM_ACQUIRE_TIMEOUT):
+            raise RuntimeError('429 Rate limit: timed out waiting for model capacity')
+
+    def _backoff(self, attempt: int):
+        time.sleep(min(8.0, 0.5 * (2 ** attempt)) * random.uniform(0.5, 1.0))
+
+    def generate(self, prompt: str) -> str:
+        for attempt in range(self.max_retries + 1):
+            self._acquire()
+            try:
+                text = self.inner.generate(prompt)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                self.limiter.on_throttle()
+                self._backoff(attempt)
+                continue
+            self.limiter.on_success()
+            return text
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        for attempt in range(self.max_retries + 1):
+            self._acquire()
+            started = False
+            try:
+                for chunk in self.inner.generate_stream(prompt):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                # Only retry if nothing has been forwarded to the caller yet
+                if started or not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                self.limiter.on_throttle()
+                self._backoff(attempt)
+                continue
+            self.limiter.on_success()
+            return
+
+
+_providers: Dict[str, LLMProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(name: Optional[str] = None) -> LLMProvider:
+    """Return the shared provider instance selected by name or the LLM_PROVIDER env variable"""
+    name = (name or LLM_PROVIDER).lower()
+    with _providers_lock:
+        if name not in _providers:
+            if name == 'gemini':
+                provider = GeminiProvider()
+            elif name == 'fake':
+                provider = FakeProvider()
+            else:
+                raise ValueError(f"Unknown LLM provider: {name}")
+            # One limiter per process, shared by every request thread and fan-out chunk
+            limited = LLM_RATE_LIMIT_RPS > 0 and (name != 'fake' or LLM_RATE_LIMIT_EXPLICIT)
+            _providers[name] = RateLimitedProvider(provider) if limited else provider
+        return _providers[name]
@@ -0,0 +1,194 @@
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from bson import ObjectId
+from pymongo import DeleteMany, ReplaceOne, UpdateOne
+
+# A bucket holds one group's messages for a time window, capped at a message count
+CHAT_BUCKET_SECONDS = int(os.getenv('CHAT_BUCKET_SECONDS', 3600))
+CHAT_BUCKET_MAX_MESSAGES = int(os.getenv('CHAT_BUCKET_MAX_MESSAGES', 200))
+# Buckets older than this are merged into full day-sized buckets and moved to the archive
+CHAT_ARCHIVE_DAYS = int(os.getenv('CHAT_ARCHIVE_DAYS', 30))
+
+MESSAGE_FIELDS = ('_id', 'user_id', 'content', 'message_type', 'user_name', 'created_at')
+
+
+def bucket_start(when: datetime, seconds: int = CHAT_BUCKET_SECONDS) -> datetime:
+    epoch = int((when - datetime(1970, 1, 1)).total_seconds())
+    return datetime(1970, 1, 1) + timedelta(seconds=epoch - epoch % seconds)
+
+
+def _id_time(message_id: ObjectId) -> datetime:
+    return message_id.generation_time.replace(tzinfo=None)
+
+
+def _with_group(bucket_doc: Dict, messages: Iterable[Dict]) -> List[Dict]:
+    return [dict(m, group_id=bucket_doc['group_id']) for m in messages]
+
+
+def _merge(messages: List[Dict]) -> List[Dict]:
+    """Messages in id order with duplicates (a message mid-migration is in both stores) dropped"""
+    return sorted({m['_id']: m for m in messages}.values(), key=lambda m: m['_id'])
+
+
+class MessageStore:
+    """Group chat messages stored as arrays in time-bucketed documents.
+
+    Each (group, time window) gets a document holding up to
+    CHAT_BUCKET_MAX_MESSAGES messages in arrival order, so reading the tail
+    of a chat touches one or two documents, and the (group_id, bucket) index
+    has one entry per bucket rather than per message. Old buckets are
+    compacted and moved to an archive collection by compact(). Until
+    migrate_legacy() has emptied the one-document-per-message group_messages
+    collection, reads also consult it, so no history goes missing."""
+
+    def __init__(self):
+        self.collection = None
+        self.archive_collection = None
+        self.legacy_collection = None
+        # None until checked; stays True in running processes until they restart after the migration
+        self._legacy_pending: Optional[bool] = None
+
+    def init_collections(self, db_instance):
+        self.collection = db_instance.group_message_buckets
+        self.archive_collection = db_instance.group_message_archive
+        self.legacy_collection = db_instance.group_messages
+        self._legacy_pending = None
+
+    def _has_legacy(self) -> bool:
+        if self._legacy_pending is None:
+            self._legacy_pending = self.legacy_collection.find_one({}, {'_id': 1}) is not None
+        return self._legacy_pending
+
+    def append(self, group_id: ObjectId, message: Dict) -> Dict:
+        """Store a message (given without _id) and return it with its new _id and group_id"""
+        message = dict(message, _id=ObjectId())
+        # Push into a non-full bucket for this window, or start a new one. The window comes from the id,
+        # not created_at, so every message newer than an id is in that id's window or a later one
+        self.collection.update_one(
+            {'group_id': group_id, 'bucket': bucket_start(_id_time(message['_id'])), 'count': {'$lt': CHAT_BUCKET_MAX_MESSAGES}},
+            {
+                '$push': {'messages': {f: message.get(f) for f in MESSAGE_FIELDS}},
+                '$inc': {'count': 1},
+                '$max': {'last_id': message['_id']},
+                '$setOnInsert': {'first_id': message['_id']}
+            },
+            upsert=True
+        )
+        message['group_id'] = group_id
+        return message
+
+    def tail(self, group_id: ObjectId, limit: int) -> List[Dict]:
+        """Newest messages, oldest first, reading buckets from the newest back"""
+        collected: List[Dict] = []
+        for collection in (self.collection, self.archive_collection):
+            buckets = collection.find({'group_id': group_id}).sort([('bucket', -1), ('first_id', -1)]).batch_size(4)
+            for bucket in buckets:
+                collected.extend(_with_group(bucket, bucket['messages']))
+                if len(collected) >= limit:
+                    break
+            if len(collected) >= limit:
+                break
+        if len(collected) < limit and self._has_legacy():
+            # Legacy messages all predate the buckets
+            collected.extend(self.legacy_collection.find({'group_id': group_id}).sort('_id', -1).limit(limit))
+        return _merge(collected)[-limit:]
+
+    def after(self, group_ids: List[ObjectId], since_id: ObjectId, limit: Optional[int] = None) -> List[Dict]:
+        """Messages with _id greater than since_id in any of the groups, oldest first.
+
+        Only buckets whose window can contain newer messages are read, and
+        older messages are filtered out on the server."""
+        since = _id_time(since_id)
+        messages = self._after_buckets(self.collection, group_ids, since_id, bucket_start(since))
+        # Archive buckets are day-sized; for a recent since_id this is an empty index range
+        messages += self._after_buckets(self.archive_collection, group_ids, since_id, bucket_start(since, 86400))
+        if self._has_legacy():
+            query = {'group_id': {'$in': group_ids}, '_id': {'$gt': since_id}}
+            messages += list(self.legacy_collection.find(query).sort('_id', 1).limit(limit or 0))
+        messages = _merge(messages)
+        return messages[:limit] if limit else messages
+
+    def _after_buckets(self, collection, group_ids: List[ObjectId], since_id: ObjectId, window: datetime) -> List[Dict]:
+        buckets = collection.aggregate([
+            {'$match': {
+                'group_id': {'$in': group_ids},
+                'bucket': {'$gte': window},
+                'last_id': {'$gt': since_id}
+            }},
+            {'$project': {
+                'group_id': 1,
+                'messages': {'$filter': {'input': '$messages', 'as': 'm', 'cond': {'$gt': ['$$m._id', since_id]}}}
+            }}
+        ])
+        return [m for bucket in buckets for m in _with_group(bucket, bucket['messages'])]
+
+    def compact(self, older_than_days: int = CHAT_ARCHIVE_DAYS) -> Dict:
+        """Merge old buckets per group into day-sized buckets (still capped) and move them to the archive"""
+        cutoff = bucket_start(datetime.utcnow() - timedelta(days=older_than_days), 86400)
+        moved = written = 0
+        for group_id in self.collection.distinct('group_id', {'bucket': {'$lt': cutoff}}):
+            old = list(self.collection.find({'group_id': group_id, 'bucket': {'$lt': cutoff}}).sort([('bucket', 1), ('first_id', 1)]))
+            merged: List[Dict] = []
+            for bucket in old:
+                day = bucket_start(bucket['bucket'], 86400)
+                if not merged or merged[-1]['bucket'] != day or merged[-1]['count'] + bucket['count'] > CHAT_BUCKET_MAX_MESSAGES:
+                    # Keyed by its first message so a re-run after a crash overwrites instead of duplicating
+                    merged.append({'_id': bucket['first_id'], 'group_id': group_id, 'bucket': day, 'messages': [], 'count': 0, 'first_id': bucket['first_id']})
+                merged[-1]['messages'].extend(bucket['messages'])
+                merged[-1]['count'] += bucket['count']
+                merged[-1]['last_id'] = bucket['last_id']
+            self.archive_collection.bulk_write([ReplaceOne({'_id': doc['_id']}, doc, upsert=True) for doc in merged], ordered=True)
+            self.collection.bulk_write([DeleteMany({'_id': {'$in': [b['_id'] for b in old]}})])
+            moved += len(old)
+            written += len(merged)
+        return {'buckets_archived': moved, 'archive_documents': written}
+
+    def migrate_legacy(self, batch_size: int = 1000) -> int:
+        """Move one-document-per-message group_messages into buckets, keeping their ids.
+
+        Each batch is written with one bulk write and then deleted from the
+        legacy collection; a re-run after a crash skips messages already
+        copied."""
+        migrated = 0
+        while True:
+            batch = list(self.legacy_collection.find().sort('_id', 1).limit(batch_size))
+            if not batch:
+                self._legacy_pending = False
+                return migrated
+            ids = [doc['_id'] for doc in batch]
+            copied = {
+                m['_id'] for bucket in self.collection.find(
+                    {'group_id': {'$in': list({doc['group_id'] for doc in batch})}, 'messages._id': {'$in': ids}},
+                    {'messages._id': 1}
+                ) for m in bucket['messages']
+            }
+            windows: Dict = {}
+            for doc in batch:
+                if doc['_id'] not in copied:
+                    windows.setdefault((doc['group_id'], bucket_start(_id_time(doc['_id']))), []).append(doc)
+            ops = []
+            for (group_id, bucket), docs in windows.items():
+                for i in range(0, len(docs), CHAT_BUCKET_MAX_MESSAGES):
+                    chunk = docs[i:i + CHAT_BUCKET_MAX_MESSAGES]
+                    ops.append(UpdateOne(
+                        {'group_id': group_id, 'bucket': bucket, 'count': {'$lte': CHAT_BUCKET_MAX_MESSAGES - len(chunk)}},
+                        {
+                            '$push': {'messages': {'$each': [{f: doc.get(f) for f in MESSAGE_FIELDS} for doc in chunk], '$sort': {'_id': 1}}},
+                            '$inc': {'count': len(chunk)},
+                            '$max': {'last_id': chunk[-1]['_id']},
+                            '$min': {'first_id': chunk[0]['_id']}
+                        },
+                        upsert=True
+                    ))
+                    migrated += len(chunk)
+            if ops:
+                # Ordered: several chunks may fill the same window in turn
+                self.collection.bulk_write(ops, ordered=True)
+            self.legacy_collection.delete_many({'_id': {'$in': ids}})
+
+message_store = MessageStore()
+
+
+def init_collections(db_instance):
+    message_store.init_collections(db_instance)
@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+from bson import ObjectId
+
+PROFILE_CACHE_TTL_SECONDS = int(os.getenv('PROFILE_CACHE_TTL_SECONDS', 60))
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 8192))
+
+PROFILE_PROJECTION = {'full_name': 1, 'grade_level': 1, 'subjects': 1}
+
+
+class ProfileCache:
+    """Short-TTL in-process cache of the public user fields shown in group pages and chat.
+
+    Misses are loaded together with one $in query, so resolving N members
+    costs at most one round trip."""
+
+    def __init__(self, ttl: int = PROFILE_CACHE_TTL_SECONDS, max_entries: int = PROFILE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.users_collection = None
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_collection(self, users_collection):
+        self.users_collection = users_collection
+
+    def get_many(self, user_ids: Iterable[str]) -> Dict[str, Dict]:
+        """Profiles keyed by user id; unknown or invalid ids are omitted"""
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for user_id in dict.fromkeys(str(u) for u in user_ids):
+                entry = self._entries.get(user_id)
+                if entry is not None and now - entry[0] < self.ttl:
+                    self._entries.move_to_end(user_id)
+                    found[user_id] = entry[1]
+                elif ObjectId.is_valid(user_id):
+                    missing.append(user_id)
+        if missing:
+            users = self.users_collection.find({'_id': {'$in': [ObjectId(u) for u in missing]}}, PROFILE_PROJECTION)
+            loaded = {
+                str(user['_id']): {
+                    'id': str(user['_id']),
+                    'name': user.get('full_name'),
+                    'grade_level': user.get('grade_level', ''),
+                    'subjects': user.get('subjects', [])
+                }
+                for user in users
+            }
+            with self._lock:
+                for user_id, profile in loaded.items():
+                    self._entries[user_id] = (now, profile)
+                    self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            found.update(loaded)
+        return found
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        return self.get_many([user_id]).get(str(user_id))
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+
+profile_cache = ProfileCache()
+
+
+def init_collections(db_instance):
+    profile_cache.init_collection(db_instance.users)
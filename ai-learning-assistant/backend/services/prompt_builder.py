@@ -0,0 +1,183 @@
+import os
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from services.question_bank import question_hash
+
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', 1200))
+PROMPT_EXCLUDE_MAX_WORDS = int(os.getenv('PROMPT_EXCLUDE_MAX_WORDS', 16))
+# Rough English average for Gemini's tokenizer; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+EXAM_CONTEXT = {
+    "WAEC": "West African Examinations Council (WAEC) style questions",
+    "JAMB": "Joint Admissions and Matriculation Board (JAMB) style questions",
+    "NECO": "National Examinations Council (NECO) style questions",
+    "IGCSE": "International General Certificate of Secondary Education style questions"
+}
+
+PRACTICE_TEMPLATE = '''
+Generate {num_questions} practice questions for the subject: {subject}, topic: {topic}.
+Requirements:
+- Each question must be open-ended and require a written explanation.
+- Each question must be unique, not repeated, and strictly related to the subject and topic provided.
+- Do NOT use multiple choice, options, or correct answer letters.
+- Do NOT include questions from other subjects or topics.
+- For each question, provide a clear, step-by-step explanation as the answer.
+{exclude_text}{batch_hint}
+Return as a JSON array:
+{{
+  "questions": [
+    {{
+      "question": "...",
+      "explanation": "..."
+    }}
+  ]
+}}
+Make sure the JSON is valid and properly formatted.
+'''
+
+EXAM_TEMPLATE = '''
+Generate {num_questions} unique multiple choice questions for the subject: {subject}, topic: {topic}.
+Requirements:
+- Each question must be different, not repeated, and strictly related to the subject and topic provided.
+- Each question must be unique and not similar to any other in the set.
+- Style: {style}
+- Difficulty: {difficulty}
+- Format: Each question should have 4 options (A, B, C, D)
+- Include explanations for correct answers
+- Questions should be objective and test understanding
+- Use Nigerian context where appropriate
+- For each question, specify the exam type (e.g., 'WAEC', 'JAMB', 'NECO') and the year (e.g., '2019', '2021') the question is drafted from. Use realistic years between 2015 and 2023. If the question is not from a real past exam, make a plausible year and type.
+- Do NOT include any questions from other subjects or topics.
+{exclude_text}{batch_hint}
+You must return exactly {num_questions} unique questions in a valid JSON array as shown below. Do not repeat any question. Do not return only one question. Each question must have exam_type and exam_year fields.
+Return the questions in this exact JSON format:
+{{
+    "questions": [
+        {{
+            "question": "Question text here?",
+            "options": {{
+                "A": "Option A",
+                "B": "Option B", 
+                "C": "Option C",
+                "D": "Option D"
+            }},
+            "correct_answer": "A",
+            "explanation": "Explanation of why this is correct",
+            "difficulty": "{difficulty}",
+            "topic": "{topic}",
+            "exam_type": "{exam_type}",
+            "exam_year": "2019"
+        }}
+    ]
+}}
+Make sure the JSON is valid and properly formatted.
+'''
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _escape(value: str) -> str:
+    return value.replace('{', '{{').replace('}', '}}')
+
+
+@lru_cache(maxsize=32)
+def question_template(mode: str, exam_type: Optional[str] = None) -> str:
+    """Template for a (mode, exam_type) with its static parts filled in; per-call fields stay as placeholders"""
+    if mode == 'practice':
+        return PRACTICE_TEMPLATE
+    style = EXAM_CONTEXT.get(exam_type, EXAM_CONTEXT["WAEC"])
+    return EXAM_TEMPLATE.replace('{style}', _escape(style)).replace('{exam_type}', _escape(exam_type or ''))
+
+
+def compact_exclusions(questions: Optional[List[str]], budget_tokens: int) -> Tuple[str, int, int]:
+    """Render an exclusion list that fits budget_tokens.
+
+    Duplicates are dropped by text hash, each entry is shortened to its first
+    PROMPT_EXCLUDE_MAX_WORDS words and the most recent entries are kept; the
+    rest are summarised in one line. Returns (text, kept, dropped)."""
+    if not questions:
+        return '', 0, 0
+    lines, hashes = [], set()
+    for q in reversed(questions):
+        text_hash = question_hash(q)
+        if not q or text_hash in hashes:
+            continue
+        hashes.add(text_hash)
+        words = q.split()
+        lines.append('- ' + ' '.join(words[:PROMPT_EXCLUDE_MAX_WORDS]) + (' ...' if len(words) > PROMPT_EXCLUDE_MAX_WORDS else ''))
+    header = '\nDo NOT repeat or reuse any of these questions:'
+    used = estimate_tokens(header)
+    kept = []
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget_tokens:
+            break
+        kept.append(line)
+        used += cost
+    dropped = len(lines) - len(kept)
+    if not kept:
+        return '\nDo NOT repeat questions already asked on this topic.', 0, dropped
+    text = header + ''.join('\n' + line for line in reversed(kept))
+    if dropped:
+        text += f"\n- (and {dropped} earlier questions on this topic; ask about different aspects)"
+    return text, len(kept), dropped
+
+
+class PromptMetrics:
+    """Prompt-size counters for this worker"""
+
+    def __init__(self):
+        self.built = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+        self.over_budget = 0
+        self.exclusions_kept = 0
+        self.exclusions_dropped = 0
+        self._lock = threading.Lock()
+
+    def record(self, tokens: int, kept: int, dropped: int, budget: int):
+        with self._lock:
+            self.built += 1
+            self.total_tokens += tokens
+            self.max_tokens = max(self.max_tokens, tokens)
+            self.over_budget += tokens > budget
+            self.exclusions_kept += kept
+            self.exclusions_dropped += dropped
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'built': self.built,
+                'avg_tokens': round(self.total_tokens / self.built, 1) if self.built else 0,
+                'max_tokens': self.max_tokens,
+                'over_budget': self.over_budget,
+                'token_budget': PROMPT_TOKEN_BUDGET,
+                'exclusions_kept': self.exclusions_kept,
+                'exclusions_dropped': self.exclusions_dropped,
+                'templates': question_template.cache_info()._asdict()
+            }
+
+
+prompt_metrics = PromptMetrics()
+
+
+def build_questions_prompt(subject: str, topic: str, difficulty: str, num_questions: int, exam_type: Optional[str],
+                           exclude_questions: Optional[List[str]] = None, batch_hint: str = '',
+                           token_budget: int = PROMPT_TOKEN_BUDGET) -> str:
+    """Assemble a question-generation prompt whose exclusion list is trimmed to fit token_budget"""
+    if not exam_type or exam_type.lower() == 'practice':
+        template = question_template('practice')
+    else:
+        template = question_template('exam', exam_type)
+    fields = dict(num_questions=num_questions, subject=subject, topic=topic, difficulty=difficulty, batch_hint=batch_hint)
+    prompt = template.format(exclude_text='', **fields)
+    kept = dropped = 0
+    if exclude_questions:
+        exclude_text, kept, dropped = compact_exclusions(exclude_questions, token_budget - estimate_tokens(prompt))
+        prompt = template.format(exclude_text=exclude_text, **fields)
+    prompt_metrics.record(estimate_tokens(prompt), kept, dropped, token_budget)
+    return prompt
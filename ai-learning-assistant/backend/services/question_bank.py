@@ -0,0 +1,210 @@
+import os
+import hashlib
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger("gemini.bank")
+
+BANK_LOW_WATER = int(os.getenv('QUESTION_BANK_LOW_WATER', 30))
+BANK_HIGH_WATER = int(os.getenv('QUESTION_BANK_HIGH_WATER', 60))
+BANK_REFILL_BATCH = int(os.getenv('QUESTION_BANK_REFILL_BATCH', 10))
+BANK_REFILL_INTERVAL = int(os.getenv('QUESTION_BANK_REFILL_INTERVAL', 300))
+BANK_POPULAR_DAYS = int(os.getenv('QUESTION_BANK_POPULAR_DAYS', 7))
+BANK_REFILL_ENABLED = os.getenv('QUESTION_BANK_REFILL_ENABLED', 'true').lower() == 'true'
+BANK_LEASE_SECONDS = 600
+
+BUCKET_FIELDS = ('subject', 'topic', 'exam_type', 'difficulty')
+
+# IRT difficulty given to questions until calibrate_irt.py fits them from attempt data
+DIFFICULTY_PRIOR = {'easy': -1.0, 'medium': 0.0, 'hard': 1.0}
+
+
+def question_hash(text: str) -> str:
+    """Hash of the lowercased, whitespace-collapsed question text used for de-duplication"""
+    return hashlib.sha1(' '.join((text or '').lower().split()).encode('utf-8')).hexdigest()
+
+
+def make_bucket(subject: str, topic: str, exam_type: Optional[str], difficulty: Optional[str]) -> Dict:
+    exam_type = exam_type or 'practice'
+    return {
+        'subject': ' '.join((subject or '').lower().split()),
+        'topic': ' '.join((topic or '').lower().split()),
+        'exam_type': 'practice' if exam_type.lower() == 'practice' else exam_type.upper(),
+        'difficulty': (difficulty or 'medium').lower()
+    }
+
+
+def _bucket_id(bucket: Dict) -> str:
+    return '|'.join(bucket[f] for f in BUCKET_FIELDS)
+
+
+class QuestionBank:
+    """Persistent pool of pre-generated questions, sampled per (subject, topic, exam_type, difficulty)"""
+
+    def __init__(self):
+        self.collection = None
+        self.buckets_collection = None
+        self._queue: "queue.Queue[Tuple[str, Dict]]" = queue.Queue()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._worker = None
+        self._generator = None
+
+    def init_collections(self, collection, buckets_collection):
+        self.collection = collection
+        self.buckets_collection = buckets_collection
+
+    def count(self, bucket: Dict) -> int:
+        return self.collection.count_documents(dict(bucket))
+
+    def add_questions(self, bucket: Dict, questions: List[Dict]) -> int:
+        """Insert questions into a bucket, skipping any already stored (same normalized text)"""
+        now = datetime.utcnow()
+        docs, seen = [], set()
+        for q in questions:
+            text_hash = question_hash(q.get('question', ''))
+            if not q.get('question') or text_hash in seen:
+                continue
+            seen.add(text_hash)
+            docs.append(dict(bucket, text_hash=text_hash, payload=q, created_at=now,
+                             irt_a=1.0, irt_b=DIFFICULTY_PRIOR.get(bucket['difficulty'], 0.0)))
+        if not docs:
+            return 0
+        try:
+            result = self.collection.insert_many(docs, ordered=False)
+            return len(result.inserted_ids)
+        except BulkWriteError as e:
+            # Duplicate key errors are expected: the unique index is the dedup check
+            fatal = [err for err in e.details.get('writeErrors', []) if err.get('code') != 11000]
+            if fatal:
+                logger.error(f"Question bank insert failed: {fatal[0].get('errmsg')}")
+            return e.details.get('nInserted', 0)
+
+    def sample(self, bucket: Dict, num_questions: int) -> List[Dict]:
+        """Return up to num_questions random questions from the bucket, queueing a refill if it runs low"""
+        self._record_demand(bucket)
+        docs = list(self.collection.aggregate([
+            {'$match': dict(bucket)},
+            {'$sample': {'size': num_questions}},
+            {'$project': {'_id': 0, 'payload': 1}}
+        ]))
+        # Counting stops at the low-water mark, so the check stays cheap for full buckets
+        if len(docs) < num_questions or self.collection.count_documents(dict(bucket), limit=BANK_LOW_WATER) < BANK_LOW_WATER:
+            self.request_refill(bucket)
+        return [doc['payload'] for doc in docs]
+
+    def _record_demand(self, bucket: Dict):
+        try:
+            self.buckets_collection.update_one(
+                {'_id': _bucket_id(bucket)},
+                {'$set': dict(bucket, last_requested_at=datetime.utcnow()), '$inc': {'requests': 1}},
+                upsert=True
+            )
+        except PyMongoError as e:
+            logger.warning(f"Could not record question bank demand: {e}")
+
+    def request_refill(self, bucket: Dict):
+        """Queue a bucket for background refill (no-op if already queued in this process)"""
+        key = _bucket_id(bucket)
+        with self._pending_lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self._queue.put((key, dict(bucket)))
+
+    def _acquire_lease(self, key: str) -> bool:
+        # Only one process refills a bucket at a time
+        now = datetime.utcnow()
+        doc = self.buckets_collection.find_one_and_update(
+            {'_id': key, '$or': [{'refill_lease_until': {'$exists': False}}, {'refill_lease_until': {'$lt': now}}]},
+            {'$set': {'refill_lease_until': now + timedelta(seconds=BANK_LEASE_SECONDS)}}
+        )
+        return doc is not None
+
+    def _release_lease(self, key: str):
+        self.buckets_collection.update_one({'_id': key}, {'$unset': {'refill_lease_until': ''}})
+
+    def refill(self, bucket: Dict, target: int = BANK_HIGH_WATER) -> int:
+        """Generate questions until the bucket holds at least target questions; returns number added"""
+        key = _bucket_id(bucket)
+        if not self._acquire_lease(key):
+            return 0
+        added = 0
+        try:
+            stalled = 0
+            while stalled < 3:
+                missing = target - self.count(bucket)
+                if missing <= 0:
+                    break
+                questions = self._generator(
+                    subject=bucket['subject'],
+                    topic=bucket['topic'],
+                    difficulty=bucket['difficulty'],
+                    num_questions=min(missing, BANK_REFILL_BATCH),
+                    exam_type=bucket['exam_type'],
+                    allow_fallback=False
+                )
+                inserted = self.add_questions(bucket, questions)
+                added += inserted
+                stalled = stalled + 1 if inserted == 0 else 0
+            logger.info(f"Question bank refill {key}: added {added}")
+        finally:
+            self._release_lease(key)
+        return added
+
+    def _low_buckets(self) -> List[Dict]:
+        since = datetime.utcnow() - timedelta(days=BANK_POPULAR_DAYS)
+        popular = self.buckets_collection.find(
+            {'last_requested_at': {'$gte': since}},
+            {f: 1 for f in BUCKET_FIELDS}
+        ).sort('requests', -1).limit(50)
+        buckets = [{f: doc[f] for f in BUCKET_FIELDS} for doc in popular]
+        return [b for b in buckets if self.count(b) < BANK_LOW_WATER]
+
+    def _sweep(self):
+        try:
+            for bucket in self._low_buckets():
+                self.request_refill(bucket)
+        except PyMongoError as e:
+            logger.warning(f"Question bank sweep failed: {e}")
+
+    def _run(self):
+        last_sweep = 0.0
+        while True:
+            if time.time() - last_sweep >= BANK_REFILL_INTERVAL:
+                self._sweep()
+                last_sweep = time.time()
+            try:
+                key, bucket = self._queue.get(timeout=BANK_REFILL_INTERVAL)
+            except queue.Empty:
+                continue
+            try:
+                self.refill(bucket)
+            except Exception as e:
+                logger.error(f"Question bank refill failed for {key}: {e}")
+            finally:
+                with self._pending_lock:
+                    self._pending.discard(key)
+
+    def start_refill_worker(self, generator):
+        """Start the background refill thread; generator has the AITutorService.generate_questions signature"""
+        if self._worker is not None:
+            return
+        self._generator = generator
+        self._worker = threading.Thread(target=self._run, name='question-bank-refill', daemon=True)
+        self._worker.start()
+
+
+question_bank = QuestionBank()
+
+
+def init_collections(db_instance):
+    question_bank.init_collections(db_instance.question_bank, db_instance.question_bank_buckets)
+    if BANK_REFILL_ENABLED:
+        from services.ai_service import AITutorService
+        question_bank.start_refill_worker(AITutorService().generate_questions)
@@ -0,0 +1,133 @@
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+# Model requests per minute allowed for the whole deployment (Gemini 1.5 Flash pay-as-you-go quota)
+LLM_QUOTA_RPM = float(os.getenv('LLM_QUOTA_RPM', 2000))
+# Processes sharing that quota: gunicorn workers plus any job_worker.py processes
+LLM_QUOTA_PROCESSES = int(os.getenv('LLM_QUOTA_PROCESSES', os.getenv('WEB_CONCURRENCY', 4)))
+# Per-process limit (0 disables); defaults to this process's share of the quota. The
+# offline fake provider is only limited when it is set explicitly.
+LLM_RATE_LIMIT_EXPLICIT = 'LLM_RATE_LIMIT_RPS' in os.environ
+LLM_RATE_LIMIT_RPS = float(os.getenv('LLM_RATE_LIMIT_RPS', LLM_QUOTA_RPM / 60 / max(1, LLM_QUOTA_PROCESSES)))
+LLM_RATE_LIMIT_BURST = int(os.getenv('LLM_RATE_LIMIT_BURST', 8))
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True for quota/429 errors from the model API"""
+    if getattr(error, 'code', None) == 429 or type(error).__name__ in ('ResourceExhausted', 'TooManyRequests'):
+        return True
+    message = str(error).lower()
+    return '429' in message or 'quota' in message or 'rate limit' in message
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose refill rate backs off multiplicatively on 429s and recovers additively on success"""
+
+    def __init__(self, rate: float = LLM_RATE_LIMIT_RPS, burst: int = LLM_RATE_LIMIT_BURST, min_rate: Optional[float] = None):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 16
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Block until a token is available; returns False if timeout elapses first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, now + (retry_after or 1 / self.rate))
+            self.throttled += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'rate': round(self.rate, 3), 'max_rate': self.max_rate, 'tokens': round(self.tokens, 2), 'throttled': self.throttled}
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.listeners: List[Callable] = []
+        self.last_progress: Optional[tuple] = None
+
+    def progress(self, *args):
+        """Forward a progress update to every caller waiting on this execution"""
+        self.last_progress = args
+        for listener in list(self.listeners):
+            try:
+                listener(*args)
+            except Exception:
+                pass
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution whose result all callers share.
+
+    fn is called with a progress callable; its updates reach the progress
+    callback of every caller sharing the execution, including ones that join
+    midway (they first receive the latest update)."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[Callable], Any], progress: Optional[Callable] = None) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            if progress:
+                call.listeners.append(progress)
+                last = call.last_progress
+        if progress and not leader and last:
+            progress(*last)
+        if not leader:
+            call.event.wait()
+            with self._lock:
+                self.shared += 1
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn(call.progress)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
@@ -0,0 +1,245 @@
+import os
+import re
+import random
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger("gemini.cache")
+
+CACHE_TTL_SECONDS = int(os.getenv('AI_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+CACHE_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', 2048))
+CACHE_SIMILARITY_THRESHOLD = float(os.getenv('AI_CACHE_SIMILARITY', 0.8))
+CACHE_SIMILARITY_ENABLED = os.getenv('AI_CACHE_SIMILARITY_ENABLED', 'true').lower() == 'true'
+
+# MinHash parameters: 64 permutations split into 16 LSH bands of 4 rows
+NUM_PERMUTATIONS = 64
+BAND_ROWS = 4
+STOPWORDS = {
+    'a', 'an', 'the', 'i', 'me', 'my', 'we', 'you', 'is', 'are', 'was', 'be', 'do', 'does', 'did', 'can', 'could',
+    'would', 'should', 'will', 'how', 'what', 'why', 'please', 'explain', 'define', 'tell', 'show', 'help',
+    'to', 'of', 'in', 'on', 'for', 'this', 'that', 'it', 'and', 'or', 'about', 'meaning', 'mean'
+}
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1337)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Lowercase and collapse whitespace/punctuation so trivially different questions share a key"""
+    text = (text or '').lower()
+    text = re.sub(r'\s*([+\-*/=^()])\s*', r'\1', text)
+    text = re.sub(r'[^\w+\-*/=^().]+', ' ', text)
+    text = re.sub(r'\.(?!\d)', ' ', text)
+    return ' '.join(text.split())
+
+
+def _numbers(text: str) -> List[str]:
+    # Paraphrases may only match when they mention exactly the same numbers,
+    # otherwise "2x+5=13" and "2x+5=15" would share an answer
+    return re.findall(r'\d+(?:\.\d+)?', text)
+
+
+def _shingles(text: str) -> set:
+    # Content words plus adjacent pairs, so word order still matters
+    # ("celsius to fahrenheit" vs "fahrenheit to celsius")
+    words = [w for w in text.split() if w not in STOPWORDS] or text.split() or ['']
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def _minhash(text: str) -> List[int]:
+    shingles = _shingles(text)
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big') for s in shingles]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def _bands(signature: List[int]) -> List[str]:
+    bands = []
+    for i in range(0, len(signature), BAND_ROWS):
+        rows = ','.join(str(v) for v in signature[i:i + BAND_ROWS])
+        bands.append(f"{i // BAND_ROWS}:{hashlib.md5(rows.encode('utf-8')).hexdigest()[:16]}")
+    return bands
+
+
+def _similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    if not sig_a or len(sig_a) != len(sig_b):
+        return 0.0
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+class ResponseCache:
+    """Two-level (in-process LRU + shared MongoDB) cache for tutor explanations"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: int = CACHE_TTL_SECONDS,
+                 similarity_threshold: float = CACHE_SIMILARITY_THRESHOLD, similarity_enabled: bool = CACHE_SIMILARITY_ENABLED):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.similarity_enabled = similarity_enabled
+        self.collection = None
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'local_hits': 0, 'shared_hits': 0, 'similar_hits': 0, 'misses': 0, 'stores': 0, 'errors': 0}
+
+    def init_collection(self, collection):
+        self.collection = collection
+
+    def _describe(self, subject, topic, question, grade_level) -> Tuple[str, str, str]:
+        bucket_raw = '|'.join(normalize_text(v) for v in (subject, topic, grade_level or 'secondary'))
+        bucket = hashlib.sha1(bucket_raw.encode('utf-8')).hexdigest()
+        norm_question = normalize_text(question)
+        key = hashlib.sha1(f"{bucket}|{norm_question}".encode('utf-8')).hexdigest()
+        return key, bucket, norm_question
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _remember(self, key: str, entry: Dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _local_get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires_at'] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _local_similar(self, bucket: str, numbers: List[str], signature: List[int]) -> Optional[Dict]:
+        now = time.time()
+        best, best_score = None, self.similarity_threshold
+        with self._lock:
+            for entry in self._entries.values():
+                if entry['bucket'] != bucket or entry['numbers'] != numbers or entry['expires_at'] <= now:
+                    continue
+                score = _similarity(signature, entry['signature'])
+                if score >= best_score:
+                    best, best_score = entry, score
+        return best
+
+    def _shared_get(self, key: str) -> Optional[Dict]:
+        if self.collection is None:
+            return None
+        return self.collection.find_one({'_id': key, 'expires_at': {'$gt': datetime.utcnow()}})
+
+    def _shared_similar(self, bucket: str, numbers: List[str], signature: List[int]) -> Optional[Dict]:
+        if self.collection is None:
+            return None
+        candidates = self.collection.find(
+            {'bucket': bucket, 'bands': {'$in': _bands(signature)}, 'numbers': numbers, 'expires_at': {'$gt': datetime.utcnow()}},
+            {'response': 1, 'signature': 1, 'numbers': 1, 'bucket': 1, 'expires_at': 1}
+        ).limit(20)
+        best, best_score = None, self.similarity_threshold
+        for doc in candidates:
+            score = _similarity(signature, doc.get('signature', []))
+            if score >= best_score:
+                best, best_score = doc, score
+        return best
+
+    def _entry_from_doc(self, doc: Dict) -> Dict:
+        return {
+            'response': doc['response'],
+            'bucket': doc['bucket'],
+            'numbers': doc['numbers'],
+            'signature': doc['signature'],
+            'expires_at': time.time() + max(0.0, (doc['expires_at'] - datetime.utcnow()).total_seconds())
+        }
+
+    def get(self, subject: str, topic: str, question: str, grade_level: Optional[str] = None) -> Optional[str]:
+        """Return a cached explanation for this question (or a close paraphrase), or None"""
+        key, bucket, norm_question = self._describe(subject, topic, question, grade_level)
+        entry = self._local_get(key)
+        if entry:
+            self._count('local_hits')
+            return entry['response']
+
+        numbers = _numbers(norm_question)
+        signature = _minhash(norm_question) if self.similarity_enabled else []
+        try:
+            doc = self._shared_get(key)
+            if doc:
+                self._remember(key, self._entry_from_doc(doc))
+                self._count('shared_hits')
+                return doc['response']
+        except PyMongoError as e:
+            logger.warning(f"Response cache lookup failed: {e}")
+            self._count('errors')
+
+        if self.similarity_enabled:
+            entry = self._local_similar(bucket, numbers, signature)
+            if entry is None:
+                try:
+                    doc = self._shared_similar(bucket, numbers, signature)
+                    if doc:
+                        entry = self._entry_from_doc(doc)
+                except PyMongoError as e:
+                    logger.warning(f"Response cache similarity lookup failed: {e}")
+                    self._count('errors')
+            if entry:
+                self._remember(key, dict(entry, signature=signature))
+                self._count('similar_hits')
+                return entry['response']
+
+        self._count('misses')
+        return None
+
+    def set(self, subject: str, topic: str, question: str, grade_level: Optional[str], response: str):
+        """Store an explanation in both cache levels"""
+        key, bucket, norm_question = self._describe(subject, topic, question, grade_level)
+        signature = _minhash(norm_question) if self.similarity_enabled else []
+        numbers = _numbers(norm_question)
+        self._remember(key, {
+            'response': response,
+            'bucket': bucket,
+            'numbers': numbers,
+            'signature': signature,
+            'expires_at': time.time() + self.ttl_seconds
+        })
+        self._count('stores')
+        if self.collection is None:
+            return
+        now = datetime.utcnow()
+        try:
+            self.collection.replace_one({'_id': key}, {
+                'bucket': bucket,
+                'question': norm_question,
+                'numbers': numbers,
+                'signature': signature,
+                'bands': _bands(signature) if signature else [],
+                'response': response,
+                'created_at': now,
+                'expires_at': now + timedelta(seconds=self.ttl_seconds)
+            }, upsert=True)
+        except PyMongoError as e:
+            logger.warning(f"Response cache store failed: {e}")
+            self._count('errors')
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+            counters['local_entries'] = len(self._entries)
+        hits = counters['local_hits'] + counters['shared_hits'] + counters['similar_hits']
+        lookups = hits + counters['misses']
+        counters['hits'] = hits
+        counters['hit_rate'] = round(hits / lookups, 3) if lookups else 0.0
+        return counters
+
+
+response_cache = ResponseCache()
+
+
+def init_collections(db_instance):
+    response_cache.init_collection(db_instance.ai_response_cache)
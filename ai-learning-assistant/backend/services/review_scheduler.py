@@ -0,0 +1,266 @@
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import PyMongoError
+from models.quiz import ANSWER_BLANK, ANSWER_KEY_UNKNOWN, load_compiled_quiz
+from services.jobs import job_queue
+from services.question_bank import question_hash
+
+logger = logging.getLogger("gemini.reviews")
+
+REVIEW_QUEUE_SIZE = int(os.getenv('REVIEW_QUEUE_SIZE', 50))
+
+INITIAL_EASINESS = 2.5
+MIN_EASINESS = 1.3
+# SM-2 grades given to quiz answers; self-graded reviews may send any 0-5 grade
+QUALITY_CORRECT = 4
+QUALITY_WRONG = 1
+QUALITY_BLANK = 0
+# Attempt ids remembered per item so a re-run review_record job skips them; re-runs come within a job lease
+APPLIED_ATTEMPTS_KEPT = 10
+
+
+def sm2(state: Dict, quality: int, now: datetime) -> Dict:
+    """Review state after answering with an SM-2 quality grade (0-5)"""
+    easiness = state.get('easiness', INITIAL_EASINESS)
+    repetitions = state.get('repetitions', 0)
+    interval = state.get('interval_days', 0)
+    if quality < 3:
+        repetitions, interval = 0, 1
+    else:
+        repetitions += 1
+        interval = 1 if repetitions == 1 else 6 if repetitions == 2 else round(interval * easiness)
+    easiness = max(MIN_EASINESS, easiness + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return {
+        'easiness': round(easiness, 3),
+        'repetitions': repetitions,
+        'interval_days': interval,
+        'due_at': now + timedelta(days=interval),
+        'last_reviewed_at': now
+    }
+
+
+def _day(when: datetime) -> str:
+    return when.strftime('%Y-%m-%d')
+
+
+def item_to_dict(item: Dict) -> Dict:
+    return {
+        'id': str(item['_id']),
+        'subject': item.get('subject'),
+        'topic': item.get('topic'),
+        'question': item['question'],
+        'due_at': item['due_at'].isoformat()
+    }
+
+
+class ReviewScheduler:
+    """SM-2 spaced repetition of quiz questions a user got wrong.
+
+    A wrong (or blank) quiz answer enrols the question in review_items with a
+    snapshot of the question, due the next day; later answers to it, in a
+    quiz or a review, move it through the SM-2 intervals. Due items come from
+    a (user_id, due_at) index. Quiz answers are recorded by a background job
+    so submitting stays fast; each item remembers the attempts last applied
+    to it, so a job re-claimed after a crash does not apply them twice.
+    precompute() writes each user's queue for the day into one review_queues
+    document, so the review-now read is a single _id lookup; items answered
+    since, in a review or a quiz, are pulled from it."""
+
+    def __init__(self):
+        self.collection = None
+        self.queues_collection = None
+        self.quizzes_collection = None
+
+    def init_collections(self, db_instance):
+        self.collection = db_instance.review_items
+        self.queues_collection = db_instance.review_queues
+        self.quizzes_collection = db_instance.quizzes
+
+    def record_attempts(self, quiz_id: ObjectId, answer_key: str, submissions: Iterable[Tuple[str, str, ObjectId]]):
+        """Queue a job updating review state from completed attempts of one quiz, given as (user_id, answer_string, attempt_id)"""
+        submissions = [[user_id, submitted, str(attempt_id)] for user_id, submitted, attempt_id in submissions]
+        if not submissions:
+            return
+        try:
+            job_queue.enqueue(
+                'review_record',
+                {'quiz_id': str(quiz_id), 'answer_key': answer_key, 'submissions': submissions},
+                user_id=submissions[0][0] if len(submissions) == 1 else None
+            )
+        except PyMongoError as e:
+            # Reviews are a study aid; a failure here must not fail the submit
+            logger.warning(f"Could not queue review state for quiz {quiz_id}: {e}")
+
+    def apply_attempts(self, quiz_id: ObjectId, answer_key: str, submissions: List[Tuple]) -> int:
+        """Update review state from (user_id, answer_string, attempt_id) submissions; run by the review_record job.
+
+        Returns attempts applied; attempts already applied are skipped. Jobs
+        queued before attempt ids were recorded send (user_id, answer_string)."""
+        scorable = [i for i, letter in enumerate(answer_key) if letter != ANSWER_KEY_UNKNOWN]
+        if not submissions or not scorable:
+            return 0
+        quiz = load_compiled_quiz(self.quizzes_collection, quiz_id, ('subject', 'topic', 'public_questions', 'explanations', 'answer_key'))
+        if not quiz:
+            return 0
+        hashes = [question_hash(q.get('question', '')) for q in quiz['public_questions']]
+        existing = {
+            (item['user_id'], item['text_hash']): item for item in self.collection.find(
+                {'user_id': {'$in': [s[0] for s in submissions]}, 'text_hash': {'$in': hashes}},
+                {'user_id': 1, 'text_hash': 1, 'easiness': 1, 'repetitions': 1, 'interval_days': 1, 'applied_attempts': 1}
+            )
+        }
+        now = datetime.utcnow()
+        ops, answered, repeated = [], {}, set()
+        for user_id, submitted, *attempt in submissions:
+            attempt_id = attempt[0] if attempt else None
+            for i in scorable:
+                item = existing.get((user_id, hashes[i]))
+                if item is not None:
+                    answered.setdefault(user_id, []).append(str(item['_id']))
+                    if attempt_id is not None and attempt_id in item.get('applied_attempts', []):
+                        repeated.add(attempt_id)
+                        continue
+                if submitted[i] == answer_key[i]:
+                    if item is None:
+                        continue
+                    quality = QUALITY_CORRECT
+                else:
+                    quality = QUALITY_WRONG if submitted[i] != ANSWER_BLANK else QUALITY_BLANK
+                update = {'$set': sm2(item or {}, quality, now)}
+                if attempt_id is not None:
+                    update['$push'] = {'applied_attempts': {'$each': [attempt_id], '$slice': -APPLIED_ATTEMPTS_KEPT}}
+                if item is None:
+                    update['$setOnInsert'] = {
+                        'subject': quiz.get('subject'),
+                        'topic': quiz.get('topic'),
+                        'question': quiz['public_questions'][i],
+                        'answer': answer_key[i],
+                        'explanation': quiz['explanations'][i],
+                        'created_at': now,
+                        # Set only on insert, so a job run twice at once cannot count the first lapse twice
+                        'lapses': 1
+                    }
+                    ops.append(UpdateOne({'user_id': user_id, 'text_hash': hashes[i]}, update, upsert=True))
+                    continue
+                if quality < 3:
+                    update['$inc'] = {'lapses': 1}
+                item_filter = {'_id': item['_id']}
+                if attempt_id is not None:
+                    # Matches nothing if a concurrent run of the same job got here first
+                    item_filter['applied_attempts'] = {'$ne': attempt_id}
+                ops.append(UpdateOne(item_filter, update))
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+        if answered:
+            # Rescheduled by the quiz, so no longer due today
+            self.queues_collection.bulk_write([
+                UpdateOne({'_id': user_id}, {'$pull': {'items': {'id': {'$in': ids}}}}) for user_id, ids in answered.items()
+            ], ordered=False)
+        return len(submissions) - len(repeated)
+
+    def due(self, user_id: str, limit: int = REVIEW_QUEUE_SIZE, now: Optional[datetime] = None) -> List[Dict]:
+        """Items due now, most overdue first, straight from the (user_id, due_at) index"""
+        return list(self.collection.find(
+            {'user_id': user_id, 'due_at': {'$lte': now or datetime.utcnow()}},
+            {'subject': 1, 'topic': 1, 'question': 1, 'due_at': 1}
+        ).sort('due_at', 1).limit(limit))
+
+    def queue(self, user_id: str) -> Dict:
+        """Today's review queue: the precomputed document, or the live query if today's has not been built"""
+        now = datetime.utcnow()
+        doc = self.queues_collection.find_one({'_id': user_id})
+        if doc and doc['day'] == _day(now):
+            # Items answered since precompute() have been pulled from the queue
+            answered = doc.get('queued', len(doc['items'])) - len(doc['items'])
+            return {'items': doc['items'], 'due': doc['due'] - answered, 'computed_at': doc['computed_at']}
+        items = self.due(user_id, now=now)
+        return {
+            'items': [item_to_dict(item) for item in items],
+            'due': self.collection.count_documents({'user_id': user_id, 'due_at': {'$lte': now}}) if len(items) == REVIEW_QUEUE_SIZE else len(items),
+            'computed_at': now
+        }
+
+    def review(self, user_id: str, item_id: str, answer: Optional[str] = None, quality: Optional[int] = None) -> Optional[Dict]:
+        """Grade a review from the answer letter or a self-assessed SM-2 quality; None if the item is not the user's"""
+        if not ObjectId.is_valid(item_id):
+            return None
+        item = self.collection.find_one({'_id': ObjectId(item_id), 'user_id': user_id})
+        if not item:
+            return None
+        is_correct = str(answer or '').strip().upper() == item['answer']
+        if quality is None:
+            quality = QUALITY_CORRECT if is_correct else QUALITY_WRONG if answer else QUALITY_BLANK
+        if not 0 <= quality <= 5:
+            raise ValueError('Quality must be between 0 and 5')
+        state = sm2(item, quality, datetime.utcnow())
+        update = {'$set': state}
+        if quality < 3:
+            update['$inc'] = {'lapses': 1}
+        self.collection.update_one({'_id': item['_id']}, update)
+        self.queues_collection.update_one(
+            {'_id': user_id}, {'$pull': {'items': {'id': item_id}}}
+        )
+        return {
+            'is_correct': is_correct,
+            'correct_answer': item['answer'],
+            'explanation': item.get('explanation', ''),
+            'interval_days': state['interval_days'],
+            'next_due_at': state['due_at'].isoformat()
+        }
+
+    def precompute(self, batch_size: int = 500) -> int:
+        """Build every user's review queue for today (items due by the end of the day); returns users queued.
+
+        Run daily, e.g. from cron, shortly after midnight UTC."""
+        now = datetime.utcnow()
+        day = _day(now)
+        until = datetime.strptime(day, '%Y-%m-%d') + timedelta(days=1)
+        pipeline = [
+            {'$match': {'due_at': {'$lt': until}}},
+            {'$sort': {'user_id': 1, 'due_at': 1}},
+            {'$group': {
+                '_id': '$user_id',
+                'due': {'$sum': 1},
+                'items': {'$push': {'_id': '$_id', 'subject': '$subject', 'topic': '$topic', 'question': '$question', 'due_at': '$due_at'}}
+            }},
+            {'$project': {'due': 1, 'items': {'$slice': ['$items', REVIEW_QUEUE_SIZE]}}}
+        ]
+        queued, ops = 0, []
+        for group in self.collection.aggregate(pipeline, allowDiskUse=True):
+            ops.append(ReplaceOne({'_id': group['_id']}, {
+                'day': day,
+                'due': group['due'],
+                'queued': len(group['items']),
+                'items': [item_to_dict(item) for item in group['items']],
+                'computed_at': now
+            }, upsert=True))
+            if len(ops) >= batch_size:
+                queued += len(ops)
+                self.queues_collection.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            queued += len(ops)
+            self.queues_collection.bulk_write(ops, ordered=False)
+        # Users with nothing due today keep no queue
+        self.queues_collection.delete_many({'computed_at': {'$lt': now}})
+        logger.info(f"Review queues for {day}: {queued} users")
+        return queued
+
+
+review_scheduler = ReviewScheduler()
+
+
+def run_record_attempts_job(params, progress):
+    submissions = [tuple(s) for s in params['submissions']]
+    return {'recorded': review_scheduler.apply_attempts(ObjectId(params['quiz_id']), params['answer_key'], submissions)}
+
+
+job_queue.register_handler('review_record', run_record_attempts_job)
+
+
+def init_collections(db_instance):
+    review_scheduler.init_collections(db_instance)
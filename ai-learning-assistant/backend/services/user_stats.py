@@ -0,0 +1,201 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger("gemini.stats")
+
+# Daily activity counters older than this are pruned on rebuild
+ACTIVITY_DAYS = 8
+
+
+def _day(when: datetime) -> str:
+    return when.strftime('%Y-%m-%d')
+
+
+def user_id_forms(user_id) -> list:
+    """Both stored forms of a user id: study sessions use ObjectId, everything else the JWT string"""
+    user_id = str(user_id)
+    return [user_id, ObjectId(user_id)] if ObjectId.is_valid(user_id) else [user_id]
+
+
+def _recent(by_day: Dict, now: datetime) -> int:
+    since = _day(now - timedelta(days=7))
+    return sum(count for day, count in (by_day or {}).items() if day > since)
+
+
+def stats_to_dict(doc: Dict, now: Optional[datetime] = None) -> Dict:
+    """Dashboard stats response built from a user_stats document"""
+    now = now or datetime.utcnow()
+    sessions, quizzes = doc.get('sessions', {}), doc.get('quizzes', {})
+    profile = doc.get('profile', {})
+    recent_sessions = _recent(sessions.get('by_day'), now)
+    recent_quizzes = _recent(quizzes.get('by_day'), now)
+    avg_rating = sessions.get('rating_sum', 0) / sessions['rating_count'] if sessions.get('rating_count') else 0
+    avg_score = quizzes.get('score_sum', 0) / quizzes['score_count'] if quizzes.get('score_count') else 0
+    return {
+        'user': {
+            'name': profile.get('full_name'),
+            'grade_level': profile.get('grade_level', ''),
+            'subjects': profile.get('subjects', []),
+            'joined_date': profile['created_at'].isoformat() if profile.get('created_at') else None
+        },
+        'study_sessions': {
+            'total': sessions.get('total', 0),
+            'total_questions': sessions.get('questions', 0),
+            'avg_rating': round(avg_rating, 1),
+            'recent': recent_sessions
+        },
+        'quizzes': {
+            'total': quizzes.get('total', 0),
+            'passed': quizzes.get('passed', 0),
+            'avg_score': round(avg_score, 1),
+            'recent': recent_quizzes
+        },
+        'groups': {
+            'total': doc.get('groups', {}).get('total', 0)
+        },
+        'recent_activity': {
+            'sessions': recent_sessions,
+            'quizzes': recent_quizzes
+        }
+    }
+
+
+class UserStatsStore:
+    """Materialized per-user dashboard counters kept in the user_stats collection.
+
+    Each write path applies a small $inc to the user's document. Increments
+    never upsert: a user without a document is rebuilt from the source
+    collections on first read, which already includes the triggering write."""
+
+    def __init__(self):
+        self.collection = None
+        self.users_collection = None
+        self.sessions_collection = None
+        self.quiz_attempts_collection = None
+        self.study_groups_collection = None
+
+    def init_collections(self, db_instance):
+        self.collection = db_instance.user_stats
+        self.users_collection = db_instance.users
+        self.sessions_collection = db_instance.study_sessions
+        self.quiz_attempts_collection = db_instance.quiz_attempts
+        self.study_groups_collection = db_instance.study_groups
+
+    def _inc(self, user_id, inc: Dict):
+        if not user_id:
+            return
+        try:
+            self.collection.update_one({'_id': str(user_id)}, {'$inc': inc, '$set': {'updated_at': datetime.utcnow()}})
+        except PyMongoError as e:
+            logger.warning(f"Could not update stats for {user_id}: {e}")
+
+    def _inc_many(self, incs: Iterable[Tuple[str, Dict]]):
+        """Apply several users' increments in one bulk write"""
+        now = datetime.utcnow()
+        ops = [UpdateOne({'_id': str(user_id)}, {'$inc': inc, '$set': {'updated_at': now}}) for user_id, inc in incs if user_id]
+        if not ops:
+            return
+        try:
+            self.collection.bulk_write(ops, ordered=False)
+        except PyMongoError as e:
+            logger.warning(f"Could not update stats for {len(ops)} users: {e}")
+
+    def record_session(self, user_id, created_at: datetime, questions: int = 0):
+        self._inc(user_id, {'sessions.total': 1, 'sessions.questions': questions, f'sessions.by_day.{_day(created_at)}': 1})
+
+    def record_rating(self, user_id, old_rating: Optional[int], new_rating: Optional[int]):
+        self._inc(user_id, {
+            'sessions.rating_sum': (new_rating or 0) - (old_rating or 0),
+            'sessions.rating_count': int(bool(new_rating)) - int(bool(old_rating))
+        })
+
+    def record_quiz_started(self, user_id, started_at: datetime):
+        self._inc(user_id, {'quizzes.total': 1, f'quizzes.by_day.{_day(started_at)}': 1})
+
+    def record_quiz_completed(self, user_id, score: float, passed: bool):
+        self._inc(user_id, {'quizzes.passed': int(bool(passed)), 'quizzes.score_sum': score or 0, 'quizzes.score_count': int(bool(score))})
+
+    def record_quizzes_started(self, user_ids: Iterable[str], started_at: datetime):
+        inc = {'quizzes.total': 1, f'quizzes.by_day.{_day(started_at)}': 1}
+        self._inc_many((user_id, inc) for user_id in user_ids)
+
+    def record_quizzes_completed(self, results: Iterable[Tuple[str, float, bool]]):
+        """Bulk record_quiz_completed for (user_id, score, passed) tuples"""
+        self._inc_many(
+            (user_id, {'quizzes.passed': int(bool(passed)), 'quizzes.score_sum': score or 0, 'quizzes.score_count': int(bool(score))})
+            for user_id, score, passed in results
+        )
+
+    def record_group_membership(self, user_id, delta: int):
+        self._inc(user_id, {'groups.total': delta})
+
+    def update_profile(self, user_id, fields: Dict):
+        update = {f'profile.{k}': v for k, v in fields.items() if k in ('full_name', 'grade_level', 'subjects')}
+        if not update:
+            return
+        try:
+            self.collection.update_one({'_id': str(user_id)}, {'$set': update})
+        except PyMongoError as e:
+            # The profile itself is already saved; a stale mirror is refreshed by rebuild()
+            logger.warning(f"Could not update stats profile for {user_id}: {e}")
+
+    def get(self, user_id) -> Optional[Dict]:
+        """Single read of the user's stats document, rebuilding it on first access"""
+        doc = self.collection.find_one({'_id': str(user_id)})
+        return doc if doc is not None else self.rebuild(user_id)
+
+    def rebuild(self, user_id) -> Optional[Dict]:
+        """Recompute a user's document from the source collections"""
+        user = self.users_collection.find_one({'_id': ObjectId(str(user_id))}, {'full_name': 1, 'grade_level': 1, 'subjects': 1, 'created_at': 1})
+        if not user:
+            return None
+        forms = user_id_forms(user_id)
+        since = _day(datetime.utcnow() - timedelta(days=ACTIVITY_DAYS))
+        sessions = {'total': 0, 'questions': 0, 'rating_sum': 0, 'rating_count': 0, 'by_day': {}}
+        for s in self.sessions_collection.find({'user_id': {'$in': forms}}, {'created_at': 1, 'satisfaction_rating': 1, 'questions': 1}):
+            sessions['total'] += 1
+            sessions['questions'] += len(s.get('questions', []))
+            if s.get('satisfaction_rating'):
+                sessions['rating_sum'] += s['satisfaction_rating']
+                sessions['rating_count'] += 1
+            day = _day(s['created_at'])
+            if day > since:
+                sessions['by_day'][day] = sessions['by_day'].get(day, 0) + 1
+        quizzes = {'total': 0, 'passed': 0, 'score_sum': 0, 'score_count': 0, 'by_day': {}}
+        for q in self.quiz_attempts_collection.find({'user_id': {'$in': forms}}, {'started_at': 1, 'score': 1, 'passed': 1}):
+            quizzes['total'] += 1
+            quizzes['passed'] += int(bool(q.get('passed')))
+            if q.get('score'):
+                quizzes['score_sum'] += q['score']
+                quizzes['score_count'] += 1
+            day = _day(q['started_at'])
+            if day > since:
+                quizzes['by_day'][day] = quizzes['by_day'].get(day, 0) + 1
+        doc = {
+            '_id': str(user_id),
+            'profile': {k: user.get(k) for k in ('full_name', 'grade_level', 'subjects', 'created_at')},
+            'sessions': sessions,
+            'quizzes': quizzes,
+            'groups': {'total': self.study_groups_collection.count_documents({'members': str(user_id)})},
+            'updated_at': datetime.utcnow()
+        }
+        self.collection.replace_one({'_id': doc['_id']}, doc, upsert=True)
+        return doc
+
+    def rebuild_all(self) -> int:
+        count = 0
+        for user in self.users_collection.find({}, {'_id': 1}):
+            self.rebuild(user['_id'])
+            count += 1
+        return count
+
+
+user_stats = UserStatsStore()
+
+
+def init_collections(db_instance):
+    user_stats.init_collections(db_instance)
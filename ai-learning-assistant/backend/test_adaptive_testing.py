@@ -0,0 +1,88 @@
+"""
+Behaviour checks for adaptive test item selection, scoring and ability estimates
+"""
+
+from datetime import datetime
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+
+from services.adaptive_testing import AdaptiveTesting, estimate_ability
+
+POOL = {'subject': 'mathematics', 'topic': 'algebra', 'exam_type': 'waec'}
+
+
+@pytest.fixture
+def testing():
+    service = AdaptiveTesting()
+    service.init_collections(mongomock.MongoClient().db)
+    return service
+
+
+def add_question(testing, text_hash, b, correct_answer='B', a=1.0):
+    payload = {'question': f'Question {text_hash}', 'options': {'A': '1', 'B': '2'}, 'explanation': 'Because'}
+    if correct_answer is not None:
+        payload['correct_answer'] = correct_answer
+    testing.bank_collection.insert_one(dict(POOL, text_hash=text_hash, payload=payload, irt_a=a, irt_b=b))
+
+
+def make_session(testing, current):
+    session = {'user_id': 'ana', 'subject': 'Mathematics', 'topic': 'Algebra', 'pool': POOL, 'prior': 0.0,
+               'theta': 0.0, 'se': 1.0, 'responses': [], 'current': current, 'completed': False,
+               'started_at': datetime.utcnow()}
+    session['_id'] = testing.sessions_collection.insert_one(session).inserted_id
+    return session
+
+
+def test_ability_follows_the_answers():
+    hard = {'a': 1.5, 'b': 1.0, 'correct': True}
+    easy = {'a': 1.5, 'b': -1.0, 'correct': False}
+    theta, se = estimate_ability([])
+    assert abs(theta) < 1e-9 and se == pytest.approx(1.0, abs=0.01)
+    assert estimate_ability([hard])[0] > 0 > estimate_ability([easy])[0]
+    # Every answer narrows the estimate
+    assert estimate_ability([hard, easy])[1] < estimate_ability([hard])[1] < se
+
+
+def test_select_serves_items_near_the_estimate(testing):
+    for i, b in enumerate([-3.0, -0.2, 0.1, 3.0]):
+        add_question(testing, f'q{i}', b)
+    item = testing._select(POOL, 0.0, [])
+    assert item['text_hash'] in ('q1', 'q2')
+    assert item['answer'] == 'B'
+    assert 'correct_answer' not in item['question'] and 'explanation' not in item['question']
+    assert testing._select(POOL, 0.0, ['q1', 'q2'])['text_hash'] in ('q0', 'q3')
+
+
+def test_select_skips_items_without_a_usable_key(testing):
+    add_question(testing, 'missing', 0.0, correct_answer=None)
+    add_question(testing, 'invalid', 0.1, correct_answer='B or C')
+    add_question(testing, 'blank', -0.1, correct_answer='')
+    assert testing._select(POOL, 0.0, []) is None
+    add_question(testing, 'good', 2.0, correct_answer=' c ')
+    item = testing._select(POOL, 0.0, [])
+    assert (item['text_hash'], item['answer']) == ('good', 'C')
+
+
+def test_answer_scores_and_moves_on(testing):
+    add_question(testing, 'q0', 0.0)
+    add_question(testing, 'q1', 0.5)
+    session = make_session(testing, testing._select(POOL, 0.0, ['q1']))
+    result = testing.answer(session, 'q0', 'b')
+    assert (result['is_correct'], result['correct_answer']) == (True, 'B')
+    assert session['theta'] > 0 and session['current']['text_hash'] == 'q1'
+    stored = testing.sessions_collection.find_one({'_id': session['_id']})
+    assert [r['correct'] for r in stored['responses']] == [True]
+    # A repeated submit of the same question is refused
+    with pytest.raises(ValueError):
+        testing.answer(session, 'q0', 'B')
+
+
+def test_blank_answer_never_matches_an_unknown_key(testing):
+    # A session started before keys were read with _letter stored the blank placeholder as the key
+    current = {'text_hash': 'legacy', 'a': 1.0, 'b': 0.0, 'answer': '-', 'explanation': '', 'question': {}}
+    for blank in (None, '', '-', '?'):
+        session = make_session(testing, dict(current))
+        assert testing.answer(session, 'legacy', blank)['is_correct'] is False
+        assert session['responses'][0]['correct'] is False
+        assert session['theta'] < 0
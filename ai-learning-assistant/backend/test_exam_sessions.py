@@ -0,0 +1,110 @@
+"""
+Behaviour checks for proctored exam sessions: roster authorization and bulk submission
+"""
+
+import pytest
+from datetime import datetime
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+
+mongomock = pytest.importorskip('mongomock')
+
+import routes.exam_sessions as exam_sessions
+from models.quiz import compile_questions
+from services import achievements, review_scheduler, user_stats
+from services.jobs import job_queue
+
+QUESTIONS = [
+    {'question': 'What is 2 + 2?', 'options': {'A': '3', 'B': '4'}, 'correct_answer': 'B'},
+    {'question': 'Capital of France?', 'options': {'A': 'Paris', 'B': 'Rome'}, 'correct_answer': 'A'}
+]
+
+
+@pytest.fixture
+def env():
+    db = mongomock.MongoClient().db
+    for module in (exam_sessions, user_stats, achievements, review_scheduler):
+        module.init_collections(db)
+    job_queue.init_collection(db.generation_jobs)
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'exam-session-tests-secret-key-0123456789'
+    JWTManager(app)
+    app.register_blueprint(exam_sessions.exam_sessions_bp)
+
+    users = {name: str(db.users.insert_one({'username': name, 'email': f'{name}@example.com'}).inserted_id)
+             for name in ('teacher', 'ana', 'ben', 'outsider')}
+    group_id = db.study_groups.insert_one({
+        'created_by': users['teacher'], 'members': [users['teacher'], users['ana'], users['ben']]
+    }).inserted_id
+    quiz_id = db.quizzes.insert_one(dict(
+        compile_questions(QUESTIONS), questions=QUESTIONS, subject='Mathematics', topic='Arithmetic',
+        time_limit=10, passing_score=50, created_at=datetime.utcnow()
+    )).inserted_id
+    with app.app_context():
+        tokens = {name: create_access_token(identity=user_id) for name, user_id in users.items()}
+    return {
+        'db': db, 'client': app.test_client(), 'users': users, 'group_id': str(group_id), 'quiz_id': str(quiz_id),
+        'headers': {name: {'Authorization': f'Bearer {token}'} for name, token in tokens.items()}
+    }
+
+
+def create(env, as_user='teacher', roster=('ana', 'ben'), **overrides):
+    body = dict({'quiz_id': env['quiz_id'], 'group_id': env['group_id'], 'roster': [env['users'][u] for u in roster]}, **overrides)
+    return env['client'].post('/api/exam-sessions', json=body, headers=env['headers'][as_user])
+
+
+def test_group_is_required(env):
+    response = create(env, group_id=None)
+    assert response.status_code == 400
+
+
+def test_only_the_group_creator_can_start_a_session(env):
+    response = create(env, as_user='ana')
+    assert response.status_code == 403
+    assert env['db'].quiz_attempts.count_documents({}) == 0
+
+
+def test_roster_must_be_group_members(env):
+    response = create(env, roster=('ana', 'outsider'))
+    assert response.status_code == 400
+    assert response.get_json()['not_members'] == [env['users']['outsider']]
+
+
+def test_create_and_bulk_submit(env):
+    response = create(env)
+    assert response.status_code == 201
+    session_id = response.get_json()['session_id']
+    attempts = response.get_json()['attempts']
+    assert set(attempts) == {env['users']['ana'], env['users']['ben']}
+
+    ana, ben = env['users']['ana'], env['users']['ben']
+    response = env['client'].post(f'/api/exam-sessions/{session_id}/submissions', headers=env['headers']['teacher'], json={'submissions': [
+        {'user_id': ana, 'answers': {'0': 'B', '1': 'A'}, 'time_taken': 120},
+        {'user_id': ben, 'answers': {'0': 'A'}},
+        {'user_id': env['users']['outsider'], 'answers': {'0': 'B'}}
+    ]})
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['scored'] == 2
+    assert result['skipped'] == [env['users']['outsider']]
+    assert result['results'][ana] == {'score': 100.0, 'correct_answers': 2, 'passed': True}
+    assert result['results'][ben] == {'score': 0.0, 'correct_answers': 0, 'passed': False}
+    job = env['db'].generation_jobs.find_one({'type': 'review_record'})
+    assert sorted(job['params']['submissions']) == sorted([[ana, 'BA', attempts[ana]], [ben, 'A-', attempts[ben]]])
+
+    # A repeated batch finds no open attempts
+    response = env['client'].post(f'/api/exam-sessions/{session_id}/submissions', headers=env['headers']['teacher'],
+                                  json={'submissions': [{'user_id': ana, 'answers': {}}]})
+    assert response.get_json()['scored'] == 0
+
+    summary = env['client'].get(f'/api/exam-sessions/{session_id}', headers=env['headers']['teacher']).get_json()['session']
+    assert summary['group_id'] == env['group_id']
+    assert (summary['completed'], summary['passed'], summary['avg_score']) == (2, 1, 50.0)
+
+
+def test_only_the_session_creator_can_submit(env):
+    session_id = create(env).get_json()['session_id']
+    response = env['client'].post(f'/api/exam-sessions/{session_id}/submissions', headers=env['headers']['ana'],
+                                  json={'submissions': [{'user_id': env['users']['ana'], 'answers': {'0': 'B', '1': 'A'}}]})
+    assert response.status_code == 404
+    assert env['db'].quiz_attempts.count_documents({'completed': True}) == 0
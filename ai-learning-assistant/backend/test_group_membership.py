@@ -0,0 +1,85 @@
+"""
+Behaviour checks for joining and leaving study groups
+"""
+
+import threading
+import pytest
+from bson import ObjectId
+
+mongomock = pytest.importorskip('mongomock')
+
+from services.group_membership import GroupMembership
+
+
+@pytest.fixture
+def membership():
+    db = mongomock.MongoClient().db
+    service = GroupMembership()
+    service.init_collections(db)
+    return service
+
+
+def make_group(membership, members=('creator',), max_members=3, **fields):
+    group = {'created_by': 'creator', 'members': list(members), 'member_count': len(members), 'max_members': max_members}
+    group.update(fields)
+    return membership.groups_collection.insert_one(group).inserted_id
+
+
+def test_join_and_leave(membership):
+    group_id = make_group(membership)
+    assert membership.join(group_id, 'ana') == 'joined'
+    group = membership.groups_collection.find_one({'_id': group_id})
+    assert group['members'] == ['creator', 'ana'] and group['member_count'] == 2
+
+    assert membership.leave(group_id, 'ana') == 'left'
+    group = membership.groups_collection.find_one({'_id': group_id})
+    assert group['members'] == ['creator'] and group['member_count'] == 1
+
+
+def test_unknown_group(membership):
+    assert membership.join(ObjectId(), 'ana') == 'not_found'
+    assert membership.leave(ObjectId(), 'ana') == 'not_found'
+
+
+def test_duplicate_join(membership):
+    group_id = make_group(membership)
+    membership.join(group_id, 'ana')
+    assert membership.join(group_id, 'ana') == 'already_member'
+    assert membership.groups_collection.find_one({'_id': group_id})['member_count'] == 2
+
+
+def test_capacity(membership):
+    group_id = make_group(membership, max_members=2)
+    assert membership.join(group_id, 'ana') == 'joined'
+    assert membership.join(group_id, 'ben') == 'full'
+
+
+def test_creator_cannot_leave(membership):
+    group_id = make_group(membership)
+    assert membership.leave(group_id, 'creator') == 'creator'
+    assert membership.leave(group_id, 'ana') == 'not_member'
+
+
+def test_groups_without_member_count(membership):
+    group_id = make_group(membership, members=('creator', 'ana'))
+    membership.groups_collection.update_one({'_id': group_id}, {'$unset': {'member_count': ''}})
+    assert membership.leave(group_id, 'ana') == 'left'
+    assert membership.groups_collection.find_one({'_id': group_id})['member_count'] == 1
+
+    membership.groups_collection.update_one({'_id': group_id}, {'$unset': {'member_count': ''}})
+    assert membership.join(group_id, 'ben') == 'joined'
+    assert membership.groups_collection.find_one({'_id': group_id})['member_count'] == 2
+
+
+def test_concurrent_joins_do_not_oversubscribe(membership):
+    group_id = make_group(membership, max_members=5)
+    results = []
+    threads = [threading.Thread(target=lambda u=u: results.append(membership.join(group_id, f'user{u}'))) for u in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    group = membership.groups_collection.find_one({'_id': group_id})
+    assert results.count('joined') == 4
+    assert results.count('full') == 16
+    assert len(group['members']) == group['member_count'] == 5
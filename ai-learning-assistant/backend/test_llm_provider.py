@@ -0,0 +1,44 @@
+"""
+Behaviour checks for the provider interface and the offline fake provider
+"""
+
+from services.ai_service import AITutorService
+from services.llm_provider import FakeProvider, LLMProvider
+
+
+class EchoProvider(LLMProvider):
+    def generate(self, prompt: str) -> str:
+        if prompt == 'fail':
+            raise RuntimeError('model error')
+        return prompt.upper()
+
+
+def test_batch_generate_keeps_prompt_order():
+    assert EchoProvider().batch_generate(['a', 'b', 'c']) == ['A', 'B', 'C']
+
+
+def test_batch_generate_returns_failures_in_place():
+    results = EchoProvider().batch_generate(['a', 'fail', 'c'])
+    assert results[0] == 'A' and results[2] == 'C'
+    assert isinstance(results[1], RuntimeError)
+
+
+def test_batch_generate_hands_streams_to_consume():
+    assert EchoProvider().batch_generate(['ab', 'cd'], lambda chunks: ''.join(chunks) + '!') == ['AB!', 'CD!']
+
+
+def test_fake_provider_is_deterministic():
+    provider = FakeProvider(latency_ms=0, jitter_ms=0)
+    prompt = "Student's Question: what is a prime?"
+    assert provider.generate(prompt) == provider.generate(prompt)
+    assert ''.join(provider.generate_stream(prompt)) == provider.generate(prompt)
+
+
+def test_question_chunks_fan_out_through_batch_generate():
+    provider = FakeProvider(latency_ms=0, jitter_ms=0)
+    batches = []
+    original = provider.batch_generate
+    provider.batch_generate = lambda prompts, consume=None: batches.append(len(prompts)) or original(prompts, consume)
+    questions = AITutorService(provider).generate_questions('Mathematics', 'Algebra', num_questions=12, exam_type='WAEC', allow_fallback=False)
+    assert len(questions) == 12
+    assert batches[0] == 3
@@ -0,0 +1,134 @@
+"""
+Behaviour checks for bucketed group chat storage: tail, since-backfill, compaction and migration
+"""
+
+import os
+import itertools
+from datetime import datetime, timedelta
+import pytest
+from bson import ObjectId
+
+mongomock = pytest.importorskip('mongomock')
+
+import services.message_store as message_store
+from services.message_store import MessageStore, bucket_start
+
+# Two minutes before an hour boundary, well inside one day
+START = bucket_start(datetime.utcnow() - timedelta(days=40), 86400) + timedelta(hours=10, minutes=58)
+_counter = itertools.count()
+# Fixed like a real process's, so ids from the same second sort by the counter
+_PROCESS = os.urandom(5)
+
+
+class Clock:
+    """Controls the time new message ids are generated at"""
+
+    def __init__(self, now):
+        self.now = now
+
+    def object_id(self):
+        seconds = int((self.now - datetime(1970, 1, 1)).total_seconds())
+        return ObjectId(seconds.to_bytes(4, 'big') + _PROCESS + (next(_counter) % 2 ** 24).to_bytes(3, 'big'))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(START)
+    monkeypatch.setattr(message_store, 'ObjectId', clock.object_id)
+    return clock
+
+
+@pytest.fixture
+def store():
+    store = MessageStore()
+    store.init_collections(mongomock.MongoClient().db)
+    return store
+
+
+GROUP = ObjectId()
+
+
+def send(store, clock, count, step=timedelta(seconds=20)):
+    sent = []
+    for _ in range(count):
+        sent.append(store.append(GROUP, {'user_id': 'ana', 'content': f'm{next(_counter)}', 'message_type': 'text',
+                                         'user_name': 'Ana', 'created_at': clock.now}))
+        clock.now += step
+    return sent
+
+
+def ids(messages):
+    return [m['_id'] for m in messages]
+
+
+def test_append_across_a_window_boundary(store, clock):
+    sent = send(store, clock, 12)
+    assert store.collection.count_documents({}) == 2
+    assert ids(store.tail(GROUP, 100)) == ids(sent)
+    assert ids(store.tail(GROUP, 5)) == ids(sent[-5:])
+    assert all(m['group_id'] == GROUP for m in store.tail(GROUP, 100))
+
+
+def test_after_reads_back_to_the_window_of_since(store, clock):
+    sent = send(store, clock, 12)
+    # Each since falls in the first window, the second or on the boundary
+    for i in range(len(sent)):
+        assert ids(store.after([GROUP], sent[i]['_id'])) == ids(sent[i + 1:]), f"since message {i}"
+    assert ids(store.after([GROUP], sent[2]['_id'], limit=3)) == ids(sent[3:6])
+
+
+def test_window_follows_the_id_not_created_at(store, clock):
+    clock.now = bucket_start(START) + timedelta(hours=1)
+    first = send(store, clock, 1, step=timedelta(0))[0]
+    # created_at taken just before the hour, id generated just after it
+    late = store.append(GROUP, {'user_id': 'ana', 'content': 'late', 'created_at': clock.now - timedelta(milliseconds=1)})
+    assert ids(store.after([GROUP], first['_id'])) == [late['_id']]
+
+
+def test_full_buckets_keep_order(store, clock, monkeypatch):
+    monkeypatch.setattr(message_store, 'CHAT_BUCKET_MAX_MESSAGES', 3)
+    sent = send(store, clock, 10, step=timedelta(seconds=1))
+    assert store.collection.count_documents({}) == 4
+    assert ids(store.tail(GROUP, 100)) == ids(sent)
+    assert ids(store.tail(GROUP, 4)) == ids(sent[-4:])
+    assert ids(store.after([GROUP], sent[1]['_id'])) == ids(sent[2:])
+
+
+def test_after_reads_compacted_buckets(store, clock, monkeypatch):
+    monkeypatch.setattr(message_store, 'CHAT_BUCKET_MAX_MESSAGES', 3)
+    # One message an hour: five part-filled hourly buckets
+    old = send(store, clock, 5, step=timedelta(hours=1))
+    clock.now = datetime.utcnow()
+    recent = send(store, clock, 2)
+    result = store.compact(30)
+    assert result == {'buckets_archived': 5, 'archive_documents': 2}
+    # Merged into day buckets, never past the cap
+    assert [b['count'] for b in store.archive_collection.find().sort('first_id', 1)] == [3, 2]
+    assert ids(store.tail(GROUP, 100)) == ids(old + recent)
+    assert ids(store.tail(GROUP, 4)) == ids(old[-2:] + recent)
+    for i in range(len(old)):
+        assert ids(store.after([GROUP], old[i]['_id'])) == ids(old[i + 1:] + recent), f"since message {i}"
+    # A re-run after a crash finds nothing left to move
+    assert store.compact(30)['buckets_archived'] == 0
+
+
+def test_legacy_messages_are_read_until_migrated(store, clock):
+    legacy = []
+    for i in range(5):
+        message_id = clock.object_id()
+        legacy.append({'_id': message_id, 'group_id': GROUP, 'user_id': 'ben', 'content': f'old {i}', 'created_at': clock.now})
+        clock.now += timedelta(seconds=30)
+    store.legacy_collection.insert_many(legacy)
+    sent = send(store, clock, 2)
+    assert ids(store.tail(GROUP, 100)) == ids(legacy + sent)
+    assert ids(store.after([GROUP], legacy[1]['_id'])) == ids(legacy[2:] + sent)
+
+    assert store.migrate_legacy(batch_size=2) == 5
+    assert store.legacy_collection.count_documents({}) == 0
+    assert ids(store.tail(GROUP, 100)) == ids(legacy + sent)
+    # A message left in both stores by a crash is listed once and not copied again
+    store.legacy_collection.insert_one(legacy[0])
+    store._legacy_pending = None
+    assert ids(store.tail(GROUP, 100)) == ids(legacy + sent)
+    assert store.migrate_legacy() == 0
+    assert ids(store.tail(GROUP, 100)) == ids(legacy + sent)
@@ -0,0 +1,49 @@
+"""
+Behaviour checks for compiled quiz answer keys and scoring
+"""
+
+import pytest
+from bson import ObjectId
+from models.quiz import ANSWER_BLANK, ANSWER_KEY_UNKNOWN, answer_string, compile_questions, load_compiled_quiz, score_answers
+
+QUESTIONS = [
+    {'question': 'What is 2 + 2?', 'options': {'A': '3', 'B': '4'}, 'correct_answer': 'B', 'explanation': 'Add them.'},
+    {'question': 'Capital of France?', 'options': {'A': 'Paris', 'B': 'Rome'}, 'correct_answer': ' a '},
+    {'question': 'No key given', 'options': {'A': 'x', 'B': 'y'}},
+    {'question': 'Key is not a letter', 'options': {'A': 'x'}, 'correct_answer': 'Paris'}
+]
+
+
+def test_compile_questions():
+    compiled = compile_questions(QUESTIONS)
+    assert compiled['answer_key'] == 'BA' + ANSWER_KEY_UNKNOWN * 2
+    assert compiled['explanations'] == ['Add them.', '', '', '']
+    assert compiled['public_questions'][0] == {'question': 'What is 2 + 2?', 'options': {'A': '3', 'B': '4'}}
+    assert all('correct_answer' not in q and 'explanation' not in q for q in compiled['public_questions'])
+
+
+def test_answer_string():
+    assert answer_string({'0': 'b', '2': ' C ', '5': 'D'}, 4) == 'B' + ANSWER_BLANK + 'C' + ANSWER_BLANK
+    assert answer_string({'0': '', '1': None, '2': 'AB'}, 3) == ANSWER_BLANK * 3
+
+
+def test_score_answers():
+    answer_key = compile_questions(QUESTIONS)['answer_key']
+    assert score_answers(answer_key, {'0': 'B', '1': 'A'}) == (2, 'BA--')
+    assert score_answers(answer_key, {'0': 'A', '1': 'A'}) == (1, 'AA--')
+
+
+def test_unknown_key_never_matches_a_blank():
+    # An unknown key ('?') and a blank answer ('-') use different placeholders
+    assert score_answers(ANSWER_KEY_UNKNOWN * 2, {}) == (0, ANSWER_BLANK * 2)
+    assert score_answers(ANSWER_KEY_UNKNOWN * 2, {'0': '?', '1': '-'}) == (0, ANSWER_BLANK * 2)
+
+
+def test_legacy_quiz_is_compiled_once():
+    mongomock = pytest.importorskip('mongomock')
+    quizzes = mongomock.MongoClient().db.quizzes
+    quiz_id = quizzes.insert_one({'title': 'Legacy', 'questions': QUESTIONS}).inserted_id
+    quiz = load_compiled_quiz(quizzes, quiz_id, ('title', 'answer_key'))
+    assert quiz['answer_key'] == 'BA??'
+    assert quizzes.find_one({'_id': quiz_id})['answer_key'] == 'BA??'
+    assert load_compiled_quiz(quizzes, ObjectId(), ('answer_key',)) is None
@@ -0,0 +1,110 @@
+"""
+Behaviour checks for SM-2 spaced repetition and the daily review queues
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from services.review_scheduler import INITIAL_EASINESS, MIN_EASINESS, QUALITY_CORRECT, QUALITY_WRONG, sm2
+
+NOW = datetime(2026, 1, 1)
+
+
+def test_first_correct_answers_follow_the_fixed_intervals():
+    state = sm2({}, 5, NOW)
+    assert (state['repetitions'], state['interval_days']) == (1, 1)
+    state = sm2(state, 5, NOW)
+    assert (state['repetitions'], state['interval_days']) == (2, 6)
+    state = sm2(state, 5, NOW)
+    assert state['repetitions'] == 3
+    assert state['interval_days'] == round(6 * 2.7)
+    assert state['due_at'] == NOW + timedelta(days=state['interval_days'])
+    assert state['last_reviewed_at'] == NOW
+
+
+def test_easiness_changes_with_quality():
+    assert sm2({}, 5, NOW)['easiness'] == INITIAL_EASINESS + 0.1
+    assert sm2({}, 4, NOW)['easiness'] == INITIAL_EASINESS
+    assert sm2({}, 3, NOW)['easiness'] == INITIAL_EASINESS - 0.14
+
+
+def test_a_lapse_restarts_the_intervals():
+    state = {'easiness': 2.5, 'repetitions': 4, 'interval_days': 30}
+    state = sm2(state, QUALITY_WRONG, NOW)
+    assert (state['repetitions'], state['interval_days']) == (0, 1)
+    assert state['easiness'] < 2.5
+
+
+def test_easiness_has_a_floor():
+    state = {}
+    for _ in range(10):
+        state = sm2(state, 0, NOW)
+    assert state['easiness'] == MIN_EASINESS
+
+
+@pytest.fixture
+def quiz():
+    mongomock = pytest.importorskip('mongomock')
+    from models.quiz import compile_questions
+    from services.jobs import job_queue
+    from services.review_scheduler import review_scheduler
+
+    db = mongomock.MongoClient().db
+    job_queue.init_collection(db.generation_jobs)
+    review_scheduler.init_collections(db)
+    questions = [
+        {'question': 'What is 2 + 2?', 'options': {'A': '3', 'B': '4'}, 'correct_answer': 'B'},
+        {'question': 'Capital of France?', 'options': {'A': 'Paris', 'B': 'Rome'}, 'correct_answer': 'A'}
+    ]
+    quiz_id = db.quizzes.insert_one(dict(compile_questions(questions), questions=questions, subject='Mathematics', topic='Arithmetic')).inserted_id
+    return db, quiz_id
+
+
+def test_quiz_answers_reschedule_and_leave_the_daily_queue(quiz):
+    from bson import ObjectId
+    from services.review_scheduler import review_scheduler as scheduler, run_record_attempts_job
+
+    db, quiz_id = quiz
+    # Submitting only queues the work
+    scheduler.record_attempts(quiz_id, 'BA', [('ana', 'AA', ObjectId())])
+    job = db.generation_jobs.find_one({'type': 'review_record'})
+    assert job['user_id'] == 'ana' and db.review_items.count_documents({}) == 0
+    assert scheduler.apply_attempts(quiz_id, 'BA', [tuple(s) for s in job['params']['submissions']]) == 1
+    item = db.review_items.find_one({'user_id': 'ana'})
+    assert item['question'] == {'question': 'What is 2 + 2?', 'options': {'A': '3', 'B': '4'}}
+    assert (item['interval_days'], item['lapses']) == (1, 1)
+    assert db.review_items.count_documents({}) == 1
+
+    # Once due, the item is queued for the day, then answered correctly in another quiz
+    db.review_items.update_one({'_id': item['_id']}, {'$set': {'due_at': datetime.utcnow() - timedelta(hours=1)}})
+    assert scheduler.precompute() == 1
+    assert scheduler.queue('ana')['due'] == 1
+    assert run_record_attempts_job(dict(job['params'], submissions=[['ana', 'BA', str(ObjectId())]]), None) == {'recorded': 1}
+    item = db.review_items.find_one({'_id': item['_id']})
+    assert (item['repetitions'], item['interval_days']) == (1, 1)
+    queue = scheduler.queue('ana')
+    assert (queue['items'], queue['due']) == ([], 0)
+
+
+def test_a_re_run_job_applies_each_attempt_once(quiz):
+    from bson import ObjectId
+    from services.review_scheduler import review_scheduler as scheduler, run_record_attempts_job
+
+    db, quiz_id = quiz
+    scheduler.record_attempts(quiz_id, 'BA', [('ana', 'AA', ObjectId()), ('ben', 'BB', ObjectId())])
+    params = db.generation_jobs.find_one({'type': 'review_record'})['params']
+    assert run_record_attempts_job(params, None) == {'recorded': 2}
+    first = {(i['user_id'], i['text_hash']): i for i in db.review_items.find()}
+    assert len(first) == 2
+
+    # A re-claimed job (e.g. after the worker crashed before marking it done) changes nothing
+    assert run_record_attempts_job(params, None) == {'recorded': 0}
+    again = {(i['user_id'], i['text_hash']): i for i in db.review_items.find()}
+    assert again == first
+
+    # A later attempt at the same question is still applied, once
+    later = [['ana', 'BA', str(ObjectId())]]
+    for _ in range(2):
+        run_record_attempts_job(dict(params, submissions=later), None)
+    item = db.review_items.find_one({'user_id': 'ana'})
+    assert (item['repetitions'], item['interval_days'], item['lapses']) == (1, 1, 1)
+    assert len(item['applied_attempts']) == 2
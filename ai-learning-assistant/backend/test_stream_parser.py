@@ -0,0 +1,66 @@
+"""
+Behaviour checks for the incremental question parser used on streamed model output
+"""
+
+import json
+from utils.json_stream import QuestionStreamParser, repair_json
+
+QUESTIONS = [
+    {'question': 'What is 2 + 2?', 'options': {'A': '3', 'B': '4'}, 'correct_answer': 'B', 'explanation': 'Add {two} and two.'},
+    {'question': 'Solve x + 1 = 3', 'options': {'A': '2', 'B': '3'}, 'correct_answer': 'A', 'explanation': 'Subtract "1".'}
+]
+RESPONSE = '```json\n' + json.dumps({'questions': QUESTIONS}, indent=2) + '\n```'
+
+
+def parse(chunks):
+    parser = QuestionStreamParser()
+    questions = []
+    for chunk in chunks:
+        questions.extend(parser.feed(chunk))
+    return questions, parser
+
+
+def test_whole_response():
+    questions, parser = parse([RESPONSE])
+    assert questions == QUESTIONS
+    assert parser.malformed == 0
+
+
+def test_any_chunk_boundary_gives_the_same_questions():
+    for cut in range(1, len(RESPONSE)):
+        questions, _ = parse([RESPONSE[:cut], RESPONSE[cut:]])
+        assert questions == QUESTIONS, f"split at {cut}"
+
+
+def test_character_by_character():
+    questions, _ = parse(list(RESPONSE))
+    assert questions == QUESTIONS
+
+
+def test_question_is_emitted_when_its_brace_closes():
+    first = json.dumps(QUESTIONS[0])
+    parser = QuestionStreamParser()
+    assert parser.feed('{"questions": [' + first[:-1]) == []
+    assert parser.feed('}, ') == [QUESTIONS[0]]
+
+
+def test_malformed_sibling_is_skipped():
+    text = '[' + json.dumps(QUESTIONS[0]) + ', {"question": "Broken" "options": 1}, ' + json.dumps(QUESTIONS[1]) + ']'
+    questions, parser = parse([text])
+    assert questions == QUESTIONS
+    assert parser.malformed == 1
+
+
+def test_truncated_response_keeps_complete_questions():
+    questions, _ = parse([RESPONSE[:RESPONSE.index('Solve')]])
+    assert questions == [QUESTIONS[0]]
+
+
+def test_smart_quotes_and_trailing_commas():
+    text = '{“question”: “Name a prime”, “options”: {“A”: “4”, “B”: “5”,}, “correct_answer”: “B”,}'
+    questions, _ = parse([text])
+    assert questions == [{'question': 'Name a prime', 'options': {'A': '4', 'B': '5'}, 'correct_answer': 'B'}]
+
+
+def test_repair_json():
+    assert json.loads(repair_json('{"a": [1, 2,], }')) == {'a': [1, 2]}
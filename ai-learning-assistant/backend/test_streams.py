@@ -0,0 +1,41 @@
+"""
+Behaviour checks for event stream budgets and stream tokens
+"""
+
+import pytest
+from flask import Flask
+import utils.streams as streams
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'stream-tests-secret-key-0123456789abcdef'
+    with app.test_request_context():
+        yield app
+
+
+def test_stream_token_is_scoped(app):
+    token = streams.create_stream_token('user-1', 'chat:group-a')
+    assert streams.read_stream_token(token, 'chat:group-a') == 'user-1'
+    assert streams.read_stream_token(token, 'chat:group-b') is None
+    assert streams.read_stream_token(token + 'x', 'chat:group-a') is None
+    assert streams.read_stream_token(None, 'chat:group-a') is None
+
+
+def test_stream_token_expires(app, monkeypatch):
+    token = streams.create_stream_token('user-1', 'chat:group-a')
+    monkeypatch.setattr(streams, 'STREAM_TOKEN_SECONDS', -1)
+    assert streams.read_stream_token(token, 'chat:group-a') is None
+
+
+def test_chat_streams_have_their_own_budget(app, monkeypatch):
+    monkeypatch.setitem(streams._budgets, 'default', streams._slots(1))
+    monkeypatch.setitem(streams._budgets, 'chat', streams._slots(2))
+    job_stream = streams.event_stream_response(iter(()))
+    assert streams.event_stream_response(iter(())) is None
+    chats = [streams.event_stream_response(iter(()), budget='chat') for _ in range(3)]
+    assert chats[0] is not None and chats[1] is not None and chats[2] is None
+    # Closing a response gives its slot back
+    job_stream.close()
+    assert streams.event_stream_response(iter(())) is not None
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+Fold newly completed quiz attempts into the item analytics (quiz_item_stats
+and question_item_stats collections). Run it periodically, e.g. from cron:
+
+    python update_item_analytics.py            # attempts since the last run
+    python update_item_analytics.py --rebuild  # recompute from all attempts
+"""
+
+import os
+import sys
+
+os.environ.setdefault('JOB_WORKERS', '0')
+os.environ.setdefault('QUESTION_BANK_REFILL_ENABLED', 'false')
+os.environ.setdefault('INDEX_BOOTSTRAP_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: F401
+from services.item_analytics import item_analytics
+
+if __name__ == '__main__':
+    if '--rebuild' in sys.argv[1:]:
+        print(f"Rebuilt item analytics from {item_analytics.rebuild()} attempts")
+    else:
+        print(f"Processed {item_analytics.run()} new attempts")
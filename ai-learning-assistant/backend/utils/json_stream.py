@@ -0,0 +1,75 @@
+import re
+import json
+from typing import Dict, List
+
+SMART_DOUBLE_QUOTES = str.maketrans({'“': '"', '”': '"'})
+
+
+def repair_json(text: str) -> str:
+    """Fix the JSON mistakes models commonly make: trailing commas and smart quotes"""
+    text = re.sub(r',([ \t\r\n]*[}}\]])', r'\1', text)
+    text = text.replace('“', '"').replace('”', '"').replace("‘", "'").replace("’", "'")
+    return text
+
+
+class QuestionStreamParser:
+    """Incremental, tolerant extractor of question objects from model output.
+
+    Text can be fed in arbitrary chunks (e.g. straight from a streaming
+    response). Every JSON object is parsed on its own as soon as its closing
+    brace arrives, so one malformed question does not discard its siblings,
+    and code fences or prose around the JSON are ignored."""
+
+    def __init__(self, required_key: str = 'question'):
+        self.required_key = required_key
+        self._buffer = ''
+        self._pos = 0
+        self._in_string = False
+        self._escape = False
+        self._starts: List[int] = []
+        self.malformed = 0
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """Consume a chunk and return the question objects completed by it"""
+        self._buffer += chunk.translate(SMART_DOUBLE_QUOTES)
+        completed = []
+        buffer = self._buffer
+        for i in range(self._pos, len(buffer)):
+            ch = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = bool(self._starts)
+            elif ch == '{':
+                self._starts.append(i)
+            elif ch == '}' and self._starts:
+                obj = self._parse(buffer[self._starts.pop():i + 1])
+                if obj is not None:
+                    completed.append(obj)
+        self._pos = len(buffer)
+        self._compact()
+        return completed
+
+    def _parse(self, text: str):
+        try:
+            obj = json.loads(repair_json(text), strict=False)
+        except ValueError:
+            self.malformed += 1
+            return None
+        if isinstance(obj, dict) and isinstance(obj.get(self.required_key), str):
+            return obj
+        return None
+
+    def _compact(self):
+        # Drop text that can no longer be part of an open object
+        cut = self._starts[0] if self._starts else self._pos
+        if cut > 4096:
+            self._buffer = self._buffer[cut:]
+            self._starts = [s - cut for s in self._starts]
+            self._pos -= cut
+
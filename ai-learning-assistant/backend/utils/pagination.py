@@ -0,0 +1,84 @@
+import os
+import base64
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from bson import ObjectId
+
+DEFAULT_PAGE_SIZE = int(os.getenv('DEFAULT_PAGE_SIZE', 20))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 100))
+
+
+def encode_cursor(sort_value: datetime, doc_id: ObjectId) -> str:
+    raw = f"{sort_value.isoformat()}|{doc_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Inverse of encode_cursor; raises ValueError for anything malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        sort_value, doc_id = raw.split('|')
+        return datetime.fromisoformat(sort_value), ObjectId(doc_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def encode_ranked_cursor(rank: float, sort_value: Optional[datetime], doc_id: ObjectId) -> str:
+    """Cursor for orderings with a leading rank (tier or relevance score)"""
+    raw = f"{rank!r}|{sort_value.isoformat() if sort_value else ''}|{doc_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_ranked_cursor(cursor: str) -> Tuple[float, Optional[datetime], ObjectId]:
+    """Inverse of encode_ranked_cursor; raises ValueError for anything malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        rank, sort_value, doc_id = raw.split('|')
+        return float(rank), datetime.fromisoformat(sort_value) if sort_value else None, ObjectId(doc_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def page_size(args) -> int:
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def selected_fields(args, allowed: Iterable[str]) -> List[str]:
+    """Fields requested with ?fields=a,b (all allowed fields when absent)"""
+    allowed = list(allowed)
+    requested = args.get('fields')
+    if not requested:
+        return allowed
+    fields = [f.strip() for f in requested.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def paginate(collection, query: Dict, sort_field: str, args, projection: Optional[Dict] = None) -> Tuple[List[Dict], Optional[str]]:
+    """One page of documents, newest first, using a (sort_field, _id) keyset cursor.
+
+    Reads ?limit and ?cursor from args and returns (docs, next_cursor);
+    next_cursor is None on the last page. Each page is a bounded index range
+    scan, so deep pages cost the same as the first."""
+    limit = page_size(args)
+    cursor = args.get('cursor')
+    if cursor:
+        sort_value, doc_id = decode_cursor(cursor)
+        query = {'$and': [query, {'$or': [
+            {sort_field: {'$lt': sort_value}},
+            {sort_field: sort_value, '_id': {'$lt': doc_id}}
+        ]}]}
+    if projection is not None:
+        projection = dict(projection, **{sort_field: 1})
+    docs = list(collection.find(query, projection).sort([(sort_field, -1), ('_id', -1)]).limit(limit + 1))
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1][sort_field], docs[-1]['_id'])
+    return docs, next_cursor
@@ -0,0 +1,59 @@
+import os
+import threading
+from typing import Optional
+from flask import Response, current_app, stream_with_context
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+# Server-sent event streams one process keeps open at once (0 = no limit). Each
+# open stream holds a gunicorn thread, so keep the budgets together below
+# --threads to leave room for ordinary requests.
+STREAM_MAX_PER_PROCESS = int(os.getenv('STREAM_MAX_PER_PROCESS', 4))
+# Group chat streams sit idle between keepalives for minutes at a time, so
+# they get their own, larger budget instead of crowding out job and tutor streams
+CHAT_STREAM_MAX_PER_PROCESS = int(os.getenv('CHAT_STREAM_MAX_PER_PROCESS', 48))
+# Lifetime of the tokens that let EventSource (which cannot send headers) open a stream
+STREAM_TOKEN_SECONDS = int(os.getenv('STREAM_TOKEN_SECONDS', 60))
+
+
+def _slots(limit: int) -> Optional[threading.BoundedSemaphore]:
+    return threading.BoundedSemaphore(limit) if limit > 0 else None
+
+
+_budgets = {
+    'default': _slots(STREAM_MAX_PER_PROCESS),
+    'chat': _slots(CHAT_STREAM_MAX_PER_PROCESS)
+}
+
+
+def event_stream_response(events, budget: str = 'default'):
+    """text/event-stream Response that holds a slot of the budget until it is closed; None when all slots are taken"""
+    slots = _budgets[budget]
+    if slots is not None and not slots.acquire(blocking=False):
+        return None
+    response = Response(stream_with_context(events), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    if slots is not None:
+        # Runs when the server closes the response, whether or not the generator ever started
+        response.call_on_close(slots.release)
+    return response
+
+
+def _serializer(scope: str) -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(current_app.config['JWT_SECRET_KEY'], salt=f'stream:{scope}')
+
+
+def create_stream_token(user_id: str, scope: str) -> str:
+    """Short-lived token for one stream, safe to put in a URL: it is not a session JWT and opens nothing else"""
+    return _serializer(scope).dumps(user_id)
+
+
+def read_stream_token(token: Optional[str], scope: str) -> Optional[str]:
+    """The user id of a valid, unexpired token for this scope, else None"""
+    if not token:
+        return None
+    try:
+        return _serializer(scope).loads(token, max_age=STREAM_TOKEN_SECONDS)
+    except BadSignature:
+        return None
@@ -3,8 +3,12 @@ class StudyGroups {
     constructor() {
         this.currentGroup = null;
         this.groups = [];
+        this.nextGroupsCursor = null;
         this.messages = [];
         this.resources = [];
+        this.messageStream = null;
+        this.messageRetryTimer = null;
+        this.messageRetryDelay = 1000;
         this.init();
     }
 
@@ -35,6 +39,10 @@ class StudyGroups {
                 this.leaveGroup(groupId);
             }
             
+            if (e.target.classList.contains('load-more-groups-btn')) {
+                this.loadGroups(this.nextGroupsCursor);
+            }
+            
             if (e.target.classList.contains('view-group-btn')) {
                 const groupId = e.target.dataset.groupId;
                 this.viewGroup(groupId);
@@ -60,7 +68,7 @@ class StudyGroups {
         }
     }
 
-    async loadGroups() {
+    async loadGroups(cursor = null) {
         try {
             const token = localStorage.getItem('token');
             if (!token) {
@@ -68,7 +76,8 @@ class StudyGroups {
                 return;
             }
 
-            const response = await fetch('http://127.0.0.1:5000/api/groups', {
+            const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+            const response = await fetch(`http://127.0.0.1:5000/api/groups${query}`, {
                 method: 'GET',
                 headers: {
                     'Authorization': `Bearer ${token}`,
@@ -78,7 +87,8 @@ class StudyGroups {
 
             if (response.ok) {
                 const data = await response.json();
-                this.groups = data.groups;
+                this.groups = cursor ? this.groups.concat(data.groups) : data.groups;
+                this.nextGroupsCursor = data.next_cursor;
                 this.displayGroups();
             } else {
                 console.error('Failed to load groups');
@@ -125,7 +135,9 @@ class StudyGroups {
             </div>
         `).join('');
 
-        groupsContainer.innerHTML = groupsHTML;
+        const loadMoreHTML = this.nextGroupsCursor ?
+            '<button class="btn btn-secondary load-more-groups-btn">Load more groups</button>' : '';
+        groupsContainer.innerHTML = groupsHTML + loadMoreHTML;
     }
 
     async createGroup() {
@@ -301,6 +313,9 @@ class StudyGroups {
     }
 
     hideGroupDetails() {
+        this.closeMessageStream();
+        clearTimeout(this.messageRetryTimer);
+        this.messageRetryDelay = 1000;
         document.getElementById('groupDetailsContainer').style.display = 'none';
         document.getElementById('groupsSection').style.display = 'block';
         this.currentGroup = null;
@@ -335,12 +350,102 @@ class StudyGroups {
                 const data = await response.json();
                 this.messages = data.messages;
                 this.displayMessages();
+                this.subscribeToMessages(groupId);
             }
         } catch (error) {
             console.error('Error loading messages:', error);
         }
     }
 
+    async subscribeToMessages(groupId) {
+        // New messages are pushed by the server; EventSource reconnects with Last-Event-ID
+        this.closeMessageStream();
+        const token = localStorage.getItem('token');
+        let streamToken;
+        try {
+            // EventSource cannot send headers, so the stream is opened with a short-lived token
+            // scoped to it rather than the session token, which would end up in access logs
+            const response = await fetch(`http://127.0.0.1:5000/api/groups/${groupId}/messages/stream-token`, {
+                method: 'POST',
+                headers: {
+                    'Authorization': `Bearer ${token}`,
+                    'Content-Type': 'application/json'
+                }
+            });
+            if (!response.ok) throw new Error(`stream token request failed: ${response.status}`);
+            streamToken = (await response.json()).token;
+        } catch (error) {
+            console.error('Error opening message stream:', error);
+            this.scheduleMessageRetry(groupId);
+            return;
+        }
+        if (!this.currentGroup || this.currentGroup._id !== groupId) return;
+
+        const lastMessage = this.messages[this.messages.length - 1];
+        const since = lastMessage ? `&since=${lastMessage._id}` : '';
+        this.messageStream = new EventSource(`http://127.0.0.1:5000/api/groups/${groupId}/messages/stream?token=${encodeURIComponent(streamToken)}${since}`);
+        this.messageStream.addEventListener('open', () => {
+            this.messageRetryDelay = 1000;
+        });
+        this.messageStream.addEventListener('message', (event) => {
+            this.addMessages([JSON.parse(event.data)]);
+        });
+        this.messageStream.addEventListener('reset', () => {
+            this.subscribeToMessages(groupId);
+        });
+        this.messageStream.onerror = () => {
+            // A refused stream (busy server, expired token) is not retried by EventSource,
+            // so fetch what was missed and reopen the stream with backoff
+            this.closeMessageStream();
+            this.scheduleMessageRetry(groupId);
+        };
+    }
+
+    scheduleMessageRetry(groupId) {
+        clearTimeout(this.messageRetryTimer);
+        this.messageRetryTimer = setTimeout(async () => {
+            if (!this.currentGroup || this.currentGroup._id !== groupId) return;
+            await this.fetchNewMessages(groupId);
+            this.subscribeToMessages(groupId);
+        }, this.messageRetryDelay);
+        this.messageRetryDelay = Math.min(this.messageRetryDelay * 2, 30000);
+    }
+
+    async fetchNewMessages(groupId) {
+        try {
+            const token = localStorage.getItem('token');
+            const lastMessage = this.messages[this.messages.length - 1];
+            const since = lastMessage ? `?since=${lastMessage._id}` : '';
+            const response = await fetch(`http://127.0.0.1:5000/api/groups/${groupId}/messages${since}`, {
+                method: 'GET',
+                headers: {
+                    'Authorization': `Bearer ${token}`,
+                    'Content-Type': 'application/json'
+                }
+            });
+            if (response.ok) {
+                const data = await response.json();
+                this.addMessages(data.messages);
+            }
+        } catch (error) {
+            console.error('Error loading messages:', error);
+        }
+    }
+
+    addMessages(messages) {
+        const fresh = messages.filter(message => !this.messages.some(m => m._id === message._id));
+        if (!fresh.length) return;
+        this.messages.push(...fresh);
+        this.displayMessages();
+    }
+
+    closeMessageStream() {
+        if (this.messageStream) {
+            this.messageStream.close();
+            this.messageStream = null;
+        }
+    }
+
     displayMessages() {
         const messagesList = document.getElementById('messagesList');
         if (!messagesList) return;
@@ -376,7 +481,9 @@ class StudyGroups {
 
             if (response.ok) {
                 document.getElementById('messageContent').value = '';
-                this.loadGroupMessages(this.currentGroup._id);
+                if (!this.messageStream) {
+                    this.loadGroupMessages(this.currentGroup._id);
+                }
             } else {
                 const error = await response.json();
                 alert(`Error sending message: ${error.error}`);